@@ -0,0 +1,100 @@
+import io
+import pathlib
+import random
+from dataclasses import dataclass
+from typing import Dict
+
+import fitz
+from PIL import Image
+
+_SUBJECTS = ["Storage Controller", "Backup Cluster", "Hypervisor Host", "Database Node", "Replication Network",
+             "Monitoring Hub", "Memory Pool", "Scheduler Service", "Network Switch", "Cache Tier"]
+_VERBS = ["replicates data to", "depends on", "is monitored by", "allocates memory from", "runs on",
+          "is backed up by", "sends metrics to", "is connected to"]
+
+
+@dataclass
+class CorpusSpec:
+    pdfs: int = 4
+    pages: int = 10
+    paragraphs_per_page: int = 6
+    images_per_page: int = 1
+    links_per_page: int = 2
+    duplicate_image_share: float = 0.3  # part of the images that repeat one already used (dedup paths)
+    broken_link_share: float = 0.2  # part of the links that 404
+    running_headers: bool = True  # header and page-number footer on every page (boilerplate stripping)
+    seed: int = 0
+
+
+def _paragraph(rng: random.Random) -> str:
+    sentences = []
+    for _ in range(rng.randint(3, 6)):
+        a, b = rng.sample(_SUBJECTS, 2)
+        sentences.append(f"{a} {rng.randint(1, 40)} {rng.choice(_VERBS)} {b} {rng.randint(1, 40)}.")
+    return " ".join(sentences)
+
+
+def _image(rng: random.Random, width: int = 320, height: int = 200) -> bytes:
+    """Noisy gradient with a few boxes: enough entropy to pass the decorative-image filter."""
+    img = Image.new("RGB", (width, height))
+    base = rng.randint(0, 255)
+    img.putdata([
+        ((x + base) % 256, (y * 2 + base) % 256, rng.randint(0, 255))
+        for y in range(height) for x in range(width)
+    ])
+    for _ in range(4):
+        x, y = rng.randint(0, width - 60), rng.randint(0, height - 40)
+        img.paste((rng.randint(0, 255),) * 3, (x, y, x + 60, y + 40))
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+
+# 1. Synthetic PDFs: text pages with images and outbound links
+def make_corpus(out_dir: pathlib.Path, spec: CorpusSpec, doc_base_url: str) -> Dict[str, int]:
+    """
+    Writes spec.pdfs PDFs into out_dir. Links point at doc_base_url/docs/<n>.html
+    (served by LinkedDocHandler) or, for broken_link_share of them, at a missing path.
+    Returns counts of what was generated.
+    """
+    rng = random.Random(spec.seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    counts = {"pdfs": 0, "pages": 0, "images": 0, "links": 0}
+    images = []
+    link_id = 0
+
+    for n in range(spec.pdfs):
+        doc = fitz.open()
+        for p in range(spec.pages):
+            page = doc.new_page()
+            if spec.running_headers:
+                page.insert_text((50, 30), f"Synthetic Infrastructure Report {n} - Confidential", fontsize=8)
+                page.insert_text((280, 825), f"Page {p + 1} of {spec.pages}", fontsize=8)
+            text = "\n\n".join(_paragraph(rng) for _ in range(spec.paragraphs_per_page))
+            page.insert_textbox(fitz.Rect(50, 50, 545, 560), text, fontsize=9)
+
+            for i in range(spec.images_per_page):
+                if images and rng.random() < spec.duplicate_image_share:
+                    data = rng.choice(images)
+                else:
+                    data = _image(rng)
+                    images.append(data)
+                page.insert_image(fitz.Rect(50 + i * 170, 580, 210 + i * 170, 680), stream=data)
+                counts["images"] += 1
+
+            for i in range(spec.links_per_page):
+                if rng.random() < spec.broken_link_share:
+                    url = f"{doc_base_url}/missing/{link_id}"
+                else:
+                    url = f"{doc_base_url}/docs/{link_id}.html"
+                link_id += 1
+                rect = fitz.Rect(50, 700 + i * 14, 400, 712 + i * 14)
+                page.insert_text(rect.bl + (0, -2), url, fontsize=8)
+                page.insert_link({"kind": fitz.LINK_URI, "from": rect, "uri": url})
+                counts["links"] += 1
+            counts["pages"] += 1
+
+        doc.save(str(out_dir / f"synthetic-{n:03d}.pdf"))
+        doc.close()
+        counts["pdfs"] += 1
+    return counts
@@ -0,0 +1,395 @@
+# benchmarks/run_benchmarks.py
+# End-to-end throughput benchmark of the ingestion and query pipeline, fully offline:
+# a synthetic PDF corpus, a fake Ollama API with configurable latency, a local server for
+# the linked docs and the embedded graph backend. Every stage of main.py is timed and the
+# results are written as JSON; --compare reports the change against an earlier run.
+# --streaming runs parse/caption/extract/write as one pipelined stage, as main.py does.
+#
+#   python -m benchmarks.run_benchmarks --pdfs 8 --pages 20 --llm-latency 0.2
+#   python -m benchmarks.run_benchmarks --streaming --pdfs 8 --pages 20
+#   python -m benchmarks.run_benchmarks --compare benchmarks/results/baseline.json --max-regression 0.2
+
+# 1. Lightweight imports only; config and the helpers are imported once the environment points at the fakes
+import argparse
+import io
+import json
+import logging
+import os
+import pathlib
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from benchmarks.corpus import CorpusSpec, make_corpus
+from benchmarks.servers import Latency, make_doc_server, make_fake_ollama, start_server
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+REPO_DIR = pathlib.Path(__file__).resolve().parent.parent
+
+
+# 2. Stage timing
+class StageTimer:
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Yields a dict for counters; `items` gives items_per_second. A failing stage is recorded, not raised."""
+        record: Dict[str, Any] = {"items": 0}
+        print(f"[{name}] ...", flush=True)
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            logger.exception(f"Stage {name} failed")
+            record["error"] = f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        record["seconds"] = round(seconds, 4)
+        if record["items"]:
+            record["items_per_second"] = round(record["items"] / max(seconds, 1e-9), 3)
+        self.stages[name] = record
+        print(f"[{name}] {seconds:.2f}s, {record['items']} items{' (FAILED)' if 'error' in record else ''}")
+
+
+def _percentile(values: List[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+# 3. The pipeline, stage by stage (without a prior manifest: every run is a cold run)
+def run_pipeline(timer: StageTimer, questions: int, streaming: bool = False) -> Dict[str, Any]:
+    from llama_index.core import Document, Settings, StorageContext
+
+    from config import config
+    from helper.util_cache_helper import open_cache
+    from helper.util_canonical_helper import build_canonicalizer, dedupe_triplets
+    from helper.util_doc_helper import parse_pdfs_parallel
+    from helper.util_embedding_helper import build_embed_model
+    from helper.util_manifest_helper import IngestionManifest, sha256_file
+    from helper.util_pipeline_helper import IngestSource, StreamingIngestion
+    from helper.util_image_helper import describe_images_with_llava, group_near_duplicates
+    from helper.util_link_helper import (
+        add_main_pdfs_to_neo4j,
+        extract_links_from_directory,
+        fetch_public_docs,
+        preprocess_downloaded_docs,
+        push_links_to_graph,
+        update_link_status,
+    )
+    from helper.util_query_engine_helper import (
+        build_graph_store,
+        build_llm,
+        build_query_engine,
+        cache_graph_store,
+        open_graph_writer,
+    )
+    from helper.util_retrieval_helper import load_vector_index, upsert_vector_document
+    from helper.util_stream_helper import TokenClock, render_response
+    from helper.util_triplet_helper import TripletExtractor
+
+    details: Dict[str, Any] = {}
+    llm = build_llm()
+    Settings.llm = llm
+    embed_model = build_embed_model(
+        model_name=config.OLLAMA_EMBED_MODEL,
+        base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}",
+        cache_dir=config.EMBED_CACHE_DIR,
+        embed_batch_size=config.EMBED_BATCH_SIZE,
+    )
+    Settings.embed_model = embed_model
+    pdf_paths = sorted(pathlib.Path(config.DOC_DIR).glob("*.pdf"))
+    docs: List[Document] = []
+    layout_options = dict(chunk_tokens=config.CHUNK_MAX_TOKENS, detect_tables=config.PARSE_DETECT_TABLES,
+                          margin=config.CHUNK_BOILERPLATE_MARGIN, repeat_share=config.CHUNK_BOILERPLATE_SHARE)
+
+    # 3.1 Parse pages and extract images in one pass (the streaming stage parses as it goes)
+    image_stats = Counter()
+    parsed_pdfs = {}
+    if not streaming:
+        with timer.stage("parse") as record:
+            parsed_pdfs = parse_pdfs_parallel(pdf_paths, extract_images=True, workers=config.PARSE_WORKERS,
+                                              pages_per_task=config.PARSE_PAGES_PER_TASK, stats=image_stats,
+                                              **layout_options)
+            for pages, _ in parsed_pdfs.values():
+                docs.extend(pages)
+            record["items"] = len(docs)
+            record["images"] = sum(len(images) for _, images in parsed_pdfs.values())
+            record["boilerplate_blocks"] = image_stats["boilerplate_blocks"]
+
+    # 3.2 Links: extraction, then accessibility checks against the local doc server
+    link_map = {}
+    with timer.stage("link_extraction") as record:
+        link_map = extract_links_from_directory(config.DOC_DIR)
+        record["items"] = sum(len(links) for links in link_map.values())
+
+    graph_writer = open_graph_writer()
+    graph_writer.ensure_schema()
+    with timer.stage("link_classification") as record:
+        add_main_pdfs_to_neo4j(graph_writer, docs_dir=config.DOC_DIR)
+        push_links_to_graph(graph_writer, link_map=link_map)
+        record["items"] = len(graph_writer.unchecked_links())
+        update_link_status(
+            graph_writer,
+            timeout=config.LINK_CHECK_TIMEOUT,
+            concurrency=config.LINK_CHECK_CONCURRENCY,
+            per_domain=config.LINK_CHECK_PER_DOMAIN,
+            max_domain_errors=config.LINK_CHECK_MAX_DOMAIN_ERRORS,
+        )
+
+    # 3.3 Download and clean the accessible linked docs
+    raw_dir = pathlib.Path(config.DOWNLOAD_DOC_DIR) / "linked_raw"
+    clean_dir = pathlib.Path(config.DOWNLOAD_DOC_DIR) / "linked_clean"
+    with timer.stage("download") as record:
+        record["items"] = len(graph_writer.links_to_fetch())
+        fetch_public_docs(graph_writer, raw_dir=raw_dir, concurrency=config.DOWNLOAD_CONCURRENCY,
+                          timeout=config.DOWNLOAD_TIMEOUT, max_bytes=config.DOWNLOAD_MAX_BYTES)
+        preprocess_downloaded_docs(raw_dir, clean_dir, workers=config.PARSE_WORKERS)
+    vector_index = load_vector_index(pathlib.Path(config.VECTOR_INDEX_DIR), embed_model)
+    if streaming:
+        # 3.4 Streaming: parse, caption, extract and write as one pipelined stage, as main.py runs it
+        stats = Counter()
+        with timer.stage("streaming_ingest") as record:
+            sources = [IngestSource(f"pdf/{p.name}", p, sha256_file(p), extract_images=True) for p in pdf_paths]
+            if clean_dir.exists():
+                sources += [IngestSource(f"linked/{f.name}", f, sha256_file(f)) for f in sorted(clean_dir.glob("*.txt"))]
+            extractor = TripletExtractor(
+                llm=llm,
+                max_triplets_per_chunk=config.KG_MAX_TRIPLETS_PER_CHUNK,
+                concurrency=config.KG_EXTRACT_CONCURRENCY,
+                cache=open_cache(config.TRIPLET_CACHE_PATH, table="triplets"),
+            )
+            ingestion = StreamingIngestion(
+                IngestionManifest(pathlib.Path(config.INGEST_MANIFEST_PATH)), graph_writer, vector_index,
+                extractor, persist_dir=config.VECTOR_INDEX_DIR, layout_options=layout_options,
+                caption_cache=open_cache(config.CAPTION_CACHE_PATH),
+                phash_max_distance=config.IMAGE_PHASH_MAX_DISTANCE, workers=config.PARSE_WORKERS,
+                pages_per_task=config.PARSE_PAGES_PER_TASK, parse_ahead=config.INGEST_PARSE_AHEAD,
+                queue_size=config.INGEST_QUEUE_SIZE, commit_every=config.INGEST_COMMIT_EVERY,
+                canonicalizer=build_canonicalizer(embed_model),
+                persist_interval=config.INGEST_PERSIST_INTERVAL,
+            )
+            stats.update(ingestion.run(sources))
+            record["items"] = extractor.stats["chunks"]
+            record["units"] = stats["units"]
+            record["captioned"] = stats["captioned"]
+            record["llm_tokens"] = extractor.stats["tokens"]
+            record["boilerplate_blocks"] = stats["boilerplate_blocks"]
+            record["triplets"] = stats["triplets"]
+            record["duplicate_triplets"] = stats["duplicate_triplets"]
+        details["documents"] = stats["units"]
+    else:
+        if clean_dir.exists():
+            for file in sorted(clean_dir.glob("*.txt")):
+                docs.append(Document(text=file.read_text(encoding="utf-8"),
+                                     metadata={"source": "linked_doc", "filename": file.name, "type": "text"}))
+
+        # 3.4 Caption the images that survive the prefilter and near-duplicate grouping
+        with timer.stage("captioning") as record:
+            images = [image for _, pdf_images in parsed_pdfs.values() for image in pdf_images]
+            groups = group_near_duplicates([image.phash for image in images], config.IMAGE_PHASH_MAX_DISTANCE)
+            representatives = sorted(set(groups))
+            captions = dict(zip(representatives, describe_images_with_llava(
+                [images[i] for i in representatives], cache=open_cache(config.CAPTION_CACHE_PATH)
+            )))
+            for image, group in zip(images, groups):
+                if captions[group] is not None:
+                    docs.append(Document(text=captions[group], metadata={"source": "image", "filename": image.name}))
+            record["items"] = len(representatives)
+            record["near_duplicates"] = len(groups) - len(representatives)
+            record["prefiltered"] = dict(image_stats)
+
+        # 3.5 Triplet extraction into the graph
+        extractor = TripletExtractor(
+            llm=llm,
+            max_triplets_per_chunk=config.KG_MAX_TRIPLETS_PER_CHUNK,
+            concurrency=config.KG_EXTRACT_CONCURRENCY,
+            cache=open_cache(config.TRIPLET_CACHE_PATH, table="triplets"),
+        )
+        with timer.stage("triplet_extraction") as record:
+            # Edge weight = number of documents stating the triplet, as the manifest counts it in main.py
+            canonicalizer = build_canonicalizer(embed_model)
+            weights = Counter()
+            units = ((f"doc-{i}", doc) for i, doc in enumerate(docs))
+            for _, triplets in extractor.extract_units(units):
+                if triplets is None:
+                    continue
+                unique = canonicalizer.canonicalize(triplets) if canonicalizer else dedupe_triplets(triplets)
+                weights.update(unique)
+                record["duplicate_triplets"] = record.get("duplicate_triplets", 0) + len(triplets) - len(unique)
+            for (subj, rel, obj), weight in weights.items():
+                graph_writer.add_triplet(subj, rel, obj, weight=weight)
+            record["triplets"] = len(weights)
+            graph_writer.flush()
+            graph_writer.bump_graph_version()
+            record["items"] = extractor.stats["chunks"]
+            record["llm_tokens"] = extractor.stats["tokens"]
+
+        # 3.6 Chunk embeddings for vector retrieval
+        with timer.stage("embedding") as record:
+            for i, doc in enumerate(docs):
+                doc.id_ = f"doc-{i}"
+                upsert_vector_document(vector_index, doc)
+            record["items"] = len(docs)
+
+        details["documents"] = len(docs)
+
+    # 3.7 Questions through the configured retriever, streamed like the CLI loop
+    with timer.stage("query") as record:
+        storage_context = StorageContext.from_defaults(
+            graph_store=cache_graph_store(build_graph_store(), graph_writer.graph_version)
+        )
+        query_engine = build_query_engine(storage_context, vector_index, embed_model, llm=llm,
+                                          streaming=config.QUERY_STREAMING)
+        latencies, first_tokens = [], []
+        for i in range(questions):
+            clock = TokenClock(stream=io.StringIO())
+            render_response(query_engine.query(
+                f"How does the Storage Controller {i + 1} relate to the Backup Cluster {i + 2}?"
+            ), write=clock)
+            latencies.append(clock.elapsed)
+            if clock.first_token is not None:
+                first_tokens.append(clock.first_token)
+            record["items"] += 1
+        record["latency_p50"] = round(_percentile(latencies, 50), 4)
+        record["latency_p95"] = round(_percentile(latencies, 95), 4)
+        record["first_token_p50"] = round(_percentile(first_tokens, 50), 4)
+
+    # Peak resident memory of the whole run (KiB on Linux)
+    details["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return details
+
+
+# 4. Comparison against an earlier result file
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> bool:
+    """Prints a per-stage table; returns False when a stage slowed down by more than max_regression."""
+    ok = True
+    print(f"\n{'stage':<22}{'baseline s':>12}{'current s':>12}{'change':>10}")
+    for name, stage in current["stages"].items():
+        before = baseline.get("stages", {}).get(name, {}).get("seconds")
+        if not before or "error" in stage:
+            print(f"{name:<22}{'-':>12}{stage['seconds']:>12.3f}{'-':>10}")
+            continue
+        change = stage["seconds"] / before - 1.0
+        flag = ""
+        if max_regression and change > max_regression:
+            flag, ok = "  REGRESSION", False
+        print(f"{name:<22}{before:>12.3f}{stage['seconds']:>12.3f}{change:>+10.1%}{flag}")
+    return ok
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# 5. Entry point
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the RAG pipeline")
+    parser.add_argument("--pdfs", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=10, help="pages per PDF")
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--links-per-page", type=int, default=2)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds before each LLM/VLM response")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="seconds per generated token")
+    parser.add_argument("--embed-latency", type=float, default=0.002, help="seconds per embedded text")
+    parser.add_argument("--doc-latency", type=float, default=0.01, help="seconds per linked-doc response")
+    parser.add_argument("--swap-latency", type=float, default=0.0,
+                        help="seconds the fake Ollama needs to switch to another model")
+    parser.add_argument("--graph-backend", default="local", choices=("local", "neo4j"))
+    parser.add_argument("--streaming", action="store_true",
+                        help="ingest through the pipelined parse/caption/extract/write stage of main.py")
+    parser.add_argument("--workdir", help="where corpus, caches and indexes go (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the work dir")
+    parser.add_argument("--output", help="result JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.0,
+                        help="with --compare, exit 1 if a stage is slower by more than this fraction")
+    args = parser.parse_args()
+
+    latency = Latency(request=args.llm_latency, token=args.token_latency, embed=args.embed_latency,
+                      doc=args.doc_latency, model_swap=args.swap_latency)
+    spec = CorpusSpec(pdfs=args.pdfs, pages=args.pages, images_per_page=args.images_per_page,
+                      links_per_page=args.links_per_page, seed=args.seed)
+    workdir = pathlib.Path(args.workdir or tempfile.mkdtemp(prefix="rag-bench-")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    started_at = datetime.now(timezone.utc)
+    output = pathlib.Path(args.output) if args.output else \
+        REPO_DIR / "benchmarks" / "results" / f"{started_at:%Y%m%dT%H%M%SZ}.json"
+    output = output.resolve()
+    baseline = pathlib.Path(args.compare).resolve() if args.compare else None
+
+    # 5.1 Fakes up, then point config at them before it is first imported
+    ollama_cls, doc_cls = make_fake_ollama(latency), make_doc_server(latency)
+    ollama_server, ollama_url = start_server(ollama_cls)
+    doc_server, doc_url = start_server(doc_cls)
+    os.environ.update({
+        "OLLAMA_HOST": "127.0.0.1",
+        "OLLAMA_PORT": ollama_url.rsplit(":", 1)[1],
+        "GRAPH_BACKEND": args.graph_backend,
+        "QUERY_CACHE_BACKEND": "off",
+        "DOC_DIR": "input-dir",
+        "DOWNLOAD_DOC_DIR": "download-dir",
+        "NO_PROXY": ",".join(filter(None, [os.environ.get("NO_PROXY"), "127.0.0.1", "localhost"])),
+    })
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_DIR))
+
+    timer = StageTimer()
+    counts, details = {}, {}
+    try:
+        with timer.stage("corpus") as record:
+            counts = make_corpus(workdir / "input-dir", spec, doc_url)
+            record["items"] = counts["pages"]
+        details = run_pipeline(timer, args.questions, streaming=args.streaming)
+    finally:
+        ollama_server.shutdown()
+        doc_server.shutdown()
+        if not args.keep:
+            os.chdir(REPO_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # 5.2 Results; "metrics" holds the per-call spans and counters recorded by util_metrics_helper
+    from helper.util_metrics_helper import METRICS
+
+    result = {
+        "started_at": started_at.isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {**vars(args), "corpus": counts, **details},
+        "fake_ollama_calls": dict(ollama_cls.calls),
+        "linked_doc_calls": dict(doc_cls.calls),
+        "stages": timer.stages,
+        "metrics": METRICS.snapshot(),
+        "total_seconds": round(sum(s["seconds"] for n, s in timer.stages.items() if n != "corpus"), 4),
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"\nWrote {output} (pipeline total {result['total_seconds']:.2f}s)")
+
+    ok = not any("error" in s for s in timer.stages.values())
+    if baseline is not None:
+        ok = compare(result, json.loads(baseline.read_text(encoding="utf-8")), args.max_regression) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
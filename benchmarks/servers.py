@@ -0,0 +1,221 @@
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9-]+")
+_ENTITY_RE = re.compile(r"\b[A-Z][a-z0-9]+(?: (?:[A-Z][a-z0-9]+|\d+))*\b")
+
+
+# 1. Latency model shared by the fake services
+@dataclass
+class Latency:
+    request: float = 0.05  # seconds before the first byte of every LLM / VLM response
+    token: float = 0.002  # seconds per generated token (streamed or not)
+    embed: float = 0.002  # seconds per embedded text
+    doc: float = 0.01  # seconds per linked-doc response
+    model_swap: float = 0.0  # seconds to load a model other than the one served last (one model fits at a time)
+
+
+def start_server(handler_cls, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve on a background thread; port 0 picks a free one. Returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), handler_cls)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=handler_cls.__name__, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", head: bool = False) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# 2. Stand-in for the Ollama HTTP API (chat, generate, embed, show)
+def _embedding(text: str, dim: int) -> List[float]:
+    """Deterministic bag-of-words vector, so similar texts land close together."""
+    vec = [0.0] * dim
+    for word in _WORD_RE.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _reply(prompt: str, has_images: bool) -> str:
+    """A plausible answer for each prompt the pipeline sends, recognized by its wording."""
+    if has_images:
+        return "Architecture diagram: the Storage Controller replicates volumes to the Backup Cluster over the Replication Network."
+    if "knowledge triplets" in prompt:
+        text = prompt.rsplit("Text:", 1)[-1]
+        entities = list(dict.fromkeys(_ENTITY_RE.findall(text)))
+        limit = re.search(r"up to (\d+) knowledge triplets", prompt)
+        pairs = list(zip(entities, entities[1:]))[:int(limit.group(1)) if limit else None]
+        return "\n".join(f"({a}, relates to, {b})" for a, b in pairs)
+    if "KEYWORDS:" in prompt and "SYNONYMS" not in prompt:
+        question = prompt.split("---------------------")[1] if prompt.count("---------------------") >= 2 else prompt
+        return "KEYWORDS: " + ", ".join(list(dict.fromkeys(_ENTITY_RE.findall(question)))[:5])
+    if "SYNONYMS" in prompt:
+        keywords = prompt.rsplit("KEYWORDS:", 1)[-1].split("----")[0]
+        return "SYNONYMS: " + ", ".join(k.strip().lower() for k in keywords.split(",") if k.strip())
+    if "SCRATCHPAD" in prompt:
+        facts = " ".join(prompt.split()[-60:])
+        return (
+            "### SCRATCHPAD (private reasoning — think step-by-step)\n"
+            "The context lists several components; the question asks how they relate.\n\n"
+            "### ANSWER (visible to user)\n"
+            f"Based on the documents, the components are connected as described: {facts}"
+        )
+    return "OK"
+
+
+class FakeOllamaHandler(_JSONHandler):
+    """
+    Subclass with `latency`, `embed_dim` and `calls` set (see make_fake_ollama). Responses
+    are deterministic; streamed responses are NDJSON, one word per chunk, like Ollama.
+    Like a single GPU, only one model is loaded: a request for another model first
+    waits `latency.model_swap` while the server serves nothing else.
+    """
+
+    latency: Latency = Latency()
+    embed_dim: int = 64
+    calls: Counter = Counter()
+    swap_lock = threading.Lock()
+    loaded: List[str] = [""]
+
+    def _load(self, model: str) -> None:
+        with self.swap_lock:
+            if self.loaded[0] != model:
+                if self.loaded[0]:
+                    self.calls["model_swaps"] += 1
+                    time.sleep(self.latency.model_swap)
+                self.loaded[0] = model
+
+    def _chunk(self, model: str, done: bool, chat: bool, text: str = "", **extra: Any) -> Dict[str, Any]:
+        chunk = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": done, **extra}
+        if chat:
+            chunk["message"] = {"role": "assistant", "content": text}
+        else:
+            chunk["response"] = text
+        return chunk
+
+    def _complete(self, body: Dict[str, Any], chat: bool) -> None:
+        if chat:
+            messages = body.get("messages") or []
+            prompt = "\n".join(str(m.get("content", "")) for m in messages)
+            has_images = any(m.get("images") for m in messages)
+        else:
+            prompt, has_images = str(body.get("prompt", "")), bool(body.get("images"))
+        model = body.get("model", "")
+        self._load(model)
+        text = _reply(prompt, has_images) if prompt else ""
+        words = re.findall(r"\S+\s*", text)
+        counts = {"prompt_eval_count": len(prompt.split()), "eval_count": len(words)}
+        time.sleep(self.latency.request)
+
+        if body.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write(obj):
+                data = (json.dumps(obj) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            for word in words:
+                time.sleep(self.latency.token)
+                write(self._chunk(model, False, chat, word))
+            write(self._chunk(model, True, chat, done_reason="stop", **counts))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        time.sleep(self.latency.token * len(words))
+        self._send(200, json.dumps(self._chunk(model, True, chat, text, done_reason="stop", **counts)).encode())
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.calls[self.path] += 1
+        if self.path in ("/api/chat", "/api/generate"):
+            return self._complete(body, chat=self.path == "/api/chat")
+        if self.path in ("/api/embed", "/api/embeddings"):
+            texts = body.get("input", body.get("prompt", ""))
+            texts = [texts] if isinstance(texts, str) else list(texts)
+            self.calls["embedded_texts"] += len(texts)
+            self._load(body.get("model", ""))
+            time.sleep(self.latency.embed * len(texts))
+            vectors = [_embedding(t, self.embed_dim) for t in texts]
+            payload = {"model": body.get("model", ""), "embeddings": vectors}
+            if self.path == "/api/embeddings":
+                payload = {"embedding": vectors[0]}
+            return self._send(200, json.dumps(payload).encode())
+        if self.path == "/api/show":
+            return self._send(200, json.dumps({
+                "modelfile": "", "parameters": "", "template": "",
+                "details": {"family": "llama", "format": "gguf"},
+                "model_info": {"general.architecture": "llama", "llama.context_length": 8192},
+            }).encode())
+        self._send(404, b'{"error": "not found"}')
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            return self._send(200, b'{"models": []}')
+        self._send(200, b"Ollama is running", content_type="text/plain")
+
+
+def make_fake_ollama(latency: Latency, embed_dim: int = 64):
+    """A FakeOllamaHandler class with its own latency, call counter and loaded model."""
+    return type("FakeOllama", (FakeOllamaHandler,), {
+        "latency": latency, "embed_dim": embed_dim, "calls": Counter(),
+        "swap_lock": threading.Lock(), "loaded": [""],
+    })
+
+
+# 3. Linked-document server: /docs/<n>.html exists, everything else is a 404
+class LinkedDocHandler(_JSONHandler):
+    latency: Latency = Latency()
+    calls: Counter = Counter()
+
+    def _serve(self, head: bool) -> None:
+        self.calls[self.command] += 1
+        time.sleep(self.latency.doc)
+        m = re.fullmatch(r"/docs/(\d+)\.html", self.path)
+        if not m:
+            return self._send(404, b"not found", content_type="text/plain", head=head)
+        n = int(m.group(1))
+        paragraphs = [
+            f"Linked Document {n} describes how Service {n} depends on Storage Pool {n % 7} "
+            f"and reports to Monitoring Hub {n % 3}. Section {i} lists Tuning Parameter {i} for Service {n}."
+            for i in range(20)
+        ]
+        body = "<html><head><title>Doc {}</title></head><body>{}</body></html>".format(
+            n, "".join(f"<p>{p}</p>" for p in paragraphs)
+        ).encode("utf-8")
+        self._send(200, body, content_type="text/html; charset=utf-8", head=head)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+
+def make_doc_server(latency: Latency):
+    return type("LinkedDocs", (LinkedDocHandler,), {"latency": latency, "calls": Counter()})
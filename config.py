@@ -1,3 +1,5 @@
+import re
+
 from pydantic import ValidationError, field_validator
 from pydantic_settings import BaseSettings
 
@@ -12,14 +14,80 @@ class Settings(BaseSettings):
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: str = ""
     REDIS_USERNAME: str = ""
+    QUERY_CACHE_BACKEND: str = "redis"  # redis | memory | off
+    QUERY_CACHE_TTL: int = 86400  # seconds
+    QUERY_CACHE_THRESHOLD: float = 0.95  # cosine similarity to reuse a cached answer
+    QUERY_CACHE_CONTEXT_THRESHOLD: float = 0.85  # cosine similarity to reuse cached retrieved context
+    QUERY_STREAMING: bool = True  # stream answers token by token in the CLI query loops
+    QUERY_SERVER_HOST: str = "127.0.0.1"
+    QUERY_SERVER_PORT: int = 8000
+    QUERY_SERVER_CONCURRENCY: int = 8  # questions answered at once; the rest wait
+    QUERY_SERVER_TIMEOUT: float = 600.0
     DOC_DIR: str = "input-dir"
     DOWNLOAD_DOC_DIR: str = "download-dir"
+    LINK_CHECK_TIMEOUT: float = 5.0
+    LINK_CHECK_CONCURRENCY: int = 64  # pooled HTTP connections for link classification
+    LINK_CHECK_PER_DOMAIN: int = 4  # max concurrent requests to one host
+    LINK_CHECK_MAX_DOMAIN_ERRORS: int = 3  # after this many failures a host's remaining links are marked 'error'
+    DOWNLOAD_CONCURRENCY: int = 8
+    DOWNLOAD_TIMEOUT: float = 30.0
+    DOWNLOAD_MAX_BYTES: int = 100 * 1024 * 1024  # 0 = no size cap
+    DOWNLOAD_REFRESH: bool = False  # revalidate already downloaded docs with ETag/Last-Modified
+    INGEST_MANIFEST_PATH: str = "ingest-manifest.json"
+    GRAPH_BACKEND: str = "neo4j"  # neo4j | local (embedded SQLite graph, no server needed)
+    GRAPH_LOCAL_PATH: str = "graph-store/graph.sqlite"
+    RETRIEVAL_MODE: str = "hybrid"  # kg | vector | hybrid
+    VECTOR_INDEX_DIR: str = "vector-index"
+    VECTOR_TOP_K: int = 5
+    RRF_K: int = 60  # reciprocal-rank fusion constant
+    KG_TRAVERSAL_DEPTH: int = 2  # hops expanded from each query entity
+    KG_TRAVERSAL_FANOUT: int = 10  # relationships followed per node and hop
+    KG_FUZZY_ENTITY_MATCHES: int = 2  # fuzzy candidates per keyword when no entity matches exactly; 0 = exact only
+    SUBGRAPH_CACHE_SIZE: int = 1024  # entities whose expanded subgraph is kept in memory; 0 = no cache
+    SUBGRAPH_CACHE_PATH: str = "cache/subgraphs.sqlite"  # empty = memory only
+    CONTEXT_TOKEN_BUDGET: int = 3000  # max context tokens passed to synthesis; 0 = no limit
+    CONTEXT_KG_SHARE: float = 0.5  # part of the budget reserved for graph facts when text chunks are retrieved
+    PARSE_WORKERS: int = 0  # 0 = one worker per CPU
+    PARSE_PAGES_PER_TASK: int = 50
+    PARSE_DETECT_TABLES: bool = True  # keep each table found by PyMuPDF as one block (~40 ms per page)
+    CHUNK_MAX_TOKENS: int = 512  # chunks may cross page breaks; 0 = one document per page
+    CHUNK_BOILERPLATE_MARGIN: float = 0.1  # top/bottom part of a page searched for running headers/footers; 0 = keep them
+    CHUNK_BOILERPLATE_SHARE: float = 0.5  # part of a PDF's pages a header/footer must repeat on to be dropped
+    INGEST_QUEUE_SIZE: int = 64  # items buffered between ingestion stages before the producer waits
+    INGEST_PARSE_AHEAD: int = 2  # PDFs parsed ahead of the captioning/extraction stages
+    INGEST_COMMIT_EVERY: int = 50  # units between graph/manifest commits
+    INGEST_PERSIST_INTERVAL: float = 60.0  # seconds between vector index/manifest saves (work redone after a crash)
+    KG_MAX_TRIPLETS_PER_CHUNK: int = 8
+    KG_EXTRACT_CONCURRENCY: int = 4  # in-flight triplet-extraction requests to Ollama
+    KG_EXTRACT_MAX_RETRIES: int = 3  # a chunk still failing after these is retried on the next run
+    KG_EXTRACT_RETRY_BACKOFF: float = 1.0  # seconds, doubled on every retry
+    TRIPLET_CACHE_PATH: str = "cache/triplets.sqlite"  # empty = no triplet cache
+    ENTITY_CANONICALIZE: bool = True  # merge entity names that normalize or embed alike before graph writes
+    ENTITY_ALIAS_PATH: str = "entity-aliases.sqlite"  # alias table kept alongside the graph and the manifest
+    ENTITY_ALIASES_FILE: str = ""  # JSON {"canonical name": ["alias", ...]} applied on start; empty = none
+    ENTITY_MERGE_THRESHOLD: float = 0.92  # cosine similarity of name embeddings to merge entities; 0 = exact keys only
     OLLAMA_HOST: str = "localhost"
     OLLAMA_PORT: int = 11434
     OLLAMA_LLM_MODEL: str = "deepseek-r1:14b"
     # OLLAMA_LLM_MODEL: str = "llama2"
     OLLAMA_EMBED_MODEL: str = "bge-m3"
+    EMBED_CACHE_DIR: str = "cache/embeddings"  # empty = no embedding cache
+    EMBED_BATCH_SIZE: int = 32  # texts per /api/embed request
     OLLAMA_VLM_MODEL: str = "llava"
+    OLLAMA_SCHEDULER: bool = True  # route every LLM, VLM and embed request through the per-model scheduler
+    OLLAMA_KEEP_ALIVE: str = "30m"  # how long Ollama keeps a model loaded after its last request; "-1" = forever
+    OLLAMA_MAX_LOADED_MODELS: int = 1  # models served at the same time; 1 groups requests by model on one GPU
+    OLLAMA_MAX_INFLIGHT_PER_MODEL: int = 4  # concurrent requests per model (the VLM also obeys OLLAMA_VLM_CONCURRENCY)
+    OLLAMA_MODEL_MAX_HOLD: float = 10.0  # seconds a model keeps admitting requests while another model waits
+    OLLAMA_VLM_CONCURRENCY: int = 2
+    OLLAMA_VLM_MAX_RETRIES: int = 3
+    OLLAMA_VLM_RETRY_BACKOFF: float = 1.0  # seconds, doubled on every retry
+    CAPTION_CACHE_PATH: str = "cache/captions.sqlite"  # empty = no caption cache
+    SAVE_EXTRACTED_IMAGES: bool = False  # also write extracted images to output-images/
+    IMAGE_MIN_ENTROPY: float = 1.0  # grey-level entropy (bits) below which an image is treated as decorative
+    IMAGE_PHASH_MAX_DISTANCE: int = 4  # images whose 64-bit dHash differ in at most this many bits share a caption
+    METRICS_PATH: str = ""  # spans and counters written here on exit; *.prom = Prometheus text, else JSON; empty = off
+    PROFILE_PATH: str = ""  # cProfile stats of the main thread written here on exit; empty = off
 
     @field_validator('NEO4J_USERNAME', 'NEO4J_PASSWORD', 'AURA_INSTANCEID', 'AURA_INSTANCENAME',
         'REDIS_USERNAME', 'REDIS_PASSWORD', 'OLLAMA_LLM_MODEL', 'OLLAMA_EMBED_MODEL')
@@ -42,6 +110,74 @@ class Settings(BaseSettings):
             raise ValueError('REDIS_PORT must be between 0 and 65535')
         return value
     
+    @field_validator('PARSE_WORKERS', 'PARSE_PAGES_PER_TASK', 'OLLAMA_VLM_CONCURRENCY', 'OLLAMA_VLM_MAX_RETRIES',
+        'LINK_CHECK_CONCURRENCY', 'LINK_CHECK_PER_DOMAIN', 'LINK_CHECK_MAX_DOMAIN_ERRORS', 'DOWNLOAD_CONCURRENCY',
+        'DOWNLOAD_MAX_BYTES', 'EMBED_BATCH_SIZE', 'KG_MAX_TRIPLETS_PER_CHUNK', 'KG_EXTRACT_CONCURRENCY',
+        'KG_EXTRACT_MAX_RETRIES', 'QUERY_SERVER_CONCURRENCY', 'CONTEXT_TOKEN_BUDGET', 'SUBGRAPH_CACHE_SIZE',
+        'KG_TRAVERSAL_DEPTH', 'KG_TRAVERSAL_FANOUT', 'KG_FUZZY_ENTITY_MATCHES', 'CHUNK_MAX_TOKENS', 'INGEST_QUEUE_SIZE', 'INGEST_PARSE_AHEAD',
+        'INGEST_COMMIT_EVERY', 'OLLAMA_MAX_LOADED_MODELS', 'OLLAMA_MAX_INFLIGHT_PER_MODEL')
+    def validate_worker_settings(cls, value, field):
+        if value < 0 or (field.field_name not in ('PARSE_WORKERS', 'OLLAMA_VLM_MAX_RETRIES', 'DOWNLOAD_MAX_BYTES',
+                                                  'KG_EXTRACT_MAX_RETRIES', 'CONTEXT_TOKEN_BUDGET', 'SUBGRAPH_CACHE_SIZE',
+                                                  'KG_FUZZY_ENTITY_MATCHES', 'CHUNK_MAX_TOKENS')
+                         and value == 0):
+            raise ValueError(f'{field.field_name} must be a positive number')
+        return value
+
+    @field_validator('QUERY_CACHE_BACKEND')
+    def validate_query_cache_backend(cls, v):
+        if v not in ('redis', 'memory', 'off'):
+            raise ValueError('QUERY_CACHE_BACKEND must be one of redis, memory, off')
+        return v
+
+    @field_validator('GRAPH_BACKEND')
+    def validate_graph_backend(cls, v):
+        if v not in ('neo4j', 'local'):
+            raise ValueError('GRAPH_BACKEND must be one of neo4j, local')
+        return v
+
+    @field_validator('RETRIEVAL_MODE')
+    def validate_retrieval_mode(cls, v):
+        if v not in ('kg', 'vector', 'hybrid'):
+            raise ValueError('RETRIEVAL_MODE must be one of kg, vector, hybrid')
+        return v
+
+    @field_validator('CONTEXT_KG_SHARE')
+    def validate_context_kg_share(cls, v):
+        if not 0.0 <= v <= 1.0:
+            raise ValueError('CONTEXT_KG_SHARE must be between 0 and 1')
+        return v
+
+    @field_validator('ENTITY_MERGE_THRESHOLD')
+    def validate_entity_merge_threshold(cls, v):
+        if not 0.0 <= v <= 1.0:
+            raise ValueError('ENTITY_MERGE_THRESHOLD must be between 0 and 1')
+        return v
+
+    @field_validator('CHUNK_BOILERPLATE_MARGIN')
+    def validate_chunk_boilerplate_margin(cls, v):
+        if not 0.0 <= v < 0.5:
+            raise ValueError('CHUNK_BOILERPLATE_MARGIN must be at least 0 and below 0.5')
+        return v
+
+    @field_validator('CHUNK_BOILERPLATE_SHARE')
+    def validate_chunk_boilerplate_share(cls, v):
+        if not 0.0 < v <= 1.0:
+            raise ValueError('CHUNK_BOILERPLATE_SHARE must be above 0 and at most 1')
+        return v
+
+    @field_validator('OLLAMA_KEEP_ALIVE')
+    def validate_ollama_keep_alive(cls, v):
+        if not re.fullmatch(r'-?\d+(\.\d+)?(ms|s|m|h)?', v):
+            raise ValueError('OLLAMA_KEEP_ALIVE must be a duration like "30m", "1h", "300" or "-1"')
+        return v
+
+    @field_validator('OLLAMA_MODEL_MAX_HOLD')
+    def validate_ollama_model_max_hold(cls, v):
+        if v <= 0:
+            raise ValueError('OLLAMA_MODEL_MAX_HOLD must be a positive number of seconds')
+        return v
+
     @field_validator('NEO4J_URI')
     def validate_neo4j_uri(cls, value):
         from urllib.parse import urlparse
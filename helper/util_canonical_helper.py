@@ -0,0 +1,193 @@
+import json
+import logging
+import pathlib
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+from helper.util_metrics_helper import count, timed
+
+logger = logging.getLogger(__name__)
+
+Triplet = Tuple[str, str, str]
+
+_ARTICLES = {"a", "an", "the"}
+_PUNCT = re.compile(r"[^\w\s]+")
+_DIGITS = re.compile(r"\d+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS aliases (key TEXT PRIMARY KEY, canonical TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS entities (name TEXT PRIMARY KEY, vector BLOB);
+"""
+
+
+# 1. Normalized keys
+def normalize_key(name: str) -> str:
+    """'The  IBM Corp.' and 'ibm corp' share the key 'ibm corp': NFKC, case-folded, no punctuation or leading article."""
+    words = _PUNCT.sub(" ", unicodedata.normalize("NFKC", name).casefold()).split()
+    if len(words) > 1 and words[0] in _ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+
+def relation_type(rel: str) -> str:
+    """Relation types the way both graph stores keep them: upper-cased, whitespace as underscores."""
+    return "_".join(rel.split()).upper()
+
+
+def dedupe_triplets(triplets: Iterable[Triplet]) -> List[Triplet]:
+    """Drop repeated triplets (relation types compared in their stored form), keeping first-seen order."""
+    return list(dict.fromkeys((s.strip(), relation_type(r), o.strip()) for s, r, o in triplets))
+
+
+# 2. Persistent alias table: normalized key -> canonical entity name
+class EntityAliasTable:
+    """
+    SQLite file mapping every normalized entity key seen so far to its canonical name,
+    plus the embedding of each canonical name for similarity merges. Everything is
+    read into memory on open; writes go straight to the file.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        self.aliases: Dict[str, str] = dict(self.conn.execute("SELECT key, canonical FROM aliases"))
+        self.names: List[str] = []
+        self._vectors: List[np.ndarray] = []
+        for name, blob in self.conn.execute("SELECT name, vector FROM entities WHERE vector IS NOT NULL ORDER BY rowid"):
+            self.names.append(name)
+            self._vectors.append(np.frombuffer(blob, dtype=np.float32))
+        self._matrix: Optional[np.ndarray] = None
+
+    def add(self, mapping: Dict[str, str], vectors: Dict[str, np.ndarray]) -> None:
+        """Store key -> canonical aliases and unit-length vectors of new canonical names."""
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO aliases (key, canonical) VALUES (?, ?)", mapping.items())
+            self.conn.executemany("INSERT OR IGNORE INTO entities (name, vector) VALUES (?, ?)",
+                                  [(name, v.astype(np.float32).tobytes()) for name, v in vectors.items()])
+            self.conn.commit()
+        self.aliases.update(mapping)
+        for name, vector in vectors.items():
+            self.names.append(name)
+            self._vectors.append(vector.astype(np.float32))
+        if vectors:
+            self._matrix = None
+
+    def matrix(self) -> Optional[np.ndarray]:
+        if self._matrix is None and self._vectors:
+            self._matrix = np.vstack(self._vectors)
+        return self._matrix
+
+
+# 3. Canonicalization in front of the graph writer
+class EntityCanonicalizer:
+    """
+    Maps the entity names of extracted triplets to one canonical name per entity before
+    they reach the graph, so "IBM", "I.B.M." and "the IBM" end up as one node:
+
+    1. names with the same normalized key are the same entity (the first surface form
+       seen becomes the canonical name);
+    2. a new key whose name embeds within `threshold` cosine similarity of a known
+       canonical name is recorded as an alias of it, unless the two differ in their
+       numbers ("Cluster 22" is not "Cluster 25"); threshold 0 turns this off.
+
+    Triplets are then deduplicated per unit, and self-loops created by a merge dropped.
+    Decisions are stored in the alias table, so they hold across runs and files.
+    """
+
+    def __init__(self, table: EntityAliasTable, embed_model=None, threshold: float = 0.92):
+        self.table = table
+        self.embed_model = embed_model
+        self.threshold = threshold if embed_model is not None else 0.0
+        self._unembedded: List[str] = []  # seeded canonical names without a vector yet
+
+    def seed(self, groups: Dict[str, List[str]]) -> None:
+        """Force aliases from a {canonical: [alias, ...]} mapping, overriding earlier decisions."""
+        mapping = {normalize_key(alias): canonical for canonical, names in groups.items() for alias in [canonical, *names]}
+        self.table.add({k: v for k, v in mapping.items() if k}, {})
+        # Embedded with the first batch of new names, so those can merge into them
+        known = set(self.table.names)
+        self._unembedded = [name for name in groups if normalize_key(name) and name not in known]
+
+    @timed("ingest.canonicalize")
+    def resolve(self, names: Iterable[str]) -> Dict[str, str]:
+        """Canonical name of every given name; unseen keys are merged or become new entities."""
+        keys = {name: normalize_key(name) for name in dict.fromkeys(names)}
+        new: Dict[str, str] = {}  # key -> first surface form in this batch
+        for name, key in keys.items():
+            if key and key not in self.table.aliases:
+                new.setdefault(key, name)
+
+        mapping: Dict[str, str] = {}
+        vectors: Dict[str, np.ndarray] = {}
+        if new and self.threshold > 0:
+            seeded, self._unembedded = self._unembedded, []
+            texts = seeded + list(new.values())
+            embedded = np.asarray(self.embed_model.get_text_embedding_batch(texts), dtype=np.float32)
+            embedded /= np.maximum(np.linalg.norm(embedded, axis=1, keepdims=True), 1e-12)
+            if seeded:
+                self.table.add({}, dict(zip(seeded, embedded)))
+            for (key, name), vector in zip(new.items(), embedded[len(seeded):]):
+                # Known names first, then the ones this batch has created so far
+                target = self._closest(key, vector, self.table.names, self.table.matrix())
+                if target is None and vectors:
+                    target = self._closest(key, vector, list(vectors), np.vstack(list(vectors.values())))
+                if target is None:
+                    mapping[key], vectors[name] = name, vector
+                else:
+                    mapping[key] = target
+                    count("entity_merges_total", reason="embedding")
+        else:
+            mapping = dict(new)
+        self.table.add(mapping, vectors)
+
+        resolved = {name: self.table.aliases.get(key, name) if key else name.strip() for name, key in keys.items()}
+        return resolved
+
+    def _closest(self, key: str, vector: np.ndarray, names: List[str], matrix: Optional[np.ndarray]) -> Optional[str]:
+        if matrix is None:
+            return None
+        scores = matrix @ vector
+        digits = _DIGITS.findall(key)
+        for i in np.argsort(-scores):
+            if scores[i] < self.threshold:
+                break
+            if _DIGITS.findall(normalize_key(names[i])) == digits:
+                return names[i]
+        return None
+
+    def canonicalize(self, triplets: Iterable[Triplet]) -> List[Triplet]:
+        return self.canonicalize_units([triplets])[0]
+
+    def canonicalize_units(self, units: Iterable[Iterable[Triplet]]) -> List[List[Triplet]]:
+        """Canonicalize several units' triplets with one embedding request for all new names."""
+        units = [dedupe_triplets(triplets) for triplets in units]
+        resolved = self.resolve(name for triplets in units for s, _, o in triplets for name in (s, o))
+        return [
+            [(s, r, o) for s, r, o in dedupe_triplets((resolved[s], r, resolved[o]) for s, r, o in triplets) if s != o]
+            for triplets in units
+        ]
+
+
+def build_canonicalizer(embed_model=None) -> Optional[EntityCanonicalizer]:
+    """The configured canonicalizer, or None when ENTITY_CANONICALIZE is off."""
+    if not config.ENTITY_CANONICALIZE:
+        return None
+    canonicalizer = EntityCanonicalizer(
+        EntityAliasTable(pathlib.Path(config.ENTITY_ALIAS_PATH)),
+        embed_model=embed_model,
+        threshold=config.ENTITY_MERGE_THRESHOLD,
+    )
+    if config.ENTITY_ALIASES_FILE:
+        canonicalizer.seed(json.loads(pathlib.Path(config.ENTITY_ALIASES_FILE).read_text(encoding="utf-8")))
+    return canonicalizer
@@ -0,0 +1,198 @@
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+_DIGITS_RE = re.compile(r"\d+")
+_SPACE_RE = re.compile(r"\s+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+_TERMINAL = (".", "!", "?", ":", ";")
+
+
+# 1. Layout blocks of one page
+@dataclass
+class LayoutBlock:
+    page: int
+    text: str
+    top: float  # bbox y0 / page height
+    bottom: float  # bbox y1 / page height
+    kind: str = "text"  # text | table
+    last_page: int = 0  # set when a paragraph continues across a page break
+
+    def __post_init__(self):
+        self.last_page = self.last_page or self.page
+
+
+def _table_text(table) -> str:
+    """One row per line, cells separated by ' | '."""
+    rows = table.extract()
+    return "\n".join(
+        " | ".join(_SPACE_RE.sub(" ", cell or "").strip() for cell in row) for row in rows
+    ).strip()
+
+
+def page_blocks(page, detect_tables: bool = True) -> List[LayoutBlock]:
+    """
+    Text blocks of a page in PyMuPDF's reading order. With detect_tables, each table
+    found by page.find_tables() replaces the blocks it covers with a single table block,
+    so a table is never split.
+    """
+    page_number = page.number + 1
+    height = page.rect.height or 1.0
+
+    tables = []
+    if detect_tables:
+        try:
+            tables = [(fitz.Rect(t.bbox), t) for t in page.find_tables().tables]
+        except Exception as e:
+            logger.debug(f"Table detection failed on page {page_number}: {e}")
+
+    blocks, emitted = [], set()
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks"):
+        if block_type != 0 or not text.strip():
+            continue
+        rect = fitz.Rect(x0, y0, x1, y1)
+        table_index = next((i for i, (t_rect, _) in enumerate(tables)
+                            if (rect & t_rect).get_area() >= 0.5 * rect.get_area()), None)
+        if table_index is None:
+            blocks.append(LayoutBlock(page_number, text.strip(), y0 / height, y1 / height))
+        elif table_index not in emitted:
+            # 1.1 The table takes the place of the first block it covers
+            emitted.add(table_index)
+            t_rect, table = tables[table_index]
+            blocks.append(LayoutBlock(page_number, _table_text(table), t_rect.y0 / height,
+                                      t_rect.y1 / height, kind="table"))
+    return [b for b in blocks if b.text]
+
+
+# 2. Running headers, footers and page numbers
+def _boilerplate_key(text: str) -> str:
+    """Page numbers and dates differ per page: compare with digits masked."""
+    return _SPACE_RE.sub(" ", _DIGITS_RE.sub("#", text.lower())).strip()
+
+
+def strip_running_boilerplate(pages: Sequence[List[LayoutBlock]], margin: float = 0.1,
+                              min_share: float = 0.5) -> Tuple[List[List[LayoutBlock]], int]:
+    """
+    Drop text blocks that sit entirely within the top or bottom `margin` of the page
+    and repeat (digits masked) on at least `min_share` of the document's pages.
+    Returns (pages, number of blocks removed). margin=0 disables stripping.
+    """
+    if margin <= 0 or len(pages) < 2:
+        return list(pages), 0
+
+    def in_margin(block: LayoutBlock) -> bool:
+        return block.kind == "text" and (block.bottom <= margin or block.top >= 1.0 - margin)
+
+    # 2.1 Count on how many pages each margin text occurs
+    seen = Counter()
+    for blocks in pages:
+        seen.update({_boilerplate_key(b.text) for b in blocks if in_margin(b)})
+    min_pages = max(2, math.ceil(min_share * len(pages)))
+    repeated = {key for key, n in seen.items() if n >= min_pages}
+
+    kept, removed = [], 0
+    for blocks in pages:
+        page_kept = [b for b in blocks if not (in_margin(b) and _boilerplate_key(b.text) in repeated)]
+        removed += len(blocks) - len(page_kept)
+        kept.append(page_kept)
+    return kept, removed
+
+
+# 3. Token-bounded chunks across page breaks
+def _join_page_breaks(pages: Sequence[List[LayoutBlock]]) -> List[LayoutBlock]:
+    """Flatten pages; a paragraph cut by a page break is joined back into one block."""
+    blocks: List[LayoutBlock] = []
+    for page in pages:
+        for i, block in enumerate(page):
+            prev = blocks[-1] if blocks else None
+            if (i == 0 and prev is not None and prev.kind == block.kind == "text"
+                    and not prev.text.endswith(_TERMINAL) and block.text[:1].islower()):
+                blocks[-1] = LayoutBlock(prev.page, f"{prev.text} {block.text}", prev.top, block.bottom,
+                                         last_page=block.last_page)
+            else:
+                blocks.append(block)
+    return blocks
+
+
+def _split_oversized(block: LayoutBlock, max_tokens: int, count_tokens: Callable[[str], int]) -> List[str]:
+    """
+    Split a block that exceeds max_tokens on its own: tables by rows (repeating the
+    header row), text by sentences, and words as a last resort.
+    """
+    if block.kind == "table" and "\n" in block.text:
+        header, *rows = block.text.split("\n")
+        units, prefix = rows, header + "\n"
+    else:
+        units, prefix = _SENTENCE_END_RE.split(block.text), ""
+
+    pieces, current = [], ""
+    for unit in units:
+        candidate = f"{current}\n{unit}".strip("\n") if prefix else f"{current} {unit}".strip()
+        if current and count_tokens(prefix + candidate) > max_tokens:
+            pieces.append(prefix + current)
+            candidate = unit
+        current = candidate
+    if current:
+        pieces.append(prefix + current)
+
+    # 3.1 Single sentences (or rows) still too long are cut into word windows
+    out = []
+    for piece in pieces:
+        if count_tokens(piece) <= max_tokens:
+            out.append(piece)
+            continue
+        words, window = piece.split(" "), []
+        for word in words:
+            if window and count_tokens(" ".join(window + [word])) > max_tokens:
+                out.append(" ".join(window))
+                window = []
+            window.append(word)
+        if window:
+            out.append(" ".join(window))
+    return out
+
+
+def chunk_pages(pages: Sequence[List[LayoutBlock]], max_tokens: int,
+                count_tokens: Optional[Callable[[str], int]] = None) -> List[Tuple[str, int, int]]:
+    """
+    Pack the blocks of consecutive pages into chunks of at most max_tokens, breaking
+    only between blocks (tables fit whole whenever they fit at all).
+    Returns [(text, first_page, last_page), ...] in document order.
+    """
+    if count_tokens is None:
+        from llama_index.core.utils import get_tokenizer
+        tokenizer = get_tokenizer()
+        count_tokens = lambda text: len(tokenizer(text))
+
+    chunks: List[Tuple[str, int, int]] = []
+    parts: List[str] = []
+    first = last = used = 0
+
+    def flush():
+        if parts:
+            chunks.append(("\n\n".join(parts), first, last))
+            parts.clear()
+
+    for block in _join_page_breaks(pages):
+        cost = count_tokens(block.text)
+        pieces = [(block.text, cost)] if cost <= max_tokens else [
+            (p, count_tokens(p)) for p in _split_oversized(block, max_tokens, count_tokens)
+        ]
+        for piece, cost in pieces:
+            # 3.2 Start a new chunk when this piece would overflow the current one (+1 for the separator)
+            if parts and used + cost + 1 > max_tokens:
+                flush()
+            if not parts:
+                first, used = block.page, 0
+            parts.append(piece)
+            last = block.last_page
+            used += cost + 1
+    flush()
+    return chunks
@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.utils import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+Triplet = Tuple[str, str, str]
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "the", "and", "for", "are", "was", "were", "what", "which", "who", "whom", "how", "why", "when", "where",
+    "does", "did", "with", "from", "that", "this", "these", "those", "about", "into", "there", "their", "has",
+    "have", "had", "can", "could", "would", "should", "is", "of", "in", "on", "to", "a", "an", "or", "by", "it",
+}
+
+KG_CONTEXT_HEADER = "Knowledge graph facts, one subject per line (subject: relation → object; ...):"
+
+
+def _terms(text: str) -> set:
+    return {w for w in _WORD_RE.findall(text.lower()) if len(w) > 2 and w not in _STOPWORDS}
+
+
+# 1. Triplets from the rel_map attached by KnowledgeGraphRAGRetriever
+def triplets_from_rel_map(rel_map: Dict[str, List[list]]) -> List[Tuple[Triplet, int]]:
+    """
+    Neo4jGraphStore.get_rel_map returns {subject: [[REL, obj, REL2, obj2, ...], ...]}, one
+    flattened path per entry. Returns every hop as ((subj, rel, obj), hop), hop starting at 1.
+    """
+    hops = []
+    for subj, paths in (rel_map or {}).items():
+        for path in paths:
+            current = subj
+            for hop, i in enumerate(range(0, len(path) - 1, 2), start=1):
+                rel, obj = str(path[i]), str(path[i + 1])
+                hops.append(((str(current), rel, obj), hop))
+                current = obj
+    return hops
+
+
+def rank_triplets(hops: List[Tuple[Triplet, int]], query: str) -> List[Triplet]:
+    """
+    Dedupe triplets and order them by relevance to the query: term overlap with the
+    entities (and, less, the relation), then closeness to a seed entity, then how many
+    retrieved paths contain them.
+    """
+    query_terms = _terms(query)
+    count = Counter(t for t, _ in hops)
+    nearest: Dict[Triplet, int] = {}
+    for t, hop in hops:
+        nearest[t] = min(hop, nearest.get(t, hop))
+
+    def score(t: Triplet) -> float:
+        subj, rel, obj = t
+        entity_overlap = len(query_terms & (_terms(subj) | _terms(obj)))
+        rel_overlap = len(query_terms & _terms(rel.replace("_", " ")))
+        return 2.0 * entity_overlap + rel_overlap + 1.0 / nearest[t] + 0.1 * count[t]
+
+    return sorted(nearest, key=score, reverse=True)
+
+
+def format_triplets(triplets: List[Triplet]) -> str:
+    """Compact serialization: one line per subject, relations lower-cased, no repeated subjects."""
+    by_subject: Dict[str, List[str]] = {}
+    for subj, rel, obj in triplets:
+        by_subject.setdefault(subj, []).append(f"{rel.replace('_', ' ').lower()} → {obj}")
+    return "\n".join(f"{subj}: {'; '.join(facts)}" for subj, facts in by_subject.items())
+
+
+# 2. Post-retrieval context budgeting
+class ContextBudgetPostprocessor(BaseNodePostprocessor):
+    """
+    Dedupes and ranks retrieved context and packs it into a token budget.
+
+    Graph context (the KnowledgeGraphRAGRetriever node) is rebuilt from its rel_map as
+    deduplicated, ranked triplets in a compact per-subject format. Text chunks are
+    deduplicated and kept in score order. The graph gets `kg_share` of the budget when
+    there are text chunks too; whatever one side leaves unused goes to the other.
+    """
+
+    token_budget: int = Field(default=3000, description="Max tokens of context passed to synthesis.")
+    kg_share: float = Field(default=0.5, description="Part of the budget reserved for graph facts.")
+    _count_tokens: Callable[[str], int] = PrivateAttr()
+
+    def __init__(self, tokenizer: Optional[Callable[[str], list]] = None, **kwargs):
+        super().__init__(**kwargs)
+        tokenizer = tokenizer or get_tokenizer()
+        self._count_tokens = lambda text: len(tokenizer(text))
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextBudgetPostprocessor"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        query = query_bundle.query_str if query_bundle else ""
+
+        # 2.1 Split graph context from text chunks; dedupe both
+        hops, kg_node, text_nodes, seen = [], None, [], set()
+        for n in nodes:
+            node_hops = triplets_from_rel_map(n.node.metadata.get("kg_rel_map"))
+            if node_hops:
+                hops.extend(node_hops)
+                kg_node = kg_node or n
+                continue
+            # Anything else (including graph context without a rel_map) is treated as a text chunk
+            key = hashlib.sha256(" ".join(n.node.get_content().lower().split()).encode("utf-8")).digest()
+            if key not in seen:
+                seen.add(key)
+                text_nodes.append(n)
+        text_nodes.sort(key=lambda n: n.score if n.score is not None else 0.0, reverse=True)
+        triplets = rank_triplets(hops, query)
+
+        # 2.2 Pack: graph facts up to their share, then chunks, then more facts if room is left
+        budget = self.token_budget - self._count_tokens(KG_CONTEXT_HEADER)
+        kg_budget = int(budget * self.kg_share) if text_nodes else budget
+        kept_triplets, used = [], 0
+
+        def take_triplets(limit: int) -> None:
+            nonlocal used
+            while len(kept_triplets) < len(triplets):
+                t = triplets[len(kept_triplets)]
+                cost = self._count_tokens(format_triplets([t])) + 1
+                if used + cost > limit:
+                    break
+                kept_triplets.append(t)
+                used += cost
+
+        take_triplets(kg_budget)
+        kept_text = []
+        for n in text_nodes:
+            cost = self._count_tokens(n.node.get_content(metadata_mode=MetadataMode.LLM))
+            if used + cost <= budget:
+                kept_text.append(n)
+                used += cost
+        take_triplets(budget)
+
+        # 2.3 Rebuild the graph node with the compact serialization
+        result = []
+        if kept_triplets:
+            compact = f"{KG_CONTEXT_HEADER}\n{format_triplets(kept_triplets)}"
+            result.append(NodeWithScore(
+                node=TextNode(
+                    text=compact,
+                    metadata=kg_node.node.metadata,
+                    excluded_embed_metadata_keys=kg_node.node.excluded_embed_metadata_keys,
+                    excluded_llm_metadata_keys=kg_node.node.excluded_llm_metadata_keys,
+                ),
+                score=kg_node.score,
+            ))
+        result.extend(kept_text)
+
+        logger.info(
+            f"Context budget: {len(kept_triplets)}/{len(triplets)} unique triplets ({len(hops)} retrieved), "
+            f"{len(kept_text)}/{len(text_nodes)} unique chunks ({len(nodes)} nodes in), ~{used} tokens"
+        )
+        return result
@@ -1,30 +1,262 @@
+import contextlib
+import multiprocessing
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 from llama_index.core import Document
 import fitz  # PyMuPDF
 
+from helper.util_chunk_helper import LayoutBlock, chunk_pages, page_blocks, strip_running_boilerplate
+from helper.util_image_helper import ExtractedImage, extract_page_images
+
+
+def process_pool(max_workers: int) -> ProcessPoolExecutor:
+    # fork where available: spawn would re-run the importing script (main.py is not __main__-guarded)
+    mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+
+
+def start_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    process_pool with its workers already running. Forking copies only the calling
+    thread, so a pool used by a multi-threaded pipeline is started before its threads.
+    """
+    pool = process_pool(max_workers)
+    # With fork, the first task makes the pool start all of its workers at once
+    pool.submit(int).result()
+    return pool
+
+
 # 1. Extract text from each page of a PDF and build Document objects with metadata
-def build_docs_with_metadata(pdf_path: str) -> List[Document]:
-    docs = []
+def _page_document(pdf_path: str, page_number: int, text: str) -> Document:
+    return Document(
+        text=text,
+        metadata={
+            "source": "pdf",
+            "filename": Path(pdf_path).name,
+            "page": page_number,
+            "type": "page"
+        }
+    )
+
+
+def _chunk_document(pdf_path: str, index: int, text: str, first_page: int, last_page: int) -> Document:
+    # The chunk index is kept out of LLM/embedding text so cached triplets survive re-numbering
+    return Document(
+        text=text,
+        metadata={
+            "source": "pdf",
+            "filename": Path(pdf_path).name,
+            "page": first_page,
+            "page_end": last_page,
+            "chunk": index,
+            "type": "chunk"
+        },
+        excluded_llm_metadata_keys=["chunk"],
+        excluded_embed_metadata_keys=["chunk"],
+    )
+
+
+def unit_id(doc: Document) -> str:
+    """Manifest unit of a parsed document: 'chunk=<n>' or 'page=<n>'."""
+    if "chunk" in doc.metadata:
+        return f"chunk={doc.metadata['chunk']}"
+    return f"page={doc.metadata['page']}"
+
+
+def _layout_documents(pdf_path: str, pages: List[Tuple[int, List[LayoutBlock]]], chunk_tokens: int,
+                      margin: float, repeat_share: float, stats: Optional[Counter] = None) -> List[Document]:
+    """
+    Strip running headers/footers across the whole document, then emit token-bounded
+    chunks that may span pages (chunk_tokens > 0) or one Document per page.
+    """
+    blocks, removed = strip_running_boilerplate([b for _, b in pages], margin, repeat_share)
+    if stats is not None:
+        stats["boilerplate_blocks"] += removed
+
+    if chunk_tokens:
+        chunks = chunk_pages(blocks, chunk_tokens)
+        return [_chunk_document(pdf_path, i, text, first, last) for i, (text, first, last) in enumerate(chunks)]
+
+    return [
+        _page_document(pdf_path, page_number, "\n\n".join(b.text for b in page))
+        for (page_number, _), page in zip(pages, blocks) if page
+    ]
+
+
+def build_docs_with_metadata(pdf_path: str, chunk_tokens: int = 0, detect_tables: bool = True,
+                             margin: float = 0.1, repeat_share: float = 0.5) -> List[Document]:
+    """Layout-aware Documents for one PDF; see parse_pdfs_parallel for the options."""
+    # 1.1 Open the PDF and read the layout blocks of every page
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    pages, _, _ = _parse_page_range((pdf_path, 0, page_count, False, None, detect_tables, ()))
+
+    # 1.2 Drop boilerplate and chunk across pages
+    return _layout_documents(pdf_path, pages, chunk_tokens, margin, repeat_share)
+
+
+# 2. Parse many PDFs across a process pool (text and images in one pass)
+def _parse_page_range(
+    task: Tuple[str, int, int, bool, Optional[str], bool, Tuple[int, ...]]
+) -> Tuple[List[Tuple[int, List[LayoutBlock]]], List[ExtractedImage], Counter]:
+    """
+    Worker: open the PDF once and walk pages [start, stop), returning
+    ([(page_number, [LayoutBlock, ...]), ...], [ExtractedImage, ...], image_filter_stats).
+    Image xrefs listed in the task belong to an earlier page range and are skipped.
+    """
+    pdf_path, start, stop, extract_images, image_dir, detect_tables, earlier_xrefs = task
+    pages, images = [], []
+    seen_xrefs, stats = set(earlier_xrefs), Counter()
 
-    # 1.1 Open the PDF
     doc = fitz.open(pdf_path)
+    for i in range(start, stop):
+        page = doc[i]
+        blocks = page_blocks(page, detect_tables)
+        if blocks:
+            pages.append((i + 1, blocks))
+        if extract_images:
+            images.extend(extract_page_images(doc, page, pdf_path, Path(image_dir) if image_dir else None,
+                                              seen_xrefs=seen_xrefs, stats=stats))
+    doc.close()
+    return pages, images, stats
+
+
+def _page_range_tasks(pdf_path: Path, pages_per_task: int, extract_images: bool, image_dir: Optional[Path],
+                      detect_tables: bool) -> List[Tuple[str, int, int, bool, Optional[str], bool, Tuple[int, ...]]]:
+    """
+    Split a PDF into page ranges. With images, every xref is assigned to the range of the
+    first page that shows it (page resources only, nothing is decoded), so a logo on every
+    page is extracted once per document rather than once per range.
+    """
+    starts = []
+    with fitz.open(str(pdf_path)) as doc:
+        page_count = doc.page_count
+        first_page: Dict[int, int] = {}
+        if extract_images and page_count > pages_per_task:
+            for page in doc:
+                for image in page.get_images(full=True):
+                    first_page.setdefault(image[0], page.number)
+    for start in range(0, page_count, pages_per_task):
+        earlier = tuple(sorted(xref for xref, number in first_page.items() if number < start))
+        starts.append((start, earlier))
+    return [(str(pdf_path), start, min(start + pages_per_task, page_count),
+             extract_images, str(image_dir) if image_dir is not None else None, detect_tables, earlier)
+            for start, earlier in starts]
+
+
+def parse_pdfs_parallel(
+    pdf_paths: Sequence[Path],
+    extract_images: bool = False,
+    image_dir: Optional[Path] = None,
+    workers: int = 0,
+    pages_per_task: int = 50,
+    stats: Optional[Counter] = None,
+    chunk_tokens: int = 0,
+    detect_tables: bool = True,
+    margin: float = 0.1,
+    repeat_share: float = 0.5,
+) -> Dict[str, Tuple[List[Document], List[ExtractedImage]]]:
+    """
+    Parse PDFs on a process pool, split into page ranges of pages_per_task.
+    Returns {pdf_path: (documents, [ExtractedImage, ...])} in the order of
+    pdf_paths, with documents and images in page order. Images are kept in memory and
+    only written to disk when image_dir is given; skipped images and stripped
+    header/footer blocks are counted into stats. workers=0 uses every CPU, workers=1
+    parses inline.
+
+    Text comes from PyMuPDF layout blocks: tables are kept as single blocks, blocks in
+    the top/bottom `margin` of the page that repeat on `repeat_share` of a PDF's pages
+    are dropped, and with chunk_tokens > 0 the rest is packed into chunks of at most
+    chunk_tokens that may cross page breaks (metadata page..page_end). chunk_tokens=0
+    keeps one Document per page.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    # 2.1 Split every PDF into page-range tasks
+    tasks = [task for pdf_path in pdf_paths
+             for task in _page_range_tasks(pdf_path, pages_per_task, extract_images, image_dir, detect_tables)]
+
+    if extract_images and image_dir is not None:
+        image_dir.mkdir(parents=True, exist_ok=True)
+
+    # 2.2 Run tasks; map() keeps submission order so results are deterministic
+    if workers == 1 or len(tasks) <= 1:
+        results = list(map(_parse_page_range, tasks))
+    else:
+        with process_pool(min(workers, len(tasks))) as pool:
+            results = list(pool.map(_parse_page_range, tasks))
+
+    # 2.3 Headers and footers are detected per PDF, so its page ranges are merged first
+    pages_by_pdf = {str(p): [] for p in pdf_paths}
+    images_by_pdf = {str(p): [] for p in pdf_paths}
+    for (pdf_path, *_), (pages, images, task_stats) in zip(tasks, results):
+        pages_by_pdf[pdf_path].extend(pages)
+        images_by_pdf[pdf_path].extend(images)
+        if stats is not None:
+            stats.update(task_stats)
+
+    return {
+        pdf_path: (_layout_documents(pdf_path, pages, chunk_tokens, margin, repeat_share, stats),
+                   images_by_pdf[pdf_path])
+        for pdf_path, pages in pages_by_pdf.items()
+    }
+
+
+# 3. Stream PDFs one at a time as they finish parsing
+def iter_parse_pdfs(
+    pdf_paths: Iterable[Path],
+    extract_images: bool = False,
+    image_dir: Optional[Path] = None,
+    workers: int = 0,
+    pages_per_task: int = 50,
+    stats: Optional[Counter] = None,
+    max_pending: int = 2,
+    chunk_tokens: int = 0,
+    detect_tables: bool = True,
+    margin: float = 0.1,
+    repeat_share: float = 0.5,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Iterator[Tuple[str, List[Document], List[ExtractedImage]]]:
+    """
+    Streaming counterpart of parse_pdfs_parallel: yields (pdf_path, documents, images)
+    per PDF, in the order of pdf_paths, as soon as all of its page ranges are parsed.
+    pdf_paths is consumed lazily and at most max_pending PDFs are submitted to the
+    pool ahead of the consumer, so memory stays bounded by a few PDFs however large
+    the corpus is. A given pool (see start_process_pool) is used instead of `workers`
+    and left open.
+    """
+    workers = workers or os.cpu_count() or 1
+    if extract_images and image_dir is not None:
+        image_dir.mkdir(parents=True, exist_ok=True)
+
+    def finish(pdf_path: str, results) -> Tuple[str, List[Document], List[ExtractedImage]]:
+        pages, images = [], []
+        for task_pages, task_images, task_stats in results:
+            pages.extend(task_pages)
+            images.extend(task_images)
+            if stats is not None:
+                stats.update(task_stats)
+        return pdf_path, _layout_documents(pdf_path, pages, chunk_tokens, margin, repeat_share, stats), images
+
+    # 3.1 Inline parsing: nothing to overlap with
+    if workers == 1 and pool is None:
+        for pdf_path in pdf_paths:
+            tasks = _page_range_tasks(pdf_path, pages_per_task, extract_images, image_dir, detect_tables)
+            yield finish(str(pdf_path), map(_parse_page_range, tasks))
+        return
 
-    # 1.2 Iterate over all pages
-    for i, page in enumerate(doc):
-        text = page.get_text()
-
-        # 1.3 Only process non-empty pages
-        if text.strip():
-            docs.append(Document(
-                text=text,
-                metadata={
-                    "source": "pdf",
-                    "filename": Path(pdf_path).name,
-                    "page": i + 1,
-                    "type": "page"
-                }
-            ))
-
-    # 1.4 Return the list of Document objects
-    return docs
+    # 3.2 Keep up to max_pending PDFs in flight; hand them out in submission order
+    in_flight = deque()
+    with contextlib.nullcontext(pool) if pool is not None else process_pool(workers) as pool:
+        for pdf_path in pdf_paths:
+            tasks = _page_range_tasks(pdf_path, pages_per_task, extract_images, image_dir, detect_tables)
+            in_flight.append((str(pdf_path), [pool.submit(_parse_page_range, task) for task in tasks]))
+            while len(in_flight) >= max(1, max_pending):
+                path, futures = in_flight.popleft()
+                yield finish(path, (f.result() for f in futures))
+        while in_flight:
+            path, futures = in_flight.popleft()
+            yield finish(path, (f.result() for f in futures))
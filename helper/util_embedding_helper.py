@@ -0,0 +1,196 @@
+import fcntl
+import hashlib
+import json
+import logging
+import pathlib
+import re
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.ollama import OllamaEmbedding
+
+from helper.util_metrics_helper import count
+from helper.util_scheduler_helper import ollama_async_client, ollama_client
+
+logger = logging.getLogger(__name__)
+
+
+# 1. Disk-backed embedding cache: memory-mapped float32 matrix + key index
+class EmbeddingCache:
+    """
+    Append-only store of embeddings for one model, keyed by text hash.
+
+    <dir>/<model>.f32   raw float32 rows, memory-mapped for reads
+    <dir>/<model>.keys  one text hash per line, in row order
+    <dir>/<model>.json  {"model": ..., "dim": ...}
+
+    Rows are written before their keys, so a crash can only leave unreferenced
+    trailing rows and a torn last key line, which are ignored on load and cut off
+    before the next append. Appends hold an flock on the key file, so ingestion and
+    a query process can share one cache directory.
+    """
+
+    def __init__(self, directory: pathlib.Path, model_name: str):
+        self.model_name = model_name
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self._rows_path = directory / f"{slug}.f32"
+        self._keys_path = directory / f"{slug}.keys"
+        self._meta_path = directory / f"{slug}.json"
+        self._lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self._index: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._n_keys = 0  # complete key lines read, i.e. rows in use
+        self._keys_offset = 0  # end of the last complete key line read
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """Pick up rows appended (by this or another process) since the last read."""
+        if self.dim is None:
+            if not self._meta_path.exists():
+                return
+            self.dim = json.loads(self._meta_path.read_text())["dim"]
+        if not self._keys_path.exists():
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            tail = f.read()
+        n_rows = self._rows_path.stat().st_size // (4 * self.dim) if self._rows_path.exists() else 0
+        for line in tail.splitlines(keepends=True):
+            # A torn last line, or keys past the rows, are left for put_many to cut off
+            if not line.endswith(b"\n") or self._n_keys >= n_rows:
+                break
+            self._index.setdefault(line.decode("ascii").strip(), self._n_keys)
+            self._n_keys += 1
+            self._keys_offset += len(line)
+        self._remap()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remap(self) -> None:
+        n = self._n_keys
+        self._matrix = np.memmap(self._rows_path, dtype=np.float32, mode="r", shape=(n, self.dim)) if n else None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    # 1.1 Reads only touch the pages of the rows asked for
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        with self._lock:
+            rows = {k: self._index[k] for k in keys if k in self._index}
+            return {k: self._matrix[i].tolist() for k, i in rows.items()}
+
+    # 1.2 Appends
+    def put_many(self, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        with self._lock, open(self._keys_path, "ab") as keys_file:
+            fcntl.flock(keys_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                # Cut what an interrupted append left behind, so new keys start on their own line
+                keys_file.truncate(self._keys_offset)
+                items = {k: v for k, v in items.items() if k not in self._index}
+                if not items:
+                    return
+                block = np.asarray(list(items.values()), dtype=np.float32)
+                if self.dim is None:
+                    self.dim = block.shape[1]
+                    self._meta_path.write_text(json.dumps({"model": self.model_name, "dim": self.dim}))
+                elif block.shape[1] != self.dim:
+                    raise ValueError(f"Embedding dim {block.shape[1]} does not match cache dim {self.dim}")
+
+                # Drop any unreferenced trailing rows from an interrupted write before appending
+                with open(self._rows_path, "ab") as f:
+                    f.truncate(self._n_keys * 4 * self.dim)
+                    f.write(block.tobytes())
+                line = "".join(k + "\n" for k in items).encode("ascii")
+                keys_file.write(line)
+                keys_file.flush()
+
+                for k in items:
+                    self._index[k] = self._n_keys
+                    self._n_keys += 1
+                self._keys_offset += len(line)
+                self._remap()
+            finally:
+                fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+
+# 2. Ollama embeddings served from the cache; misses go out as one multi-input request
+class CachedOllamaEmbedding(OllamaEmbedding):
+    """OllamaEmbedding that memoizes every vector in an EmbeddingCache."""
+
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, cache_dir: pathlib.Path, **kwargs):
+        super().__init__(**kwargs)
+        self._cache = EmbeddingCache(cache_dir, self.model_name)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedOllamaEmbedding"
+
+    def _split(self, texts: List[str]):
+        keys = [EmbeddingCache.key(t) for t in texts]
+        hits = self._cache.get_many(keys)
+        misses = list({k: t for k, t in zip(keys, texts) if k not in hits}.items())
+        count("cache_hits_total", len(keys) - len(misses), cache="embeddings")
+        count("cache_misses_total", len(misses), cache="embeddings")
+        return keys, hits, misses
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, hits, misses = self._split(texts)
+        if misses:
+            result = self._client.embed(
+                model=self.model_name, input=[t for _, t in misses], options=self.ollama_additional_kwargs
+            )
+            new = dict(zip((k for k, _ in misses), result["embeddings"]))
+            self._cache.put_many(new)
+            hits.update(new)
+        return [hits[k] for k in keys]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, hits, misses = self._split(texts)
+        if misses:
+            result = await self._async_client.embed(
+                model=self.model_name, input=[t for _, t in misses], options=self.ollama_additional_kwargs
+            )
+            new = dict(zip((k for k, _ in misses), result["embeddings"]))
+            self._cache.put_many(new)
+            hits.update(new)
+        return [hits[k] for k in keys]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aget_text_embeddings([query]))[0]
+
+
+def build_embed_model(model_name: str, base_url: str, cache_dir: str = "", embed_batch_size: int = 32,
+                      **kwargs) -> OllamaEmbedding:
+    """Cached Ollama embeddings, or the plain model when cache_dir is empty."""
+    if cache_dir:
+        model = CachedOllamaEmbedding(
+            cache_dir=pathlib.Path(cache_dir), model_name=model_name, base_url=base_url,
+            embed_batch_size=embed_batch_size, **kwargs
+        )
+    else:
+        model = OllamaEmbedding(model_name=model_name, base_url=base_url, embed_batch_size=embed_batch_size, **kwargs)
+    # Every embed request is scheduled with the other models and timed (util_scheduler_helper)
+    model._client = ollama_client(base_url)
+    model._async_client = ollama_async_client(base_url)
+    return model
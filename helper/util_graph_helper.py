@@ -0,0 +1,251 @@
+import logging
+import threading
+import urllib.parse
+from typing import Any, Dict, Iterable, List, Optional, Protocol, Tuple
+
+from neo4j import Driver, GraphDatabase
+
+from helper.util_metrics_helper import span
+
+logger = logging.getLogger(__name__)
+
+
+# 1. One pooled driver per (uri, user) for the whole process
+_drivers: Dict[Tuple[str, str], Driver] = {}
+_drivers_lock = threading.Lock()
+
+
+def get_driver(uri: str, user: str, pwd: str) -> Driver:
+    with _drivers_lock:
+        if (uri, user) not in _drivers:
+            _drivers[(uri, user)] = GraphDatabase.driver(uri, auth=(user, pwd))
+        return _drivers[(uri, user)]
+
+
+def close_drivers() -> None:
+    with _drivers_lock:
+        while _drivers:
+            _drivers.popitem()[1].close()
+
+
+# 2. Buffered graph writer for the PDF / LinkedDoc / CITES bootstrap graph
+class LinkGraphWriter(Protocol):
+    """What the link pipeline needs from a writer; GraphWriter and LocalGraphWriter both provide it."""
+
+    def add_pdf(self, name: str) -> None: ...
+
+    def add_citation(self, pdf_name: str, url: str, page: int) -> None: ...
+
+    def set_link_properties(self, url: str, **props: Any) -> None: ...
+
+    def flush(self) -> None: ...
+
+    def unchecked_links(self) -> List[str]: ...
+
+    def links_to_fetch(self, refresh: bool = False) -> List[Dict[str, Any]]: ...
+
+    def remove_pdfs(self, names: Iterable[str]) -> None: ...
+
+
+class GraphWriter:
+    """
+    Buffers PDF, LinkedDoc, CITES and knowledge-triplet writes and flushes them as
+    parameterized UNWIND batches inside one managed write transaction, instead of
+    one auto-commit round-trip per row. Use as a context manager to flush on exit.
+    """
+
+    def __init__(self, driver: Driver, database: str = "neo4j", batch_size: int = 1000,
+                 entity_label: str = "Entity"):
+        self.driver = driver
+        self.database = database
+        self.batch_size = batch_size
+        self.entity_label = entity_label
+        self._pdfs: List[Dict[str, Any]] = []
+        self._citations: List[Dict[str, Any]] = []
+        self._link_updates: List[Dict[str, Any]] = []
+        self._triplets: Dict[str, List[Dict[str, Any]]] = {}
+        self._n_triplets = 0
+
+    # 2.1 Schema and connectivity
+    def ensure_schema(self) -> None:
+        from helper.util_schema_helper import ensure_schema
+
+        ensure_schema(self.driver, self.database, self.entity_label)
+
+    def verify_connectivity(self) -> None:
+        self.driver.verify_connectivity()
+
+    # 2.2 Buffered writes
+    def add_pdf(self, name: str) -> None:
+        self._pdfs.append({"name": name})
+        self._maybe_flush()
+
+    def add_citation(self, pdf_name: str, url: str, page: int) -> None:
+        domain = urllib.parse.urlparse(url).netloc or "unknown"
+        self._citations.append({"pdf": pdf_name, "url": url, "page": page, "domain": domain})
+        self._maybe_flush()
+
+    def set_link_properties(self, url: str, **props: Any) -> None:
+        self._link_updates.append({"url": url, "props": props})
+        self._maybe_flush()
+
+    def add_triplet(self, subj: str, rel: str, obj: str, weight: Optional[int] = None) -> None:
+        """
+        Same graph shape as Neo4jGraphStore.upsert_triplet; relation types are upper-cased with
+        underscores. weight (the number of units stating the triplet) replaces the edge's weight.
+        """
+        rel_type = rel.replace(" ", "_").upper()
+        self._triplets.setdefault(rel_type, []).append({"subj": subj, "obj": obj, "weight": weight})
+        self._n_triplets += 1
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if len(self._pdfs) + len(self._citations) + len(self._link_updates) + self._n_triplets >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        pdfs, citations, link_updates = self._pdfs, self._citations, self._link_updates
+        triplets, n_triplets = self._triplets, self._n_triplets
+        self._pdfs, self._citations, self._link_updates = [], [], []
+        self._triplets, self._n_triplets = {}, 0
+        if not (pdfs or citations or link_updates or triplets):
+            return
+
+        def write(tx):
+            if pdfs:
+                tx.run("UNWIND $rows AS row MERGE (:PDF {name: row.name})", rows=pdfs)
+            if citations:
+                tx.run(
+                    """
+                    UNWIND $rows AS row
+                    MERGE (p:PDF {name: row.pdf})
+                    MERGE (d:LinkedDoc {url: row.url})
+                    ON CREATE SET d.status = 'unknown', d.domain = row.domain
+                    MERGE (p)-[:CITES {page: row.page}]->(d)
+                    """,
+                    rows=citations,
+                )
+            if link_updates:
+                tx.run(
+                    "UNWIND $rows AS row MATCH (d:LinkedDoc {url: row.url}) SET d += row.props",
+                    rows=link_updates,
+                )
+            # Relationship types cannot be parameters, so there is one UNWIND per type
+            label = self.entity_label.replace("`", "``")
+            for rel_type, rows in triplets.items():
+                tx.run(
+                    f"""
+                    UNWIND $rows AS row
+                    MERGE (n1:`{label}` {{id: row.subj}})
+                    MERGE (n2:`{label}` {{id: row.obj}})
+                    MERGE (n1)-[r:`{rel_type.replace("`", "``")}`]->(n2)
+                    SET r.weight = coalesce(row.weight, r.weight, 1)
+                    """,
+                    rows=rows,
+                )
+
+        with span("graph.write", backend="neo4j"), self.driver.session(database=self.database) as s:
+            s.execute_write(write)
+        logger.info(
+            f"Flushed {len(pdfs)} PDFs, {len(citations)} citations, {len(link_updates)} link updates, "
+            f"{n_triplets} triplets"
+        )
+
+    def delete_triplets(self, triplets: Iterable[Tuple[str, str, str]]) -> int:
+        """
+        Delete triplets and the entities they leave without any relationship, one UNWIND per
+        relation type (escaped like in flush). Buffered writes are flushed first, so a triplet
+        added and then deleted is gone afterwards.
+        """
+        by_type: Dict[str, List[Dict[str, str]]] = {}
+        for subj, rel, obj in triplets:
+            by_type.setdefault(rel.replace(" ", "_").upper(), []).append({"subj": subj, "obj": obj})
+        if not by_type:
+            return 0
+        self.flush()
+
+        def delete(tx):
+            label = self.entity_label.replace("`", "``")
+            for rel_type, rows in by_type.items():
+                tx.run(
+                    f"""
+                    UNWIND $rows AS row
+                    MATCH (n1:`{label}` {{id: row.subj}})-[r:`{rel_type.replace("`", "``")}`]->(n2:`{label}` {{id: row.obj}})
+                    DELETE r
+                    WITH collect(DISTINCT n1) + collect(DISTINCT n2) AS nodes
+                    UNWIND nodes AS n
+                    WITH DISTINCT n
+                    WHERE NOT (n)--()
+                    DELETE n
+                    """,
+                    rows=rows,
+                )
+
+        with span("graph.write", backend="neo4j"), self.driver.session(database=self.database) as s:
+            s.execute_write(delete)
+        n = sum(map(len, by_type.values()))
+        logger.info(f"Deleted {n} triplets")
+        return n
+
+    # 2.3 Reads and one-off statements share the same pooled driver
+    def read(self, query: str, **params: Any) -> List[Dict[str, Any]]:
+        with span("graph.read", backend="neo4j"):
+            records, _, _ = self.driver.execute_query(query, params, database_=self.database, routing_="r")
+        return [r.data() for r in records]
+
+    def run(self, query: str, **params: Any) -> None:
+        with span("graph.write", backend="neo4j"):
+            self.driver.execute_query(query, params, database_=self.database)
+
+    # 2.4 Queries used by the link pipeline (LocalGraphWriter implements the same ones)
+    def unchecked_links(self) -> List[str]:
+        return [rec["url"] for rec in self.read("MATCH (d:LinkedDoc {status:'unknown'}) RETURN d.url AS url")]
+
+    def links_to_fetch(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        return self.read(
+            """
+            MATCH (d:LinkedDoc {status:'accessible'})
+            WHERE $refresh OR d.local_path IS NULL
+            RETURN d.url AS url, d.local_path AS local_path, d.etag AS etag, d.last_modified AS last_modified
+            """,
+            refresh=refresh,
+        )
+
+    def remove_pdfs(self, names: Iterable[str]) -> None:
+        """Delete PDF nodes and any LinkedDoc left without a citing PDF."""
+        self.run("UNWIND $names AS n MATCH (p:PDF {name: n}) DETACH DELETE p", names=list(names))
+        self.run("MATCH (d:LinkedDoc) WHERE NOT ()-[:CITES]->(d) DETACH DELETE d")
+
+    # 2.5 Graph version
+    def graph_version(self) -> int:
+        return get_graph_version(self.driver, self.database)
+
+    def bump_graph_version(self) -> int:
+        return bump_graph_version(self.driver, self.database)
+
+    def __enter__(self) -> "GraphWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.flush()
+
+
+# 3. Graph version stamp, bumped by ingestion so caches can tell when the graph changed
+def get_graph_version(driver: Driver, database: str = "neo4j") -> int:
+    with span("graph.read", backend="neo4j"):
+        records, _, _ = driver.execute_query(
+            "MATCH (m:GraphMeta {id: 'graph'}) RETURN m.version AS version", database_=database, routing_="r"
+        )
+    return records[0]["version"] if records else 0
+
+
+def bump_graph_version(driver: Driver, database: str = "neo4j") -> int:
+    records, _, _ = driver.execute_query(
+        """
+        MERGE (m:GraphMeta {id: 'graph'})
+        SET m.version = coalesce(m.version, 0) + 1, m.updated_at = datetime()
+        RETURN m.version AS version
+        """,
+        database_=database,
+    )
+    return records[0]["version"]
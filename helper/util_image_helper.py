@@ -1,78 +1,235 @@
 import fitz  # PyMuPDF
+import hashlib
+import math
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path, PosixPath
-from ollama import Client
-from typing import List, Tuple
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
 from config import config
 import logging
 
+from helper.util_cache_helper import DiskCache
+from helper.util_metrics_helper import InstrumentedClient, count
+from helper.util_scheduler_helper import ollama_client
 from prompt_templates.image_prompt_template import IMAGE_DESCRIPTION_PROMPT
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-# 1. Extract images from PDF pages and return image paths with page numbers
-def extract_images_from_pdf(pdf_path: str, output_dir: Path, min_width=100, min_height=100, min_area=10000) -> List[Tuple[Path, int]]:
+class ExtractedImage(NamedTuple):
+    name: str  # <pdf stem>_page<N>_img<M>.<ext>
+    page: int
+    phash: int  # 64-bit difference hash, see image_dhash()
+    data: bytes  # original encoded bytes from the PDF, never re-encoded
+    path: Optional[Path] = None  # only set when the image was also written to disk
+
+
+# 1. Cheap image fingerprints used to skip decorative and duplicate images before any VLM call
+def image_dhash(image) -> int:
+    """64-bit difference hash: near-identical images differ in only a few bits."""
+    pixels = list(image.convert("L").resize((9, 8)).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+def image_entropy(image) -> float:
+    """Shannon entropy (bits) of the grey-level histogram; ~0 for single-colour images."""
+    histogram = image.convert("L").histogram()
+    total = sum(histogram)
+    return -sum(c / total * math.log2(c / total) for c in histogram if c)
+
+
+def group_near_duplicates(hashes: Sequence[int], max_distance: int) -> List[int]:
+    """For every hash, the index of the first earlier hash within max_distance bits (itself if none)."""
+    representatives: List[Tuple[int, int]] = []
+    exact: Dict[int, int] = {}
+    groups = []
+    for i, h in enumerate(hashes):
+        rep = exact.get(h)
+        if rep is None:
+            rep = next((j for j, rh in representatives if (h ^ rh).bit_count() <= max_distance), None)
+        if rep is None:
+            rep = i
+            representatives.append((i, h))
+        exact.setdefault(h, rep)
+        groups.append(rep)
+    return groups
+
+
+# 2. Extract images from PDF pages and return them in memory with page numbers
+def extract_page_images(doc, page, pdf_path: str, output_dir: Optional[Path] = None, min_width=100, min_height=100,
+                        min_area=10000, seen_xrefs: Optional[set] = None, stats: Optional[Counter] = None) -> List[ExtractedImage]:
     """
-    Extracts non-trivial images from a PDF file. Skips small or decorative images.
-    Returns a list of tuples: (image_path, page_number).
+    Extracts non-trivial images from one page of an already opened PDF.
+    Skips xrefs already in seen_xrefs, tiny images and low-entropy (blank, single-colour,
+    banner) images, counting each skip in stats. The original encoded bytes are kept in
+    memory; they are only written to output_dir when one is given.
+    Returns a list of ExtractedImage.
     """
     from PIL import Image
     import io
 
-    # 1.1 Ensure output directory exists
-    output_dir.mkdir(parents=True, exist_ok=True)
-    image_paths = []
+    seen_xrefs = set() if seen_xrefs is None else seen_xrefs
+    stats = Counter() if stats is None else stats
+    images = []
+    page_number = page.number + 1
 
-    # 1.2 Open the PDF file
-    doc = fitz.open(pdf_path)
+    for img_index, img in enumerate(page.get_images(full=True)):
+        xref, width, height = img[0], img[2], img[3]
+
+        # 2.1 The same xref (logo, banner) repeated on many pages is only extracted once
+        if xref in seen_xrefs:
+            stats["repeated_xref"] += 1
+            continue
+        seen_xrefs.add(xref)
+
+        # 2.2 Skip logos, stripes, or low-content images (size from xref metadata, no decode)
+        if width < min_width or height < min_height or width * height < min_area:
+            stats["too_small"] += 1
+            continue
 
-    # 1.3 Iterate through each page and extract valid images
-    for i, page in enumerate(doc):
-        for img_index, img in enumerate(page.get_images(full=True)):
-            xref = img[0]
+        try:
             base_image = doc.extract_image(xref)
             img_bytes = base_image["image"]
             ext = base_image["ext"]
 
-            try:
-                image = Image.open(io.BytesIO(img_bytes))
-                width, height = image.size
-                area = width * height
+            # 2.3 Skip blank or single-colour images, measured on a reduced-size decode
+            thumb = Image.open(io.BytesIO(img_bytes))
+            thumb.draft("L", (64, 64))  # JPEGs decode at 1/2..1/8 scale
+            thumb.thumbnail((64, 64))
+            if image_entropy(thumb) < config.IMAGE_MIN_ENTROPY:
+                stats["low_entropy"] += 1
+                continue
+
+            img_name = f"{Path(pdf_path).stem}_page{page_number}_img{img_index+1}.{ext}"
+            img_path = None
+            if output_dir is not None:
+                img_path = output_dir / img_name
+                img_path.write_bytes(img_bytes)
 
-                # 1.4 Skip logos, stripes, or low-content images
-                if width < min_width or height < min_height or area < min_area:
-                    continue
+            images.append(ExtractedImage(img_name, page_number, image_dhash(thumb), img_bytes, img_path))
+            stats["extracted"] += 1
 
-                img_name = f"{Path(pdf_path).stem}_page{i+1}_img{img_index+1}.{ext}"
-                img_path = output_dir / img_name
-                image.save(img_path)
+        except Exception as e:
+            logger.warning(f"Failed to process or save image {xref}: {e}")
+
+    return images
+
+
+def extract_images_from_pdf(pdf_path: str, output_dir: Optional[Path] = None, min_width=100, min_height=100,
+                            min_area=10000) -> List[ExtractedImage]:
+    """
+    Extracts non-trivial images from a PDF file. Skips small or decorative images.
+    Images are also written to output_dir when one is given.
+    Returns a list of ExtractedImage.
+    """
+    # 2.4 Ensure output directory exists
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    images = []
+    seen_xrefs = set()
+
+    # 2.5 Open the PDF file and extract valid images page by page
+    doc = fitz.open(pdf_path)
+    for page in doc:
+        images.extend(extract_page_images(doc, page, pdf_path, output_dir, min_width, min_height, min_area,
+                                          seen_xrefs=seen_xrefs))
 
-                image_paths.append((img_path, i + 1))  # Store image and page number
+    logger.info(f"Extracted {len(images)} filtered images from {pdf_path}")
+    return images
 
-            except Exception as e:
-                logger.warning(f"Failed to process or save image {xref}: {e}")
 
-    logger.info(f"Extracted {len(image_paths)} filtered images from {pdf_path}")
-    return image_paths
+# 3. Send image to Ollama's LLaVA model and get a descriptive caption
+@lru_cache(maxsize=None)
+def get_ollama_client() -> InstrumentedClient:
+    """One shared client (and HTTP connection pool) per process; requests are scheduled and timed."""
+    return ollama_client(f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}")
 
 
-# 2. Send image to Ollama's LLaVA model and get a descriptive caption
-def describe_image_with_llava(image_path: Path, prompt: str = IMAGE_DESCRIPTION_PROMPT) -> str:
-    client = Client(host=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}")
+def caption_cache_key(image_bytes: bytes, prompt: str, model: str) -> str:
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    return f"{model}:{prompt_hash}:{hashlib.sha256(image_bytes).hexdigest()}"
 
-    # 2.1 Read image bytes
+
+def _chat_with_retry(image_bytes: bytes, prompt: str, retries: int, backoff: float) -> str:
+    for attempt in range(retries + 1):
+        try:
+            response = get_ollama_client().chat(
+                model=config.OLLAMA_VLM_MODEL,
+                messages=[{"role": "user", "content": prompt, "images": [image_bytes]}],
+            )
+            return response['message']['content']
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def _describe_image_bytes(image_bytes: bytes, name: str, prompt: str, cache: Optional[DiskCache]) -> Optional[str]:
+    # Reuse a cached caption for identical bytes, model and prompt
+    key = caption_cache_key(image_bytes, prompt, config.OLLAMA_VLM_MODEL)
+    if cache is not None and (caption := cache.get(key)) is not None:
+        count("cache_hits_total", cache="captions")
+        return caption
+    count("cache_misses_total", cache="captions")
+
+    # Perform visual question answering using LLaVA; None (never cached) once the retries are used up
+    try:
+        caption = _chat_with_retry(image_bytes, prompt, config.OLLAMA_VLM_MAX_RETRIES, config.OLLAMA_VLM_RETRY_BACKOFF)
+    except Exception as e:
+        logger.error(f"Failed to describe image {name}: {e}")
+        count("caption_failures_total")
+        return None
+
+    if cache is not None:
+        cache.set(key, caption)
+    return caption
+
+
+def describe_image_with_llava(image_path: Path, prompt: str = IMAGE_DESCRIPTION_PROMPT,
+                              cache: Optional[DiskCache] = None) -> Optional[str]:
+    # 3.1 Read image bytes
     with open(image_path, "rb") as f:
         image_bytes = f.read()
 
-    # 2.2 Perform visual question answering using LLaVA
-    try:
-        response = client.chat(
-            model=config.OLLAMA_VLM_MODEL,
-            messages=[{"role": "user", "content": prompt, "images": [image_bytes]}],
-        )
-        return response['message']['content']
+    # 3.2 Caption (or fetch from cache) using LLaVA
+    return _describe_image_bytes(image_bytes, image_path.name, prompt, cache)
 
-    except Exception as e:
-        logger.error(f"Failed to describe image {image_path.name}: {e}")
-        return "Error processing image."
+
+# 4. Caption many images with bounded concurrency toward the Ollama server
+def describe_images_with_llava(images: Sequence[Union[ExtractedImage, Path]], prompt: str = IMAGE_DESCRIPTION_PROMPT,
+                               cache: Optional[DiskCache] = None, concurrency: Optional[int] = None) -> List[Optional[str]]:
+    """
+    Caption images on a thread pool capped at concurrency in-flight VLM requests
+    (default OLLAMA_VLM_CONCURRENCY). ExtractedImage bytes are sent as-is; paths are
+    read once. Images with identical bytes are captioned once.
+    Returns captions in the order of images; None where captioning failed.
+    """
+    concurrency = concurrency or config.OLLAMA_VLM_CONCURRENCY
+
+    # 4.1 Group images by content so duplicates share one request
+    unique: Dict[str, Tuple[bytes, str]] = {}
+    keys = []
+    for image in images:
+        if isinstance(image, ExtractedImage):
+            image_bytes, name = image.data, image.name
+        else:
+            image_bytes, name = Path(image).read_bytes(), Path(image).name
+        key = hashlib.sha256(image_bytes).hexdigest()
+        unique.setdefault(key, (image_bytes, name))
+        keys.append(key)
+
+    # 4.2 Caption the unique images; cache hits return without a request
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="caption") as pool:
+        captions = dict(zip(unique, pool.map(
+            lambda item: _describe_image_bytes(item[0], item[1], prompt, cache), unique.values()
+        )))
+
+    logger.info(f"Captioned {len(unique)} unique images for {len(keys)} requested")
+    return [captions[key] for key in keys]
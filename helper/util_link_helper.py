@@ -1,8 +1,17 @@
-import os, pathlib, requests, fitz
+import asyncio, hashlib, importlib.util, json, logging, os, pathlib, requests, shutil, fitz
 import urllib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
 
 from bs4 import BeautifulSoup
-from neo4j import GraphDatabase
+
+from helper.util_doc_helper import process_pool
+from helper.util_graph_helper import LinkGraphWriter
+from helper.util_metrics_helper import count, span
+
+logger = logging.getLogger(__name__)
 
 
 # 1. link extraction
@@ -27,114 +36,350 @@ def extract_links_from_directory(pdf_dir: str) -> dict[str, list[dict]]:
 
 
 # 2. push PDF→link into neo4j
-def push_links_to_graph(uri, user, pwd, link_map):
-    driver = GraphDatabase.driver(uri, auth=(user, pwd))
-    with driver.session(database="neo4j") as s:
-        for pdf_name, links in link_map.items():
-            s.run("MERGE (:PDF {name:$n})", n=pdf_name)
-            for l in links:
-                parsed = urllib.parse.urlparse(l["uri"])
-                domain = parsed.netloc or "unknown"
-                s.run(
-                    """
-                    MERGE (d:LinkedDoc {url:$url})
-                    ON CREATE SET d.status='unknown', d.domain=$domain
-                    WITH d
-                    MATCH (p:PDF {name:$pdf})
-                    MERGE (p)-[:CITES {page:$page}]->(d)
-                    """,
-                    url=l["uri"],
-                    pdf=pdf_name,
-                    page=l["page"],
-                    domain=domain
-                )
-    driver.close()
+def push_links_to_graph(writer: LinkGraphWriter, link_map):
+    for pdf_name, links in link_map.items():
+        writer.add_pdf(pdf_name)
+        for l in links:
+            writer.add_citation(pdf_name, l["uri"], l["page"])
+    writer.flush()
 
 
 # 3. classify URL accessibility
+def _status_label(status_code: int) -> str:
+    if status_code == 200:
+        return "accessible"
+    if status_code in (401, 403):
+        return "unauthorized"
+    if status_code == 404:
+        return "not_found"
+    return f"other_{status_code}"
+
+
 def classify_url(url, timeout=5):
     """HEAD request → 'accessible' | 'unauthorized' | 'not_found' | 'other_ddd' | 'error'."""
     try:
-        r = requests.head(url, allow_redirects=True, timeout=timeout)
-        if r.status_code == 200:
-            return "accessible"
-        if r.status_code in (401, 403):
-            return "unauthorized"
-        if r.status_code == 404:
-            return "not_found"
-        return f"other_{r.status_code}"
+        with span("http.head"):
+            r = requests.head(url, allow_redirects=True, timeout=timeout)
+        return _status_label(r.status_code)
     except Exception:
         return "error"
 
 
-def update_link_status(uri, user, pwd):
+async def classify_urls_async(urls, timeout=5, concurrency=64, per_domain=4, max_domain_errors=3) -> dict[str, str]:
+    """
+    Classify many URLs concurrently over one pooled HTTP client.
+    At most `per_domain` requests hit the same host at once. Once a host has failed
+    `max_domain_errors` times (timeouts, refused connections) its remaining URLs are
+    marked 'error' without a request.
+    Returns {url: status} with the same labels as classify_url.
+    """
+    domain_locks = defaultdict(lambda: asyncio.Semaphore(per_domain))
+    domain_errors = Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True, limits=limits) as client:
+        async def classify(url):
+            domain = urllib.parse.urlparse(url).netloc or "unknown"
+            async with domain_locks[domain]:
+                if domain_errors[domain] >= max_domain_errors:
+                    return "error"
+                try:
+                    with span("http.head"):
+                        r = await client.head(url)
+                    return _status_label(r.status_code)
+                except Exception:
+                    domain_errors[domain] += 1
+                    return "error"
+
+        statuses = await asyncio.gather(*(classify(u) for u in urls))
+
+    skipped = {d: n for d, n in domain_errors.items() if n >= max_domain_errors}
+    if skipped:
+        logger.warning(f"Fast-failed URLs on unreachable domains: {sorted(skipped)}")
+    return dict(zip(urls, statuses))
+
+
+def update_link_status(writer: LinkGraphWriter, timeout=5, concurrency=64, per_domain=4, max_domain_errors=3):
     """Set d.status for every LinkedDoc currently 'unknown'."""
-    driver = GraphDatabase.driver(uri, auth=(user, pwd))
-    with driver.session(database="neo4j") as s:
-        for rec in s.run("MATCH (d:LinkedDoc {status:'unknown'}) RETURN d.url AS url"):
-            s.run(
-                "MATCH (d:LinkedDoc {url:$u}) SET d.status=$s",
-                u=rec["url"],
-                s=classify_url(rec["url"]),
-            )
-    driver.close()
+    urls = writer.unchecked_links()
+    statuses = asyncio.run(classify_urls_async(urls, timeout, concurrency, per_domain, max_domain_errors))
+
+    for u, st in statuses.items():
+        writer.set_link_properties(u, status=st)
+    writer.flush()
 
 
 # 4. download publicly accessible documents
-def fetch_public_docs(uri, user, pwd, raw_dir: pathlib.Path):
+_CONTENT_TYPE_EXT = {
+    "application/pdf": ".pdf",
+    "text/html": ".html",
+    "application/xhtml+xml": ".html",
+    "text/plain": ".txt",
+}
+
+
+def _sniff_extension(content_type: str, head: bytes, url: str) -> str:
+    """Pick a file extension from the Content-Type header, the first bytes, then the URL."""
+    ext = _CONTENT_TYPE_EXT.get(content_type.split(";")[0].strip().lower())
+    if ext:
+        return ext
+    start = head.lstrip()[:15].lower()
+    if start.startswith(b"%pdf-"):
+        return ".pdf"
+    if start.startswith((b"<!doctype html", b"<html")):
+        return ".html"
+    suffix = pathlib.PurePosixPath(urllib.parse.urlparse(url).path).suffix.lower()
+    return suffix if suffix in (".pdf", ".html", ".htm", ".txt") else ".bin"
+
+
+def _partial_paths(raw_dir: pathlib.Path, url: str) -> tuple[pathlib.Path, pathlib.Path]:
+    """Partial download of a URL and the validators it was started with (for If-Range)."""
+    part = raw_dir / ".partial" / (hashlib.sha256(url.encode("utf-8")).hexdigest() + ".part")
+    return part, part.with_suffix(".json")
+
+
+def _drop_partial(raw_dir: pathlib.Path, url: str) -> None:
+    for path in _partial_paths(raw_dir, url):
+        path.unlink(missing_ok=True)
+
+
+def _download_one(client: httpx.Client, url: str, known: dict, raw_dir: pathlib.Path,
+                  max_bytes: int, chunk_size: int = 1 << 16) -> dict:
+    """
+    Stream one URL to raw_dir/<sha256 of content><ext> and return the LinkedDoc
+    properties to set. Partial downloads are kept under raw_dir/.partial and resumed
+    with a Range request; known ETag/Last-Modified values make the request conditional.
+    """
+    part, part_meta = _partial_paths(raw_dir, url)
+    part.parent.mkdir(parents=True, exist_ok=True)
+
+    headers = {}
+    if known.get("local_path") and pathlib.Path(known["local_path"]).exists():
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        if known.get("last_modified"):
+            headers["If-Modified-Since"] = known["last_modified"]
+
+    offset = part.stat().st_size if part.exists() and part_meta.exists() else 0
+    if offset:
+        validator = json.loads(part_meta.read_text())
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator.get("etag") or validator.get("last_modified") or ""
+        if not headers["If-Range"]:
+            offset = 0
+            del headers["Range"], headers["If-Range"]
+
+    with client.stream("GET", url, headers=headers) as r:
+        if r.status_code == 304:
+            return {}
+        if r.status_code == 416 and offset:
+            # The partial file no longer matches the server: drop it and download from the start
+            r.close()
+            _drop_partial(raw_dir, url)
+            return _download_one(client, url, known, raw_dir, max_bytes, chunk_size)
+        r.raise_for_status()
+
+        # 4.1 Resume only if the server honoured the Range request, otherwise start over
+        resume = r.status_code == 206 and offset > 0
+        length = int(r.headers.get("Content-Length", 0)) + (offset if resume else 0)
+        if max_bytes and length > max_bytes:
+            _drop_partial(raw_dir, url)
+            return {"status": "too_large", "error_message": f"{length} bytes exceeds {max_bytes}"}
+        if not resume:
+            part_meta.write_text(json.dumps({
+                "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")
+            }))
+
+        digest = hashlib.sha256()
+        head = b""
+        size = 0
+        if resume:
+            with open(part, "rb") as f:
+                head = f.read(1024)
+                f.seek(0)
+                while chunk := f.read(chunk_size):
+                    digest.update(chunk)
+            size = offset
+
+        with open(part, "ab" if resume else "wb") as f:
+            for chunk in r.iter_bytes(chunk_size):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    f.close()
+                    _drop_partial(raw_dir, url)
+                    return {"status": "too_large", "error_message": f"more than {max_bytes} bytes"}
+                if len(head) < 1024:
+                    head += chunk[:1024 - len(head)]
+                digest.update(chunk)
+                f.write(chunk)
+
+        content_type = r.headers.get("Content-Type", "")
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+
+    # 4.2 Content-addressed name: identical documents behind different URLs share one file
+    sha = digest.hexdigest()
+    fp = raw_dir / (sha + _sniff_extension(content_type, head, url))
+    os.replace(part, fp)
+    part_meta.unlink(missing_ok=True)
+    return {
+        "local_path": str(fp),
+        "content_sha256": sha,
+        "content_type": content_type,
+        "size_bytes": size,
+        "etag": etag,
+        "last_modified": last_modified,
+        "error_message": None,
+    }
+
+
+def fetch_public_docs(writer: LinkGraphWriter, raw_dir: pathlib.Path, concurrency=8, timeout=30,
+                      max_bytes=100 * 1024 * 1024, refresh=False):
+    """
+    Download every accessible LinkedDoc without a local copy, streaming to disk on
+    `concurrency` threads over one pooled client. With refresh=True, documents already
+    downloaded are revalidated with ETag/Last-Modified and only re-fetched when changed;
+    the raw file of the previous version is then removed unless another URL still uses it.
+    A download cut off mid-transfer keeps its partial file and its 'accessible' status,
+    so the next run resumes it; partial files of links no longer fetched are removed.
+    """
     raw_dir.mkdir(parents=True,exist_ok=True)
-    driver = GraphDatabase.driver(uri, auth=(user, pwd))
-    with driver.session(database="neo4j") as s:
-        q = """
-            MATCH (d:LinkedDoc {status:'accessible'})
-            WHERE d.local_path IS NULL
-            RETURN d.url AS url
-        """
-        for rec in s.run(q):
-            url = rec["url"]
+    docs = writer.links_to_fetch(refresh=refresh)
+
+    # 4.3 Partials of links that are no longer fetched (removed, re-classified, finished) are orphans
+    wanted = {_partial_paths(raw_dir, rec["url"])[0].stem for rec in docs}
+    partial_dir = raw_dir / ".partial"
+    if partial_dir.is_dir():
+        for path in partial_dir.iterdir():
+            if path.stem not in wanted:
+                path.unlink(missing_ok=True)
+                logger.info(f"Removed orphaned partial download {path.name}")
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    with httpx.Client(timeout=timeout, follow_redirects=True, limits=limits) as client:
+        def fetch(rec):
             try:
-                fn = url.split("/")[-1] or "index.html"
-                fp = raw_dir / fn
-                fp.write_bytes(requests.get(url, timeout=10).content)
-                s.run(
-                    "MATCH (d:LinkedDoc {url:$u}) SET d.local_path=$p",
-                    u=url,
-                    p=str(fp),
-                )
+                with span("http.get"):
+                    props = _download_one(client, rec["url"], rec, raw_dir, max_bytes)
+            except httpx.TransportError as e:
+                # Cut off mid-transfer: keep the link eligible, the partial file resumes next run
+                if _partial_paths(raw_dir, rec["url"])[0].exists():
+                    return {"error_message": str(e)}
+                return {"status": "fetch_error", "error_message": str(e)}
             except Exception as e:
-                s.run(
-                    "MATCH (d:LinkedDoc {url:$u}) SET d.status='fetch_error', d.error_message=$err",
-                    u=url,
-                    err=str(e))
-    driver.close()
+                _drop_partial(raw_dir, rec["url"])
+                return {"status": "fetch_error", "error_message": str(e)}
+            count("http_bytes_total", props.get("size_bytes", 0), op="download")
+            return props
+
+        superseded = set()
+        in_use = set()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="download") as pool:
+            for rec, props in zip(docs, pool.map(fetch, docs)):
+                if props:
+                    writer.set_link_properties(rec["url"], **props)
+                new_path = props.get("local_path") or rec.get("local_path")
+                if new_path:
+                    in_use.add(new_path)
+                if rec.get("local_path") and props.get("local_path") not in (None, rec["local_path"]):
+                    superseded.add(rec["local_path"])
+    writer.flush()
+
+    # 4.4 A changed document was stored under its new hash; drop the old version
+    for path in superseded - in_use:
+        pathlib.Path(path).unlink(missing_ok=True)
+        logger.info(f"Removed superseded download {path}")
 
 
 # 5. normalise raw downloads
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+
 def _html_to_text(html_path: pathlib.Path) -> str:
     soup = BeautifulSoup(
-        html_path.read_text("utf-8", errors="ignore"), "html.parser"
+        html_path.read_text("utf-8", errors="ignore"), HTML_PARSER
     )
     for tag in soup(["script", "style", "nav", "footer", "header"]):
         tag.decompose()
     return soup.get_text(separator="\n", strip=True)
 
 
-def preprocess_downloaded_docs(raw_dir: pathlib.Path, clean_dir: pathlib.Path):
-    clean_dir.mkdir(exist_ok=True)
-    for f in raw_dir.iterdir():
-        if f.suffix.lower() == ".pdf":
-            (clean_dir / f.name).write_bytes(f.read_bytes())
+def _clean_html_file(paths: tuple[pathlib.Path, pathlib.Path]) -> int:
+    src, dst = paths
+    text = _html_to_text(src)
+    dst.write_text(text, encoding="utf-8")
+    return len(text)
+
+
+def _is_up_to_date(src: pathlib.Path, dst: pathlib.Path) -> bool:
+    return dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime
+
+
+def _link_or_copy(src: pathlib.Path, dst: pathlib.Path) -> None:
+    """Hardlink when raw and clean dirs share a filesystem, copy otherwise."""
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def preprocess_downloaded_docs(raw_dir: pathlib.Path, clean_dir: pathlib.Path, workers: int = 0):
+    """
+    PDFs and plain text are hardlinked into clean_dir; HTML is converted to text on a process pool
+    (lxml parser when installed). Outputs newer than their source are skipped, and
+    outputs whose raw file is gone (a superseded version) are removed, so they drop
+    out of the next ingestion.
+    """
+    clean_dir.mkdir(parents=True, exist_ok=True)
+    html_jobs = []
+    skipped = 0
+    outputs = set()
+    for f in sorted(raw_dir.iterdir()):
+        if not f.is_file():
+            continue
+        if f.suffix.lower() in (".pdf", ".txt"):
+            dst = clean_dir / f.name
+            if dst.name in outputs:
+                # The same bytes were also served as HTML and are already converted under this name
+                continue
+            outputs.add(dst.name)
+            if _is_up_to_date(f, dst):
+                skipped += 1
+                continue
+            _link_or_copy(f, dst)
         elif f.suffix.lower() in (".html", ".htm"):
-            text = _html_to_text(f)
-            print(f"Extracted {len(text)} chars from {f.name}")
-            (clean_dir / (f.stem + ".txt")).write_text(text, encoding="utf-8")
+            dst = clean_dir / (f.stem + ".txt")
+            outputs.add(dst.name)
+            if _is_up_to_date(f, dst):
+                skipped += 1
+                continue
+            html_jobs.append((f, dst))
+
+    workers = min(workers or os.cpu_count() or 1, len(html_jobs))
+    if workers <= 1:
+        sizes = list(map(_clean_html_file, html_jobs))
+    else:
+        with process_pool(workers) as pool:
+            sizes = list(pool.map(_clean_html_file, html_jobs, chunksize=4))
+
+    for (src, _), n in zip(html_jobs, sizes):
+        print(f"Extracted {n} chars from {src.name}")
+    for stale in [f for f in clean_dir.iterdir() if f.is_file() and f.name not in outputs]:
+        stale.unlink()
+        logger.info(f"Removed {stale.name}, its download was superseded")
+    logger.info(f"Normalised {len(html_jobs)} HTML files with {HTML_PARSER}, {skipped} already up to date")
 
 
 # 6. add PDFs to neo4j
-def add_main_pdfs_to_neo4j(uri, user, pwd, docs_dir):
-    driver = GraphDatabase.driver(uri, auth=(user, pwd))
-    with driver.session(database="neo4j") as s:
-        for fn in os.listdir(docs_dir):
-            if fn.lower().endswith(".pdf"):
-                s.run("MERGE (:PDF {name:$n})", n=fn)
-    driver.close()
+def add_main_pdfs_to_neo4j(writer: LinkGraphWriter, docs_dir):
+    for fn in os.listdir(docs_dir):
+        if fn.lower().endswith(".pdf"):
+            writer.add_pdf(fn)
+    writer.flush()
+
+
+# 7. remove PDFs whose source file is gone
+def remove_pdfs_from_neo4j(writer: LinkGraphWriter, names):
+    """Delete PDF nodes and any LinkedDoc left without a citing PDF."""
+    writer.remove_pdfs(names)
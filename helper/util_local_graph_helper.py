@@ -0,0 +1,345 @@
+import json
+import logging
+import pathlib
+import re
+import sqlite3
+import threading
+import urllib.parse
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from helper.util_metrics_helper import timed
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS edges (
+    src TEXT NOT NULL, rel TEXT NOT NULL, dst TEXT NOT NULL, src_key TEXT NOT NULL,
+    weight INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (src, rel, dst)
+);
+CREATE INDEX IF NOT EXISTS edges_src_key ON edges (src_key);
+CREATE INDEX IF NOT EXISTS edges_dst ON edges (dst);
+CREATE TABLE IF NOT EXISTS pdfs (name TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS linked_docs (url TEXT PRIMARY KEY, props TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS cites (
+    pdf TEXT NOT NULL, url TEXT NOT NULL, page INTEGER NOT NULL,
+    PRIMARY KEY (pdf, url, page)
+);
+CREATE INDEX IF NOT EXISTS cites_url ON cites (url);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+# SQLite caps bound parameters per statement, so IN lists are sent in slices
+_SLICE = 500
+
+
+def _slices(items: List[Any]) -> Iterable[List[Any]]:
+    for i in range(0, len(items), _SLICE):
+        yield items[i:i + _SLICE]
+
+
+# 1. Embedded graph store: same operations as Neo4jGraphStore, no server
+class LocalGraphStore:
+    """
+    SQLite-backed knowledge graph for offline runs, CI and benchmarks.
+
+    Triplets are rows of an edge table whose primary key (src, rel, dst) doubles as the
+    forward adjacency index; src_key (lower-cased) serves case-insensitive seed lookup
+    like Neo4jGraphStore's toLower match. A keyword without an exact match falls back to
+    up to `fuzzy_matches` subjects containing all of its words, shortest first (the
+    Neo4j store uses its full-text index for this). get_rel_map expands hop by hop, one
+    query per hop for the whole frontier, following at most `fanout` edges per node,
+    heaviest first (weight = number of units stating the triplet). The PDF /
+    LinkedDoc / CITES tables and the graph version live in the same file.
+    There is no query language: Cypher-based features (e.g. KnowledgeGraphQueryEngine)
+    need GRAPH_BACKEND = "neo4j".
+    """
+
+    def __init__(self, path: pathlib.Path, fanout: int = 10, fuzzy_matches: int = 2):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fanout = fanout
+        self.fuzzy_matches = fuzzy_matches
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        # Graph files written before edges had weights
+        if "weight" not in {row[1] for row in self.conn.execute("PRAGMA table_info(edges)")}:
+            self.conn.execute("ALTER TABLE edges ADD COLUMN weight INTEGER NOT NULL DEFAULT 1")
+        self.conn.commit()
+
+    @property
+    def client(self) -> sqlite3.Connection:
+        return self.conn
+
+    # 1.1 Triplets
+    def get(self, subj: str) -> List[List[str]]:
+        with self.lock:
+            rows = self.conn.execute("SELECT rel, dst FROM edges WHERE src = ?", (subj,)).fetchall()
+        return [list(row) for row in rows]
+
+    def upsert_triplet(self, subj: str, rel: str, obj: str) -> None:
+        self.upsert_triplets([(subj, rel, obj)])
+
+    def upsert_triplets(self, triplets: Iterable[Tuple]) -> None:
+        """(subj, rel, obj) or (subj, rel, obj, weight); a weight replaces the stored one, None keeps it."""
+        # Relation types are stored the way Neo4jGraphStore stores them
+        rows = [(s, r.replace(" ", "_").upper(), o, s.lower(), w[0] if w else None) for s, r, o, *w in triplets]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO edges (src, rel, dst, src_key, weight) VALUES (?1, ?2, ?3, ?4, COALESCE(?5, 1)) "
+                "ON CONFLICT (src, rel, dst) DO UPDATE SET weight = COALESCE(?5, weight)",
+                rows,
+            )
+            self.conn.commit()
+
+    def delete(self, subj: str, rel: str, obj: str) -> None:
+        self.delete_triplets([(subj, rel, obj)])
+
+    def delete_triplets(self, triplets: Iterable[Tuple[str, str, str]]) -> None:
+        # Entities only exist as edge endpoints here, so nothing is left behind
+        rows = [(s, r.replace(" ", "_").upper(), o) for s, r, o in triplets]
+        with self.lock:
+            self.conn.executemany("DELETE FROM edges WHERE src = ? AND rel = ? AND dst = ?", rows)
+            self.conn.commit()
+
+    # 1.2 Bounded multi-hop expansion
+    def _neighbours(self, nodes: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+        adjacency: Dict[str, List[Tuple[str, str]]] = {}
+        with self.lock:
+            for part in _slices(nodes):
+                rows = self.conn.execute(
+                    f"""
+                    SELECT src, rel, dst FROM (
+                        SELECT src, rel, dst, ROW_NUMBER() OVER (PARTITION BY src ORDER BY weight DESC, rowid) AS n
+                        FROM edges WHERE src IN ({','.join('?' * len(part))})
+                    ) WHERE n <= ?
+                    """,
+                    (*part, self.fanout),
+                ).fetchall()
+                for src, rel, dst in rows:
+                    adjacency.setdefault(src, []).append((rel, dst))
+        return adjacency
+
+    def _fuzzy_seeds(self, key: str) -> List[str]:
+        """Subjects whose key contains every word of key; a table scan, only for keywords without an exact match."""
+        terms = re.findall(r"\w+", key)
+        if not terms:
+            return []
+        # "_" is a LIKE wildcard but also a word character
+        patterns = ["%" + t.replace("_", "\\_") + "%" for t in terms]
+        where = " AND ".join(["src_key LIKE ? ESCAPE '\\'"] * len(terms))
+        rows = self.conn.execute(
+            f"SELECT DISTINCT src FROM edges WHERE {where} ORDER BY length(src), src LIMIT ?",
+            (*patterns, self.fuzzy_matches),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    @timed("graph.rel_map", backend="local")
+    def get_rel_map(self, subjs: Optional[List[str]] = None, depth: int = 2,
+                    limit: int = 30) -> Dict[str, List[List[str]]]:
+        """
+        Same shape as Neo4jGraphStore.get_rel_map: {subject: [[REL, obj, REL2, obj2, ...], ...]}.
+        Every node follows at most `fanout` edges; `limit` caps the paths returned, in seed order.
+        """
+        if not subjs:
+            return {}
+        keys = list(dict.fromkeys(s.lower() for s in subjs))
+        seeds: List[str] = []
+        with self.lock:
+            for part in _slices(keys):
+                seeds.extend(r[0] for r in self.conn.execute(
+                    f"SELECT DISTINCT src FROM edges WHERE src_key IN ({','.join('?' * len(part))})", part
+                ))
+            if self.fuzzy_matches:
+                matched = {seed.lower() for seed in seeds}
+                for key in keys:
+                    if key not in matched:
+                        seeds.extend(s for s in self._fuzzy_seeds(key) if s not in seeds)
+
+        # Paths are (nodes on the path, flattened rels); a path stops growing when its end has no new neighbour
+        paths = {seed: [([seed], [])] for seed in seeds}
+        for hop in range(max(1, depth)):
+            ends = list({nodes[-1] for seed_paths in paths.values() for nodes, flat in seed_paths
+                         if len(flat) == 2 * hop})
+            adjacency = self._neighbours(ends)
+            for seed, seed_paths in paths.items():
+                grown = []
+                for nodes, flat in seed_paths:
+                    nexts = [(rel, dst) for rel, dst in adjacency.get(nodes[-1], []) if dst not in nodes]
+                    if not nexts or len(flat) < 2 * hop:
+                        grown.append((nodes, flat))
+                        continue
+                    grown.extend((nodes + [dst], flat + [rel, dst]) for rel, dst in nexts)
+                paths[seed] = grown
+        rel_map: Dict[str, List[List[str]]] = {}
+        left = limit
+        for seed, seed_paths in paths.items():
+            flats = [flat for _, flat in seed_paths if flat][:left]
+            if flats:
+                rel_map[seed] = flats
+                left -= len(flats)
+            if left <= 0:
+                break
+        return rel_map
+
+    # 1.3 Graph version stamp (GraphMeta.version in Neo4j)
+    def graph_version(self) -> int:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'graph_version'").fetchone()
+        return row[0] if row else 0
+
+    def bump_graph_version(self) -> int:
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('graph_version', 1) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+            )
+            self.conn.commit()
+            return self.conn.execute("SELECT value FROM meta WHERE key = 'graph_version'").fetchone()[0]
+
+    # 1.4 Rest of the llama_index GraphStore protocol
+    def get_schema(self, refresh: bool = False) -> str:
+        with self.lock:
+            rels = [r[0] for r in self.conn.execute("SELECT DISTINCT rel FROM edges ORDER BY rel")]
+        return f"Node labels: Entity\nRelationship types: {', '.join(rels)}"
+
+    def persist(self, persist_path: str, fs=None) -> None:
+        """Every write is already committed to the SQLite file."""
+
+
+_stores: Dict[str, LocalGraphStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_local_graph(path: str, fanout: int = 10, fuzzy_matches: int = 2) -> LocalGraphStore:
+    """One store (and SQLite connection) per file for the whole process, like get_driver."""
+    key = str(pathlib.Path(path).resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = LocalGraphStore(pathlib.Path(path), fanout=fanout, fuzzy_matches=fuzzy_matches)
+        return _stores[key]
+
+
+# 2. Buffered writer with the GraphWriter interface, over a LocalGraphStore
+class LocalGraphWriter:
+    def __init__(self, store: LocalGraphStore, batch_size: int = 1000):
+        self.store = store
+        self.batch_size = batch_size
+        self._pdfs: List[str] = []
+        self._citations: List[Tuple[str, str, int, str]] = []
+        self._link_updates: List[Tuple[str, Dict[str, Any]]] = []
+        self._triplets: List[Tuple[str, str, str, Optional[int]]] = []
+
+    # 2.1 Schema and connectivity (nothing to do; the tables exist once the file is open)
+    def ensure_schema(self) -> None:
+        pass
+
+    def verify_connectivity(self) -> None:
+        with self.store.lock:
+            self.store.conn.execute("SELECT 1")
+
+    # 2.2 Buffered writes
+    def add_pdf(self, name: str) -> None:
+        self._pdfs.append(name)
+        self._maybe_flush()
+
+    def add_citation(self, pdf_name: str, url: str, page: int) -> None:
+        domain = urllib.parse.urlparse(url).netloc or "unknown"
+        self._citations.append((pdf_name, url, page, domain))
+        self._maybe_flush()
+
+    def set_link_properties(self, url: str, **props: Any) -> None:
+        self._link_updates.append((url, props))
+        self._maybe_flush()
+
+    def add_triplet(self, subj: str, rel: str, obj: str, weight: Optional[int] = None) -> None:
+        self._triplets.append((subj, rel, obj, weight))
+        self._maybe_flush()
+
+    def delete_triplets(self, triplets: Iterable[Tuple[str, str, str]]) -> int:
+        """Same contract as GraphWriter.delete_triplets."""
+        triplets = list(triplets)
+        if triplets:
+            self.flush()
+            self.store.delete_triplets(triplets)
+        return len(triplets)
+
+    def _maybe_flush(self) -> None:
+        if len(self._pdfs) + len(self._citations) + len(self._link_updates) + len(self._triplets) >= self.batch_size:
+            self.flush()
+
+    @timed("graph.write", backend="local")
+    def flush(self) -> None:
+        pdfs, citations, link_updates = self._pdfs, self._citations, self._link_updates
+        self._pdfs, self._citations, self._link_updates = [], [], []
+        if pdfs or citations or link_updates:
+            with self.store.lock:
+                conn = self.store.conn
+                conn.executemany("INSERT OR IGNORE INTO pdfs (name) VALUES (?)",
+                                 [(p,) for p in pdfs] + [(c[0],) for c in citations])
+                conn.executemany(
+                    "INSERT OR IGNORE INTO linked_docs (url, props) VALUES (?, ?)",
+                    [(url, json.dumps({"status": "unknown", "domain": domain})) for _, url, _, domain in citations],
+                )
+                conn.executemany("INSERT OR IGNORE INTO cites (pdf, url, page) VALUES (?, ?, ?)",
+                                 [c[:3] for c in citations])
+                # json_patch merges like SET d += props, including None removing a property
+                conn.executemany("UPDATE linked_docs SET props = json_patch(props, ?) WHERE url = ?",
+                                 [(json.dumps(props), url) for url, props in link_updates])
+                conn.commit()
+        if self._triplets:
+            triplets, self._triplets = self._triplets, []
+            self.store.upsert_triplets(triplets)
+        else:
+            triplets = []
+        if pdfs or citations or link_updates or triplets:
+            logger.info(
+                f"Flushed {len(pdfs)} PDFs, {len(citations)} citations, {len(link_updates)} link updates, "
+                f"{len(triplets)} triplets"
+            )
+
+    # 2.3 Reads used by the link pipeline
+    def unchecked_links(self) -> List[str]:
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                "SELECT url FROM linked_docs WHERE json_extract(props, '$.status') = 'unknown'"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def links_to_fetch(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                "SELECT url, props FROM linked_docs WHERE json_extract(props, '$.status') = 'accessible'"
+            ).fetchall()
+        docs = []
+        for url, props in rows:
+            props = json.loads(props)
+            if refresh or props.get("local_path") is None:
+                docs.append({"url": url, "local_path": props.get("local_path"), "etag": props.get("etag"),
+                             "last_modified": props.get("last_modified")})
+        return docs
+
+    def remove_pdfs(self, names: Iterable[str]) -> None:
+        names = list(names)
+        with self.store.lock:
+            for part in _slices(names):
+                marks = ",".join("?" * len(part))
+                self.store.conn.execute(f"DELETE FROM pdfs WHERE name IN ({marks})", part)
+                self.store.conn.execute(f"DELETE FROM cites WHERE pdf IN ({marks})", part)
+            self.store.conn.execute("DELETE FROM linked_docs WHERE url NOT IN (SELECT url FROM cites)")
+            self.store.conn.commit()
+
+    # 2.4 Graph version
+    def graph_version(self) -> int:
+        return self.store.graph_version()
+
+    def bump_graph_version(self) -> int:
+        return self.store.bump_graph_version()
+
+    def __enter__(self) -> "LocalGraphWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.flush()
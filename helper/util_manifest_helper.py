@@ -0,0 +1,213 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+# 1. Content hashing
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_text(text: str) -> str:
+    return sha256_bytes(text.encode("utf-8"))
+
+
+def sha256_file(path: pathlib.Path, chunk_size: int = 1 << 20) -> str:
+    """Hash a file in fixed-size chunks so large PDFs never sit fully in memory."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# 2. Persistent ingestion manifest
+class IngestionManifest:
+    """
+    Records which source files and units (pages, images, linked docs) have already
+    been ingested, keyed by content hash, together with the triplets each unit wrote
+    to the graph.
+
+    Layout on disk:
+        {"version": 1,
+         "files": {"pdf/a.pdf": {"sha256": "...",
+                                 "units": {"page=1": {"hash": "...", "triplets": [[s, r, o], ...]}}}}}
+
+    A file's sha256 is only recorded once all of its units are ingested, so an
+    interrupted run picks the file up again and skips the units already done.
+
+    save() appends the changes since the previous save to a journal next to the file
+    (<path>.log, one JSON change per line), so a commit costs what it changed rather
+    than the whole manifest. The journal is replayed on open and folded back into the
+    JSON file once it outgrows it.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.journal_path = self.path.with_suffix(self.path.suffix + ".log")
+        self._files: Dict[str, dict] = {}
+        self._changes: List[list] = []  # not yet in the journal
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") == MANIFEST_VERSION:
+                self._files = data.get("files", {})
+            else:
+                logger.warning(f"Ignoring manifest {self.path} with unsupported version {data.get('version')}")
+        self._replay_journal()
+
+        # 2.1 Reference count of every triplet across all units
+        self._refs = Counter(
+            tuple(t)
+            for entry in self._files.values()
+            for unit in entry.get("units", {}).values()
+            for t in unit.get("triplets", [])
+        )
+        self._touched = set()  # triplets whose count changed since the last drain_changes()
+
+    # 2.2 File level
+    def is_file_unchanged(self, file_key: str, digest: str) -> bool:
+        entry = self._files.get(file_key)
+        return entry is not None and entry.get("sha256") == digest
+
+    def record_file(self, file_key: str, digest: str) -> None:
+        self._apply(["file", file_key, digest])
+
+    def missing_files(self, present_keys: Iterable[str], prefix: str = "") -> List[str]:
+        """File keys (optionally under prefix) that are in the manifest but no longer on disk."""
+        present = set(present_keys)
+        return [k for k in self._files if k.startswith(prefix) and k not in present]
+
+    def forget_file(self, file_key: str) -> List[Tuple[str, str, str]]:
+        """Drop a file and all of its units; return the triplets nobody references any more."""
+        entry = self._files.get(file_key)
+        if entry is None:
+            return []
+        self._apply(["forget", file_key])
+        return self._release([t for u in entry.get("units", {}).values() for t in u.get("triplets", [])])
+
+    # 2.3 Unit level
+    def unit_ids(self, file_key: str) -> List[str]:
+        return list(self._files.get(file_key, {}).get("units", {}))
+
+    def diff_units(self, file_key: str, unit_hashes: Dict[str, str]) -> Tuple[List[str], List[str]]:
+        """
+        Compare the current units of a file with the manifest.
+        Returns (changed_or_new_unit_ids, stale_unit_ids).
+        """
+        known = self._files.get(file_key, {}).get("units", {})
+        changed = [uid for uid, h in unit_hashes.items() if known.get(uid, {}).get("hash") != h]
+        stale = [uid for uid in known if uid not in unit_hashes]
+        return changed, stale
+
+    def record_unit(self, file_key: str, unit_id: str, content_hash: str,
+                    triplets: List[List[str]]) -> List[Tuple[str, str, str]]:
+        """Store a unit's new triplets; return old triplets that lost their last reference."""
+        old = self._files.get(file_key, {}).get("units", {}).get(unit_id, {}).get("triplets", [])
+        self._apply(["unit", file_key, unit_id, content_hash, [list(t) for t in triplets]])
+        self._refs.update(tuple(t) for t in triplets)
+        self._touched.update(tuple(t) for t in triplets)
+        return self._release(old)
+
+    def release_units(self, file_key: str, unit_ids: Iterable[str]) -> List[Tuple[str, str, str]]:
+        """Remove units from a file; return the triplets nobody references any more."""
+        units = self._files.get(file_key, {}).get("units", {})
+        unit_ids = [uid for uid in unit_ids if uid in units]
+        released = [t for uid in unit_ids for t in units[uid].get("triplets", [])]
+        if unit_ids:
+            self._apply(["release", file_key, unit_ids])
+        return self._release(released)
+
+    def _release(self, triplets: Iterable[List[str]]) -> List[Tuple[str, str, str]]:
+        orphans = []
+        for t in map(tuple, triplets):
+            self._touched.add(t)
+            self._refs[t] -= 1
+            if self._refs[t] <= 0:
+                del self._refs[t]
+                orphans.append(t)
+        return orphans
+
+    def drain_changes(self) -> Tuple[Dict[Tuple[str, str, str], int], List[Tuple[str, str, str]]]:
+        """
+        Triplets whose count changed since the last call: ({triplet: units now producing it},
+        [triplets nobody produces any more]). The counts are the graph's edge weights.
+        """
+        weights = {t: self._refs[t] for t in self._touched if t in self._refs}
+        orphans = [t for t in self._touched if t not in self._refs]
+        self._touched.clear()
+        return weights, orphans
+
+    # 2.4 Changes: applied in memory and queued for the journal
+    def _apply(self, change: list) -> None:
+        _apply_change(self._files, change)
+        self._changes.append(change)
+
+    def _replay_journal(self) -> None:
+        if not self.journal_path.exists():
+            return
+        good = 0  # bytes of complete, decodable lines
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated line")
+                    change = json.loads(line)
+                except ValueError:
+                    # Only the last line can be torn by a crash mid-write
+                    break
+                _apply_change(self._files, change)
+                good += len(line)
+        if good < self.journal_path.stat().st_size:
+            # Cut the torn tail, or the next save would append onto it and hide everything after
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good)
+
+    # 2.5 Persistence: journal appends, folded into the JSON file (atomic replace) when it grows
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self._changes:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(change) + "\n" for change in self._changes)
+            self._changes.clear()
+        if not self.journal_path.exists():
+            if not self.path.exists():
+                self.compact()
+            return
+        snapshot = self.path.stat().st_size if self.path.exists() else 0
+        if self.journal_path.stat().st_size > max(snapshot, 1 << 20):
+            self.compact()
+
+    def compact(self) -> None:
+        """Write the whole manifest to its JSON file and empty the journal."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"version": MANIFEST_VERSION, "files": self._files}), encoding="utf-8")
+        os.replace(tmp, self.path)
+        # Replaying the old journal over the new file would be harmless: every change is idempotent
+        self.journal_path.unlink(missing_ok=True)
+        self._changes.clear()
+
+
+def _apply_change(files: Dict[str, dict], change: list) -> None:
+    kind, file_key, *args = change
+    if kind == "file":
+        files.setdefault(file_key, {"units": {}})["sha256"] = args[0]
+    elif kind == "unit":
+        unit_id, content_hash, triplets = args
+        files.setdefault(file_key, {"units": {}}).setdefault("units", {})[unit_id] = {
+            "hash": content_hash, "triplets": triplets
+        }
+    elif kind == "release":
+        units = files.get(file_key, {}).get("units", {})
+        for uid in args[0]:
+            units.pop(uid, None)
+    elif kind == "forget":
+        files.pop(file_key, None)
@@ -0,0 +1,315 @@
+import atexit
+import cProfile
+import functools
+import json
+import logging
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from ollama import AsyncClient, Client
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Upper bounds (seconds) of the span histogram buckets: local work is in ms, LLM calls in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+# 1. In-process registry of timed spans and counters
+class _Histogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self, n_buckets: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * n_buckets
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _prom_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe spans (latency histograms keyed by span name + labels), counters and
+    gauges. Spans cover pipeline stages and every external call (Ollama, graph backend,
+    HTTP); counters carry cache hits/misses, tokens and bytes; gauges hold current
+    levels such as scheduler queue depths.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._spans: Dict[Tuple[str, LabelKey], _Histogram] = {}
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._gauges: Dict[Tuple[str, LabelKey], float] = {}
+        self.started_at = time.time()
+
+    # 1.1 Recording
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._spans.get(key)
+            if hist is None:
+                hist = self._spans[key] = _Histogram(len(self.buckets))
+            hist.count += 1
+            hist.total += seconds
+            hist.max = max(hist.max, seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist.buckets[i] += 1
+                    break
+
+    def count(self, name: str, value: float = 1, **labels: Any) -> None:
+        if not value:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    @contextmanager
+    def span(self, name: str, **labels: Any) -> Iterator[None]:
+        """Time the block; a raised exception also counts span_errors_total for the span."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.count("span_errors_total", span=name, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels: Any):
+        """Decorator form of span()."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._gauges.clear()
+            self.started_at = time.time()
+
+    # 1.2 Export
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly view: per span count/total/mean/max seconds, counter and gauge values."""
+        with self._lock:
+            spans = [
+                {"span": name, **dict(key), "count": h.count, "seconds": round(h.total, 6),
+                 "mean": round(h.total / h.count, 6), "max": round(h.max, 6)}
+                for (name, key), h in sorted(self._spans.items())
+            ]
+            counters = [{"counter": name, **dict(key), "value": v} for (name, key), v in sorted(self._counters.items())]
+            gauges = [{"gauge": name, **dict(key), "value": v} for (name, key), v in sorted(self._gauges.items())]
+        return {"started_at": self.started_at, "uptime_seconds": round(time.time() - self.started_at, 3),
+                "spans": spans, "counters": counters, "gauges": gauges}
+
+    def to_prometheus(self, prefix: str = "pipeline") -> str:
+        """Prometheus text exposition: one histogram for all spans, one counter or gauge per name."""
+        lines = [f"# HELP {prefix}_span_seconds Duration of pipeline stages and external calls.",
+                 f"# TYPE {prefix}_span_seconds histogram"]
+        with self._lock:
+            for (name, key), h in sorted(self._spans.items()):
+                span_label = (("span", name),)
+                cumulative = 0
+                for bound, n in zip(self.buckets, h.buckets):
+                    cumulative += n
+                    lines.append(f"{prefix}_span_seconds_bucket{_prom_labels(span_label + key, (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{prefix}_span_seconds_bucket{_prom_labels(span_label + key, (('le', '+Inf'),))} {h.count}")
+                lines.append(f"{prefix}_span_seconds_sum{_prom_labels(span_label + key)} {h.total}")
+                lines.append(f"{prefix}_span_seconds_count{_prom_labels(span_label + key)} {h.count}")
+
+            typed = set()
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                for (name, key), v in sorted(values.items()):
+                    metric = f"{prefix}_{name}"
+                    if metric not in typed:
+                        typed.add(metric)
+                        lines.append(f"# TYPE {metric} {kind}")
+                    lines.append(f"{metric}{_prom_labels(key)} {v}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: pathlib.Path) -> None:
+        """*.prom / *.txt get Prometheus text (node-exporter textfile format), anything else JSON."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix in (".prom", ".txt"):
+            text = self.to_prometheus()
+        else:
+            text = json.dumps(self.snapshot(), indent=2)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(text, encoding="utf-8")
+        tmp.replace(path)
+
+
+METRICS = MetricsRegistry()
+span = METRICS.span
+count = METRICS.count
+gauge = METRICS.gauge
+observe = METRICS.observe
+timed = METRICS.timed
+
+
+def export_metrics_at_exit(path: str) -> None:
+    """Write the registry to path when the process exits; empty path = no export."""
+    if path:
+        atexit.register(lambda: METRICS.write(pathlib.Path(path)))
+
+
+# 2. Consecutive stages of a flat script: starting one ends the previous
+class StageClock:
+    def __init__(self, registry: MetricsRegistry = METRICS):
+        self.registry = registry
+        self.durations: Dict[str, float] = {}
+        self._current: Optional[Tuple[str, float]] = None
+
+    def start(self, stage: str) -> None:
+        self.stop()
+        self._current = (stage, time.perf_counter())
+
+    def stop(self) -> None:
+        if self._current is not None:
+            stage, start = self._current
+            seconds = time.perf_counter() - start
+            self.registry.observe("stage", seconds, stage=stage)
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+            logger.info(f"Stage {stage} took {seconds:.2f}s")
+            self._current = None
+
+    def report(self) -> str:
+        total = sum(self.durations.values()) or 1e-9
+        parts = ", ".join(f"{stage} {s:.1f}s ({s / total:.0%})" for stage, s in self.durations.items())
+        return f"Stages: {parts}"
+
+
+# 3. Ollama clients that time every chat / generate / embed request
+def _count_tokens(response: Any, labels: Dict[str, Any]) -> None:
+    count("ollama_tokens_total", getattr(response, "prompt_eval_count", None) or 0, kind="prompt", **labels)
+    count("ollama_tokens_total", getattr(response, "eval_count", None) or 0, kind="completion", **labels)
+
+
+def _call_labels(args: tuple, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return {"model": kwargs.get("model", args[0] if args else "")}
+
+
+def _timed_stream(endpoint: str, labels: Dict[str, Any], call) -> Iterator[Any]:
+    """The span covers the whole stream; the first chunk is also timed on its own."""
+    start = time.perf_counter()
+    with span(f"ollama.{endpoint}", **labels):
+        first = True
+        for part in call():
+            if first:
+                observe(f"ollama.{endpoint}.first_chunk", time.perf_counter() - start, **labels)
+                first = False
+            if getattr(part, "done", False):
+                _count_tokens(part, labels)
+            yield part
+
+
+async def _atimed_stream(endpoint: str, labels: Dict[str, Any], call):
+    start = time.perf_counter()
+    with span(f"ollama.{endpoint}", **labels):
+        first = True
+        async for part in await call():
+            if first:
+                observe(f"ollama.{endpoint}.first_chunk", time.perf_counter() - start, **labels)
+                first = False
+            if getattr(part, "done", False):
+                _count_tokens(part, labels)
+            yield part
+
+
+class InstrumentedClient(Client):
+    """ollama.Client recording ollama.<endpoint> spans, first-chunk latency and token counters."""
+
+    def _observed(self, endpoint: str, method, args: tuple, kwargs: Dict[str, Any]):
+        labels = _call_labels(args, kwargs)
+        call = functools.partial(method, self, *args, **kwargs)
+        if kwargs.get("stream"):
+            return _timed_stream(endpoint, labels, call)
+        with span(f"ollama.{endpoint}", **labels):
+            response = call()
+        _count_tokens(response, labels)
+        return response
+
+    def chat(self, *args, **kwargs):
+        return self._observed("chat", Client.chat, args, kwargs)
+
+    def generate(self, *args, **kwargs):
+        return self._observed("generate", Client.generate, args, kwargs)
+
+    def embed(self, *args, **kwargs):
+        return self._observed("embed", Client.embed, args, kwargs)
+
+    def embeddings(self, *args, **kwargs):
+        return self._observed("embed", Client.embeddings, args, kwargs)
+
+
+class InstrumentedAsyncClient(AsyncClient):
+    """Async counterpart of InstrumentedClient."""
+
+    async def _observed(self, endpoint: str, method, args: tuple, kwargs: Dict[str, Any]):
+        labels = _call_labels(args, kwargs)
+        call = functools.partial(method, self, *args, **kwargs)
+        if kwargs.get("stream"):
+            return _atimed_stream(endpoint, labels, call)
+        with span(f"ollama.{endpoint}", **labels):
+            response = await call()
+        _count_tokens(response, labels)
+        return response
+
+    async def chat(self, *args, **kwargs):
+        return await self._observed("chat", AsyncClient.chat, args, kwargs)
+
+    async def generate(self, *args, **kwargs):
+        return await self._observed("generate", AsyncClient.generate, args, kwargs)
+
+    async def embed(self, *args, **kwargs):
+        return await self._observed("embed", AsyncClient.embed, args, kwargs)
+
+    async def embeddings(self, *args, **kwargs):
+        return await self._observed("embed", AsyncClient.embeddings, args, kwargs)
+
+
+# 4. Opt-in cProfile of the main thread
+def start_profiler(path: str) -> Optional[cProfile.Profile]:
+    """
+    Profile the calling thread until exit and dump pstats to path (open with
+    `python -m pstats` or snakeviz). Empty path = off. Worker threads and processes
+    are not covered; sample the whole process with py-spy for those.
+    """
+    if not path:
+        return None
+    profiler = cProfile.Profile()
+
+    def dump():
+        profiler.disable()
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+        logger.warning(f"Wrote cProfile stats to {path}")
+
+    atexit.register(dump)
+    profiler.enable()
+    return profiler
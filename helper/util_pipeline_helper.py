@@ -0,0 +1,366 @@
+import logging
+import os
+import pathlib
+import queue
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from llama_index.core import Document
+
+from helper.util_cache_helper import DiskCache
+from helper.util_canonical_helper import EntityCanonicalizer, dedupe_triplets
+from helper.util_doc_helper import iter_parse_pdfs, start_process_pool, unit_id
+from helper.util_image_helper import ExtractedImage, describe_images_with_llava, group_near_duplicates
+from helper.util_manifest_helper import IngestionManifest, sha256_bytes, sha256_text
+from helper.util_metrics_helper import count, observe, span
+from helper.util_retrieval_helper import delete_vector_documents, upsert_vector_document
+from helper.util_triplet_helper import TripletExtractor
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+_POLL_SECONDS = 0.1
+
+# A stage turns the items of its input into output items: (name, fn, heartbeat).
+# With heartbeat, fn also receives None whenever its input queue has nothing ready.
+Stage = Tuple[str, Callable[[Iterable], Iterable], bool]
+
+
+# 1. Generator stages on threads joined by bounded queues
+def _queue_items(q: queue.Queue, stop: threading.Event, heartbeat: bool) -> Iterator:
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            if heartbeat:
+                yield None
+            continue
+        if item is _END:
+            return
+        yield item
+
+
+def _put(q: queue.Queue, item, stop: threading.Event, stage: str) -> bool:
+    """Blocking put that gives up once the pipeline stops; time spent blocked is backpressure."""
+    try:
+        q.put_nowait(item)
+        return True
+    except queue.Full:
+        pass
+    count("ingest_backpressure_total", stage=stage)
+    start = time.perf_counter()
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            observe("ingest.backpressure", time.perf_counter() - start, stage=stage)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def run_stages(source: Iterable, stages: Sequence[Stage], queue_size: int) -> Iterator:
+    """
+    Run every stage on its own thread, each feeding the next through a queue of at
+    most queue_size items, and yield the last stage's output to the caller. A full
+    queue blocks the stage before it, so the slowest stage sets the pace and memory
+    stays bounded. The first error in any stage stops the pipeline and is re-raised
+    here; closing the generator early stops the stages after their current item.
+    """
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    threads = []
+
+    items = iter(source)
+    for name, fn, heartbeat in stages:
+        out_q = queue.Queue(maxsize=max(1, queue_size))
+
+        def work(fn=fn, items=items, out_q=out_q, name=name):
+            try:
+                for item in fn(items):
+                    if not _put(out_q, item, stop, name):
+                        return
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                _put(out_q, _END, stop, name)
+
+        threads.append(threading.Thread(target=work, name=f"ingest-{name}", daemon=True))
+        next_heartbeat = stages[len(threads)][2] if len(threads) < len(stages) else False
+        items = _queue_items(out_q, stop, next_heartbeat)
+
+    for thread in threads:
+        thread.start()
+    try:
+        yield from items
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+# 2. Streaming ingestion: parse -> caption -> extract triplets -> write
+@dataclass
+class IngestSource:
+    file_key: str  # "pdf/<name>" or "linked/<name>"
+    path: pathlib.Path
+    digest: str
+    extract_images: bool = False
+
+
+@dataclass
+class _ParsedFile:
+    source: IngestSource
+    units: Dict[str, Tuple[str, Optional[Document]]]  # unit_id -> (content_hash, Document; None for images)
+    images: Dict[str, ExtractedImage] = field(default_factory=dict)  # unit_id -> image to caption
+
+
+class StreamingIngestion:
+    """
+    Ingests files one at a time through bounded stages instead of parsing the whole
+    corpus up front: PDFs are parsed on the process pool a few files ahead, images are
+    captioned, new or changed units are sent to triplet extraction, and the writer
+    (the calling thread) upserts chunk embeddings. Memory is bounded by the queue sizes,
+    not the corpus, and the LLM is kept busy while parsing continues.
+
+    Resume works as in the batch path: a unit enters the manifest once its triplets
+    are flushed, and a file's digest only once all of its units are. The vector index
+    is rewritten whole on every save, so it and the manifest are saved every
+    `persist_interval` seconds and at the end; a crashed run redoes the units
+    committed since the last save. Triplets are written at commit time:
+    entity names are canonicalized, repeats dropped, and each edge gets as weight the
+    number of units in the manifest that state it.
+    """
+
+    def __init__(self, manifest: IngestionManifest, graph_writer, vector_index,
+                 extractor: TripletExtractor, persist_dir: str, layout_options: Dict,
+                 image_dir: Optional[pathlib.Path] = None, caption_cache: Optional[DiskCache] = None,
+                 phash_max_distance: int = 4, workers: int = 0, pages_per_task: int = 50,
+                 parse_ahead: int = 2, queue_size: int = 64, commit_every: int = 50,
+                 canonicalizer: Optional[EntityCanonicalizer] = None, persist_interval: float = 60.0):
+        self.manifest = manifest
+        self.graph_writer = graph_writer
+        self.vector_index = vector_index
+        self.extractor = extractor
+        self.persist_dir = persist_dir
+        self.layout_options = layout_options
+        self.image_dir = image_dir
+        self.caption_cache = caption_cache
+        self.phash_max_distance = phash_max_distance
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.parse_ahead = parse_ahead
+        self.queue_size = queue_size
+        self.commit_every = commit_every
+        self.canonicalizer = canonicalizer
+        self.persist_interval = persist_interval
+
+        self.stats = Counter()  # image prefilter counters, boilerplate blocks, files, units and triplets
+        # The parse and prepare threads count into their own Counters, merged into stats when run() ends
+        self._stage_stats = {"parse": Counter(), "prepare": Counter()}
+        self._pool = None  # parse workers, started before the stage threads
+        self._persisted_at = time.monotonic()
+        # Manifest and vector index are touched by the caption stage (stale units) and the writer
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Tuple[str, str, str, Document]] = {}  # ref_doc_id -> (file_key, unit_id, hash, doc)
+        self._units_left = Counter()
+        self._digests: Dict[str, str] = {}
+        self._incomplete = set()  # files with units skipped this run (failed captions or extraction); digest not recorded
+        self._captioned: List[Tuple[int, str]] = []  # (phash, caption) of every image captioned so far
+
+    # 2.1 Parse: PDFs a few files ahead on the process pool, text files as one unit
+    def _parse(self, sources: Iterable[IngestSource]) -> Iterator[_ParsedFile]:
+        sources = list(sources)
+        by_path = {str(s.path): s for s in sources}
+        for source in sources:
+            if source.path.suffix.lower() != ".pdf":
+                text = source.path.read_text(encoding="utf-8")
+                yield _ParsedFile(source, {"text": (sha256_text(text), Document(
+                    text=text,
+                    metadata={"source": "linked_doc", "filename": source.path.name, "type": "text"}
+                ))})
+
+        for with_images in (True, False):
+            paths = [s.path for s in sources if s.path.suffix.lower() == ".pdf" and s.extract_images == with_images]
+            parsed = iter_parse_pdfs(
+                paths,
+                extract_images=with_images,
+                image_dir=self.image_dir if with_images else None,
+                workers=self.workers,
+                pages_per_task=self.pages_per_task,
+                stats=self._stage_stats["parse"],
+                max_pending=self.parse_ahead,
+                pool=self._pool,
+                **self.layout_options
+            )
+            for pdf_path, docs, images in parsed:
+                units = {unit_id(doc): (sha256_text(doc.text), doc) for doc in docs}
+                file_images = {}
+                for image in images:
+                    img_hash = sha256_bytes(image.data)
+                    uid = f"page={image.page}/img={img_hash[:16]}"
+                    units[uid] = (img_hash, None)
+                    file_images[uid] = image
+                yield _ParsedFile(by_path[pdf_path], units, file_images)
+
+    # 2.2 Diff against the manifest, drop stale units, caption changed images
+    def _prepare(self, files: Iterable[_ParsedFile]) -> Iterator[Tuple[str, Document]]:
+        for parsed in files:
+            file_key = parsed.source.file_key
+            with span("ingest.prepare"):
+                with self._lock:
+                    changed, stale = self.manifest.diff_units(file_key, {uid: h for uid, (h, _) in parsed.units.items()})
+                    delete_vector_documents(self.vector_index, [f"{file_key}#{uid}" for uid in stale])
+                    # Triplets they alone produced are deleted from the graph at the next commit
+                    self.manifest.release_units(file_key, stale)
+                    self._digests[file_key] = parsed.source.digest
+                    self._units_left[file_key] = len(changed)
+                    if not changed:
+                        self.manifest.record_file(file_key, parsed.source.digest)
+                self._stage_stats["prepare"]["files"] += 1
+
+                captions = self._caption(file_key, [(uid, parsed.images[uid]) for uid in changed
+                                                    if uid in parsed.images])
+                ready = []
+                for uid in changed:
+                    content_hash, doc = parsed.units[uid]
+                    if doc is None and captions[uid] is None:
+                        # Kept out of the manifest, so the image is captioned again on the next run
+                        with self._lock:
+                            self._units_left[file_key] -= 1
+                            self._incomplete.add(file_key)
+                        self._stage_stats["prepare"]["caption_failed"] += 1
+                        continue
+                    if doc is None:
+                        image = parsed.images[uid]
+                        doc = Document(
+                            text=captions[uid],
+                            metadata={
+                                "source": "image",
+                                "filename": image.name,
+                                "pdf_name": file_key.split("/", 1)[1],
+                                "page": image.page
+                            }
+                        )
+                    doc.id_ = f"{file_key}#{uid}"
+                    ready.append(doc)
+                    with self._lock:
+                        self._pending[doc.id_] = (file_key, uid, content_hash, doc)
+            # Unchanged units and image bytes are released before the next file is taken
+            del parsed
+            for doc in ready:
+                yield doc.id_, doc
+
+    def _caption(self, file_key: str, images: List[Tuple[str, ExtractedImage]]) -> Dict[str, Optional[str]]:
+        """
+        Near-identical images share one caption, also across files captioned earlier in the
+        run. A failed caption is None for its whole group and is not reused later.
+        """
+        if not images:
+            return {}
+        groups = group_near_duplicates([image.phash for _, image in images], self.phash_max_distance)
+        captions: Dict[int, str] = {}
+        to_caption = []
+        for i in sorted(set(groups)):
+            phash = images[i][1].phash
+            earlier = next((c for h, c in self._captioned if (phash ^ h).bit_count() <= self.phash_max_distance), None)
+            if earlier is None:
+                to_caption.append(i)
+            else:
+                captions[i] = earlier
+        self._stage_stats["prepare"]["near_duplicate"] += len(groups) - len(to_caption)
+        self._stage_stats["prepare"]["captioned"] += len(to_caption)
+
+        for i, caption in zip(to_caption, describe_images_with_llava([images[i][1] for i in to_caption],
+                                                                     cache=self.caption_cache)):
+            captions[i] = caption
+            if caption is not None:
+                self._captioned.append((images[i][1].phash, caption))
+        for (_, image), group in zip(images, groups):
+            if captions[group] is not None:
+                logger.info(f"[Image]: {image.name} [Description]: {captions[group]}")
+        return {uid: captions[group] for (uid, _), group in zip(images, groups)}
+
+    # 2.3 Writer: triplets and embeddings, committed to the manifest every commit_every units
+    def _commit(self, finished: List[Tuple[str, List]], persist: bool = False) -> None:
+        # One canonicalization pass per commit, so new entity names are embedded in one batch
+        extracted = [triplets for _, triplets in finished]
+        if self.canonicalizer is not None:
+            unique = self.canonicalizer.canonicalize_units(extracted)
+        else:
+            unique = [dedupe_triplets(triplets) for triplets in extracted]
+        self.stats["triplets"] += sum(map(len, unique))
+        self.stats["duplicate_triplets"] += sum(map(len, extracted)) - sum(map(len, unique))
+
+        with self._lock:
+            for (ref_doc_id, _), triplets in zip(finished, unique):
+                file_key, uid, content_hash, _ = self._pending.pop(ref_doc_id)
+                self.manifest.record_unit(file_key, uid, content_hash, triplets)
+                self._units_left[file_key] -= 1
+                if not self._units_left[file_key] and file_key not in self._incomplete:
+                    self.manifest.record_file(file_key, self._digests[file_key])
+            finished.clear()
+            # New triplets and those whose unit count changed, also through stale or removed units
+            weights, orphans = self.manifest.drain_changes()
+        # Only this (the writer) thread touches the graph: triplets nothing references any
+        # more are deleted with the entities they leave behind, the rest get their weight
+        self.graph_writer.delete_triplets(orphans)
+        for (subj, rel, obj), weight in weights.items():
+            self.graph_writer.add_triplet(subj, rel, obj, weight=weight)
+        # A unit only enters the manifest file once its triplets are flushed to the graph
+        self.graph_writer.flush()
+        if weights or orphans:
+            # A running query server drops cached answers and subgraphs of the previous graph
+            self.graph_writer.bump_graph_version()
+        if persist or time.monotonic() - self._persisted_at >= self.persist_interval:
+            with self._lock:
+                self.vector_index.storage_context.persist(persist_dir=self.persist_dir)
+                self.manifest.save()
+            self._persisted_at = time.monotonic()
+
+    def run(self, sources: Sequence[IngestSource]) -> Counter:
+        """Ingest sources; returns self.stats."""
+        stages: List[Stage] = [
+            ("parse", self._parse, False),
+            ("prepare", self._prepare, False),
+            ("extract", self.extractor.extract_units, True),
+        ]
+        finished: List[Tuple[str, List]] = []
+        # Forking copies only the calling thread, so the parse workers start before the stage threads
+        if self.workers != 1 and any(s.path.suffix.lower() == ".pdf" for s in sources):
+            self._pool = start_process_pool(self.workers or os.cpu_count() or 1)
+        try:
+            for ref_doc_id, triplets in run_stages(sources, stages, self.queue_size):
+                if triplets is None:
+                    # Extraction failed: left out of the manifest (and the index) to be retried next run
+                    with self._lock:
+                        file_key = self._pending.pop(ref_doc_id)[0]
+                        self._units_left[file_key] -= 1
+                        self._incomplete.add(file_key)
+                    self.stats["extract_failed"] += 1
+                    continue
+                with span("ingest.write"):
+                    with self._lock:
+                        upsert_vector_document(self.vector_index, self._pending[ref_doc_id][3])
+                finished.append((ref_doc_id, triplets))
+                self.stats["units"] += 1
+                if len(finished) >= self.commit_every:
+                    self._commit(finished)
+        finally:
+            try:
+                # Whatever finished before a crash or Ctrl-C is kept for the next run
+                self._commit(finished, persist=True)
+            finally:
+                if self._pool is not None:
+                    self._pool.shutdown(cancel_futures=True)
+                    self._pool = None
+                for counter in self._stage_stats.values():
+                    self.stats.update(counter)
+                    counter.clear()
+        return self.stats
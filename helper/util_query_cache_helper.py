@@ -0,0 +1,284 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from helper.util_metrics_helper import count
+from helper.util_stream_helper import render_response
+
+logger = logging.getLogger(__name__)
+
+
+# 1. Backends: redis.Redis, or an in-process stand-in implementing the same few commands
+class InMemoryRedis:
+    """Thread-safe subset of the redis-py API (get/set/hset/hgetall/hdel/expire) with TTLs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[Optional[float], object]] = {}
+
+    def _live(self, key: str):
+        expires_at, value = self._data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: str, ex: Optional[int] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ex if ex else None, value)
+
+    def hset(self, name: str, key: str, value: str) -> None:
+        with self._lock:
+            fields = self._live(name) or {}
+            fields[key] = value
+            self._data[name] = (self._data.get(name, (None, None))[0], fields)
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._live(name) or {})
+
+    def hdel(self, name: str, *keys: str) -> None:
+        with self._lock:
+            fields = self._live(name) or {}
+            for key in keys:
+                fields.pop(key, None)
+
+    def expire(self, name: str, ttl: int) -> None:
+        with self._lock:
+            if (value := self._live(name)) is not None:
+                self._data[name] = (time.monotonic() + ttl, value)
+
+
+def open_cache_backend(kind: str, host: str = "localhost", port: int = 6379,
+                       username: str = "", password: str = ""):
+    """'redis' (falls back to memory if unreachable), 'memory', or 'off' (returns None)."""
+    if kind == "off":
+        return None
+    if kind == "redis":
+        try:
+            import redis
+
+            client = redis.Redis(host=host, port=port, username=username or None, password=password or None,
+                                 decode_responses=True)
+            client.ping()
+            return client
+        except Exception as e:
+            logger.warning(f"Redis at {host}:{port} unavailable ({e}); using in-process query cache")
+    return InMemoryRedis()
+
+
+# 2. Semantic query/answer cache
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().strip("?!. ").lower()
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _restore_nodes(entry: dict) -> List[NodeWithScore]:
+    return [
+        NodeWithScore(
+            node=TextNode(
+                text=n["text"],
+                metadata=n["metadata"],
+                excluded_llm_metadata_keys=n.get("excluded_llm_metadata_keys", []),
+                excluded_embed_metadata_keys=n.get("excluded_embed_metadata_keys", []),
+            ),
+            score=n["score"],
+        )
+        for n in entry["nodes"]
+    ]
+
+
+class QueryCache:
+    """
+    Caches answers in front of a query engine.
+
+    * exact hit:    same normalized question → cached answer, no LLM call
+    * semantic hit: question embedding within `threshold` cosine of a cached one → cached answer
+    * context hit:  within `context_threshold` → reuse that question's retrieved nodes and only
+                    run synthesis, skipping keyword extraction and graph retrieval
+
+    Keys are namespaced by the graph version, so anything cached before the last
+    ingestion becomes unreachable (and expires through its TTL). Question embeddings
+    are mirrored in an in-process matrix that picks up entries written by other
+    processes every `version_refresh` seconds.
+    """
+
+    def __init__(self, backend, embed_model, graph_version: Callable[[], int], namespace: str = "",
+                 threshold: float = 0.95, context_threshold: float = 0.85, ttl: int = 86400,
+                 version_refresh: float = 30.0):
+        self.backend = backend
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.context_threshold = context_threshold
+        self.ttl = ttl
+        self._namespace = namespace
+        self._graph_version = graph_version
+        self._version_refresh = version_refresh
+        self._version: Optional[int] = None
+        self._version_checked = 0.0
+        self._index_lock = threading.Lock()
+        self._index_prefix: Optional[str] = None
+        self._index_vectors: Dict[str, np.ndarray] = {}  # answer key -> unit-length question embedding
+        self._index_matrix: Optional[Tuple[List[str], np.ndarray]] = None
+        self._index_synced: Optional[float] = None
+
+    # 2.1 Keys
+    def _prefix(self) -> str:
+        # The graph version is re-read at most every version_refresh seconds
+        if self._version is None or time.monotonic() - self._version_checked > self._version_refresh:
+            self._version = self._graph_version()
+            self._version_checked = time.monotonic()
+        return f"rag:qcache:{self._namespace}:v{self._version}"
+
+    @staticmethod
+    def _key(question: str) -> str:
+        return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+    # 2.2 In-process mirror of the embedding index
+    def _index(self, prefix: str) -> Optional[Tuple[List[str], np.ndarray]]:
+        """(keys, matrix) of the cached question embeddings; only new backend fields are parsed."""
+        with self._index_lock:
+            if prefix != self._index_prefix:
+                self._index_prefix, self._index_vectors, self._index_matrix = prefix, {}, None
+                self._index_synced = None
+            if self._index_synced is None or time.monotonic() - self._index_synced > self._version_refresh:
+                fields = self.backend.hgetall(f"{prefix}:index")
+                stale = [k for k in self._index_vectors if k not in fields]
+                fresh = {k: v for k, v in fields.items() if k not in self._index_vectors}
+                for k in stale:
+                    del self._index_vectors[k]
+                for k, raw in fresh.items():
+                    self._index_vectors[k] = _unit(json.loads(raw))
+                if stale or fresh:
+                    self._index_matrix = None
+                self._index_synced = time.monotonic()
+            if self._index_matrix is None and self._index_vectors:
+                keys = list(self._index_vectors)
+                self._index_matrix = keys, np.vstack([self._index_vectors[k] for k in keys])
+            return self._index_matrix
+
+    def _index_set(self, prefix: str, key: str, vector: Optional[np.ndarray]) -> None:
+        """Add (or with vector=None drop) one entry of the local mirror."""
+        with self._index_lock:
+            if prefix != self._index_prefix:
+                return
+            if vector is None:
+                self._index_vectors.pop(key, None)
+            else:
+                self._index_vectors[key] = vector
+            self._index_matrix = None
+
+    # 2.3 Lookup / store
+    def lookup(self, question: str) -> Tuple[str, Optional[dict], Optional[List[float]]]:
+        """Returns (kind, entry, embedding) with kind in 'exact' | 'semantic' | 'context' | 'miss'."""
+        prefix = self._prefix()
+        if raw := self.backend.get(f"{prefix}:ans:{self._key(question)}"):
+            return "exact", json.loads(raw), None
+
+        embedding = self.embed_model.get_query_embedding(question)
+        index = self._index(prefix)
+        if index is None:
+            return "miss", None, embedding
+
+        keys, matrix = index
+        sims = matrix @ _unit(embedding)
+
+        for i in np.argsort(-sims):
+            if sims[i] < self.context_threshold:
+                break
+            raw = self.backend.get(f"{prefix}:ans:{keys[i]}")
+            if raw is None:
+                # Answer expired; drop its embedding too
+                self.backend.hdel(f"{prefix}:index", keys[i])
+                self._index_set(prefix, keys[i], None)
+                continue
+            return ("semantic" if sims[i] >= self.threshold else "context"), json.loads(raw), embedding
+        return "miss", None, embedding
+
+    def store(self, question: str, answer: str, nodes: List[NodeWithScore],
+              embedding: Optional[List[float]] = None) -> None:
+        prefix = self._prefix()
+        key = self._key(question)
+        entry = {
+            "question": question,
+            "answer": answer,
+            "nodes": [
+                {
+                    "text": n.node.get_content(),
+                    "metadata": n.node.metadata,
+                    # Keeps e.g. the kg_rel_map dump of a graph node out of the prompt when reused
+                    "excluded_llm_metadata_keys": n.node.excluded_llm_metadata_keys,
+                    "excluded_embed_metadata_keys": n.node.excluded_embed_metadata_keys,
+                    "score": n.score,
+                }
+                for n in nodes
+            ],
+        }
+        self.backend.set(f"{prefix}:ans:{key}", json.dumps(entry), ex=self.ttl)
+        if embedding is None:
+            embedding = self.embed_model.get_query_embedding(question)
+        self.backend.hset(f"{prefix}:index", key, json.dumps(list(embedding)))
+        self.backend.expire(f"{prefix}:index", self.ttl)
+        self._index_set(prefix, key, _unit(embedding))
+
+    # 2.4 Query through the cache
+    def query(self, query_engine, question: str,
+              write: Optional[Callable[[str], None]] = None) -> Tuple[str, str]:
+        """
+        Answer a question through the cache; returns (visible answer, cache_result).
+        When write is given it receives the answer as it is produced (streamed on a miss).
+        """
+        kind, entry, embedding = self.lookup(question)
+        count("query_cache_lookups_total", result=kind)
+        if kind in ("exact", "semantic"):
+            if write is not None:
+                write(entry["answer"])
+            return entry["answer"], kind
+
+        if kind == "context":
+            # Same postprocessing (context budget) as a fresh retrieval, then synthesis only
+            query_bundle = QueryBundle(question)
+            nodes = query_engine._apply_node_postprocessors(_restore_nodes(entry), query_bundle)
+            response = query_engine.synthesize(query_bundle, nodes)
+        else:
+            response = query_engine.query(question)
+            nodes = response.source_nodes
+
+        answer = render_response(response, write)
+        self.store(question, answer, nodes, embedding)
+        return answer, kind
+
+    async def aquery(self, query_engine, question: str) -> Tuple[str, str]:
+        """Async variant of query; backend and embedding calls run in a worker thread."""
+        kind, entry, embedding = await asyncio.to_thread(self.lookup, question)
+        count("query_cache_lookups_total", result=kind)
+        if kind in ("exact", "semantic"):
+            return entry["answer"], kind
+
+        if kind == "context":
+            query_bundle = QueryBundle(question)
+            nodes = await query_engine._async_apply_node_postprocessors(_restore_nodes(entry), query_bundle)
+            response = await query_engine.asynthesize(query_bundle, nodes)
+        else:
+            response = await query_engine.aquery(question)
+            nodes = response.source_nodes
+
+        answer = render_response(response)
+        await asyncio.to_thread(self.store, question, answer, nodes, embedding)
+        return answer, kind
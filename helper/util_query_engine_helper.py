@@ -0,0 +1,193 @@
+import logging
+import pathlib
+import time
+from typing import Any, Callable, NamedTuple, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+# 1. Building blocks shared by main.py, query_part_only.py and query_server.py
+#    llama_index is imported inside the functions so callers only pay for it when they build something
+def build_llm():
+    from llama_index.llms.ollama import Ollama
+
+    from helper.util_scheduler_helper import keep_alive_value, ollama_async_client, ollama_client
+
+    base_url = f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}"
+    # Every chat/generate request waits for a slot of its model (util_scheduler_helper),
+    # is timed and has its tokens counted (util_metrics_helper)
+    return Ollama(
+        model=config.OLLAMA_LLM_MODEL,
+        base_url=base_url,
+        request_timeout=600.0,
+        keep_alive=keep_alive_value(config.OLLAMA_KEEP_ALIVE),
+        client=ollama_client(base_url, timeout=600.0),
+        async_client=ollama_async_client(base_url, timeout=600.0),
+    )
+
+
+def open_graph_writer():
+    """GraphWriter for the configured GRAPH_BACKEND: Neo4j, or the embedded SQLite graph."""
+    if config.GRAPH_BACKEND == "local":
+        from helper.util_local_graph_helper import LocalGraphWriter, get_local_graph
+
+        return LocalGraphWriter(get_local_graph(
+            config.GRAPH_LOCAL_PATH, fanout=config.KG_TRAVERSAL_FANOUT, fuzzy_matches=config.KG_FUZZY_ENTITY_MATCHES
+        ))
+
+    from helper.util_graph_helper import GraphWriter, get_driver
+
+    return GraphWriter(get_driver(config.NEO4J_URI, config.NEO4J_USERNAME, config.NEO4J_PASSWORD))
+
+
+def build_graph_store():
+    """
+    Graph store for the configured GRAPH_BACKEND. Both bound get_rel_map in depth and fanout
+    and fall back to fuzzy entity matches (the Neo4j one through its full-text index).
+    """
+    if config.GRAPH_BACKEND == "local":
+        from helper.util_local_graph_helper import get_local_graph
+
+        return get_local_graph(
+            config.GRAPH_LOCAL_PATH, fanout=config.KG_TRAVERSAL_FANOUT, fuzzy_matches=config.KG_FUZZY_ENTITY_MATCHES
+        )
+
+    from helper.util_schema_helper import BoundedNeo4jGraphStore
+
+    return BoundedNeo4jGraphStore(
+        username=config.NEO4J_USERNAME,
+        password=config.NEO4J_PASSWORD,
+        url=config.NEO4J_URI,
+        database="neo4j",
+        timeout=600.0,
+        fanout=config.KG_TRAVERSAL_FANOUT,
+        fuzzy_matches=config.KG_FUZZY_ENTITY_MATCHES,
+    )
+
+
+def build_query_engine(storage_context, vector_index, embed_model, llm=None, streaming: bool = False):
+    """
+    RetrieverQueryEngine over the configured retriever (kg / vector / hybrid) with the CoT prompt.
+    With streaming, query() returns a StreamingResponse; pass it to render_response.
+    """
+    from llama_index.core.query_engine import RetrieverQueryEngine
+
+    from helper.util_context_helper import ContextBudgetPostprocessor
+    from helper.util_retrieval_helper import build_retriever
+    from prompt_templates.cot_prompt_template import COT_PROMPT_TEMPLATE
+
+    retriever = build_retriever(
+        storage_context,
+        vector_index,
+        mode=config.RETRIEVAL_MODE,
+        vector_top_k=config.VECTOR_TOP_K,
+        rrf_k=config.RRF_K,
+        kg_depth=config.KG_TRAVERSAL_DEPTH,
+    )
+    # Dedupe, rank and pack the retrieved context into CONTEXT_TOKEN_BUDGET tokens (0 = no limit)
+    postprocessors = []
+    if config.CONTEXT_TOKEN_BUDGET:
+        postprocessors.append(
+            ContextBudgetPostprocessor(token_budget=config.CONTEXT_TOKEN_BUDGET, kg_share=config.CONTEXT_KG_SHARE)
+        )
+    query_engine = RetrieverQueryEngine.from_args(
+        retriever, llm=llm, embed_model=embed_model, streaming=streaming, node_postprocessors=postprocessors
+    )
+    query_engine.update_prompts({"response_synthesizer:text_qa_template": COT_PROMPT_TEMPLATE})
+    return query_engine
+
+
+def build_query_cache(embed_model, graph_version: Callable[[], int]):
+    """QueryCache namespaced by model + retrieval mode, or None when QUERY_CACHE_BACKEND is 'off'."""
+    from helper.util_query_cache_helper import QueryCache, open_cache_backend
+
+    cache_backend = open_cache_backend(
+        config.QUERY_CACHE_BACKEND,
+        host=config.REDIS_HOST,
+        port=config.REDIS_PORT,
+        username=config.REDIS_USERNAME,
+        password=config.REDIS_PASSWORD,
+    )
+    if cache_backend is None:
+        return None
+    return QueryCache(
+        cache_backend,
+        embed_model,
+        graph_version=graph_version,
+        namespace=f"{config.OLLAMA_LLM_MODEL}:{config.RETRIEVAL_MODE}",
+        threshold=config.QUERY_CACHE_THRESHOLD,
+        context_threshold=config.QUERY_CACHE_CONTEXT_THRESHOLD,
+        ttl=config.QUERY_CACHE_TTL,
+    )
+
+
+def cache_graph_store(graph_store, graph_version: Callable[[], int]):
+    """Wrap the graph store in a subgraph cache tied to the graph version, unless SUBGRAPH_CACHE_SIZE is 0."""
+    from helper.util_cache_helper import open_cache
+    from helper.util_subgraph_cache_helper import CachedGraphStore
+
+    if not config.SUBGRAPH_CACHE_SIZE:
+        return graph_store
+    return CachedGraphStore(
+        graph_store,
+        graph_version=graph_version,
+        max_entries=config.SUBGRAPH_CACHE_SIZE,
+        disk_cache=open_cache(config.SUBGRAPH_CACHE_PATH, table="subgraphs"),
+    )
+
+
+# 2. Everything a query process needs, built once
+class QueryStack(NamedTuple):
+    llm: Any
+    embed_model: Any
+    graph: Any  # GraphWriter or LocalGraphWriter: graph version and connectivity
+    query_engine: Any
+    query_cache: Optional[Any]
+
+
+def load_query_stack(streaming: bool = False) -> QueryStack:
+    """Connect to the existing graph (and vector index) and build the query engine and answer cache."""
+    from llama_index.core import Settings, StorageContext
+
+    from helper.util_embedding_helper import build_embed_model
+    from helper.util_retrieval_helper import load_vector_index
+
+    llm = build_llm()
+    Settings.llm = llm
+    embed_model = build_embed_model(
+        model_name=config.OLLAMA_EMBED_MODEL,
+        base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}",
+        cache_dir=config.EMBED_CACHE_DIR,
+        embed_batch_size=config.EMBED_BATCH_SIZE,
+    )
+    Settings.embed_model = embed_model
+
+    graph = open_graph_writer()
+    # The bounded Neo4j traversal needs the full-text index, which a graph built before it existed lacks
+    graph.ensure_schema()
+    graph_store = build_graph_store()
+    storage_context = StorageContext.from_defaults(graph_store=cache_graph_store(graph_store, graph.graph_version))
+
+    vector_index = None
+    if config.RETRIEVAL_MODE != "kg":
+        vector_index = load_vector_index(pathlib.Path(config.VECTOR_INDEX_DIR), embed_model)
+
+    return QueryStack(
+        llm=llm,
+        embed_model=embed_model,
+        graph=graph,
+        query_engine=build_query_engine(storage_context, vector_index, embed_model, llm=llm, streaming=streaming),
+        query_cache=build_query_cache(embed_model, graph.graph_version),
+    )
+
+
+# 3. Warm-up: load the models into Ollama and open the graph connection before the first question
+def warm_up(stack: QueryStack) -> None:
+    start = time.perf_counter()
+    stack.graph.verify_connectivity()
+    # An empty prompt only loads the model; the embed call bypasses the embedding cache on purpose
+    stack.llm.client.generate(model=config.OLLAMA_LLM_MODEL, prompt="", keep_alive=stack.llm.keep_alive)
+    stack.llm.client.embed(model=config.OLLAMA_EMBED_MODEL, input="warm-up")
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.1f}s")
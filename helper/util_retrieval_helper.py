@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.retrievers import KnowledgeGraphRAGRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from helper.util_metrics_helper import span
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODES = ("kg", "vector", "hybrid")
+
+
+# 1. Reciprocal-rank fusion of several ranked result lists
+def reciprocal_rank_fusion(result_lists: Sequence[List[NodeWithScore]], k: int = 60,
+                           top_n: Optional[int] = None) -> List[NodeWithScore]:
+    """
+    score(node) = sum over lists of 1 / (k + rank). Nodes are matched on their
+    content, since the KG retriever builds fresh node ids on every query.
+    """
+    scores: Dict[str, float] = {}
+    nodes: Dict[str, NodeWithScore] = {}
+    for results in result_lists:
+        for rank, n in enumerate(results, start=1):
+            key = n.node.get_content()
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            nodes.setdefault(key, n)
+
+    fused = sorted(scores, key=scores.get, reverse=True)[:top_n]
+    return [NodeWithScore(node=nodes[key].node, score=scores[key]) for key in fused]
+
+
+class HybridRetriever(BaseRetriever):
+    """Runs several retrievers concurrently and fuses their results with RRF."""
+
+    def __init__(self, retrievers: Sequence[BaseRetriever], rrf_k: int = 60, top_n: Optional[int] = None,
+                 **kwargs):
+        self._retrievers = list(retrievers)
+        self._rrf_k = rrf_k
+        self._top_n = top_n
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _timed_retrieve(retriever: BaseRetriever, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        with span("retrieve", retriever=type(retriever).__name__):
+            return retriever.retrieve(query_bundle)
+
+    @staticmethod
+    async def _timed_aretrieve(retriever: BaseRetriever, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        with span("retrieve", retriever=type(retriever).__name__):
+            return await retriever.aretrieve(query_bundle)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        with ThreadPoolExecutor(max_workers=len(self._retrievers), thread_name_prefix="retrieve") as pool:
+            results = list(pool.map(lambda r: self._timed_retrieve(r, query_bundle), self._retrievers))
+        return reciprocal_rank_fusion(results, self._rrf_k, self._top_n)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        results = await asyncio.gather(*(self._timed_aretrieve(r, query_bundle) for r in self._retrievers))
+        return reciprocal_rank_fusion(results, self._rrf_k, self._top_n)
+
+
+# 2. Chunk-embedding vector index persisted next to the graph
+def load_vector_index(persist_dir: pathlib.Path, embed_model) -> VectorStoreIndex:
+    """Load the persisted vector index, or start an empty one."""
+    if (pathlib.Path(persist_dir) / "docstore.json").exists():
+        storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
+        return load_index_from_storage(storage_context, embed_model=embed_model)
+    return VectorStoreIndex([], embed_model=embed_model)
+
+
+def upsert_vector_document(vector_index: VectorStoreIndex, doc) -> None:
+    """Insert a document, replacing the chunks of an earlier version with the same id."""
+    if vector_index.docstore.get_ref_doc_info(doc.id_) is not None:
+        vector_index.update_ref_doc(doc)
+    else:
+        vector_index.insert(doc)
+
+
+def delete_vector_documents(vector_index: VectorStoreIndex, ref_doc_ids: Sequence[str]) -> None:
+    for ref_doc_id in ref_doc_ids:
+        if vector_index.docstore.get_ref_doc_info(ref_doc_id) is not None:
+            vector_index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+
+
+# 3. Retriever for the configured mode
+class GraphRAGRetriever(KnowledgeGraphRAGRetriever):
+    """KnowledgeGraphRAGRetriever whose async path reads the subgraph in a worker thread."""
+
+    async def _aget_knowledge_sequence(self, entities: List[str]) -> Tuple[List[str], Optional[Dict[Any, Any]]]:
+        # Graph stores only offer a blocking get_rel_map; keep it off the event loop
+        return await asyncio.to_thread(self._get_knowledge_sequence, entities)
+
+
+def build_retriever(storage_context: StorageContext, vector_index: Optional[VectorStoreIndex], mode: str,
+                    vector_top_k: int = 5, rrf_k: int = 60, kg_depth: int = 2) -> BaseRetriever:
+    """'kg' = graph only (previous behaviour), 'vector' = chunk embeddings only, 'hybrid' = both fused."""
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+
+    retrievers = []
+    if mode in ("kg", "hybrid"):
+        retrievers.append(GraphRAGRetriever(
+            storage_context=storage_context, graph_traversal_depth=kg_depth, verbose=True
+        ))
+    if mode in ("vector", "hybrid"):
+        if vector_index is None:
+            raise ValueError(f"Retrieval mode {mode!r} needs a vector index")
+        retrievers.append(vector_index.as_retriever(similarity_top_k=vector_top_k))
+
+    return retrievers[0] if len(retrievers) == 1 else HybridRetriever(retrievers, rrf_k=rrf_k)
@@ -0,0 +1,256 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Union
+
+from config import config
+from helper.util_metrics_helper import InstrumentedAsyncClient, InstrumentedClient, count, gauge, observe
+
+logger = logging.getLogger(__name__)
+
+
+# 1. Per-model admission control in front of one Ollama server
+class _Ticket:
+    __slots__ = ("model", "enqueued", "grant")
+
+    def __init__(self, model: str, grant: Callable[[], None]):
+        self.model = model
+        self.enqueued = time.monotonic()
+        self.grant = grant
+
+
+class OllamaScheduler:
+    """
+    Every Ollama request asks for a slot of its model first. At most max_loaded models
+    are served at a time, each with at most max_inflight requests in flight, so
+    requests for the LLM, the VLM and the embedding model are grouped by model instead
+    of interleaved. Interleaving makes a single inference box swap models, which can
+    take seconds per swap.
+
+    A waiting model gets its turn once the active one has no requests in flight, or
+    after max_hold seconds: from then on the active model stops admitting new requests
+    so it can drain. The model whose oldest request has waited longest goes next and
+    is admitted together with everything queued for it.
+    """
+
+    def __init__(self, max_inflight: int = 4, max_loaded: int = 1, max_hold: float = 10.0,
+                 keep_alive: Optional[Union[float, str]] = None, limits: Optional[Dict[str, int]] = None):
+        self.max_inflight = max_inflight
+        self.max_loaded = max_loaded
+        self.max_hold = max_hold
+        self.keep_alive = keep_alive
+        self.limits = dict(limits or {})  # per-model overrides of max_inflight
+
+        self._lock = threading.Lock()
+        self._waiting: Dict[str, Deque[_Ticket]] = {}
+        self._inflight = Counter()
+        self._active: Dict[str, float] = {}  # model -> when it was activated
+        self._last_model: Optional[str] = None
+
+    # 1.1 Dispatch (called with the lock held after every state change)
+    def _cap(self, model: str) -> int:
+        return self.limits.get(model, self.max_inflight)
+
+    def _expired(self, model: str, now: float) -> bool:
+        """Held longer than max_hold while a model that is not active waits."""
+        return now - self._active[model] > self.max_hold and any(
+            q for m, q in self._waiting.items() if q and m not in self._active
+        )
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        # 1.1.1 Retire idle models and models that held the server too long
+        expired = set()
+        for model in list(self._active):
+            if not self._inflight[model] and (not self._waiting.get(model) or self._expired(model, now)):
+                if self._waiting.get(model):
+                    expired.add(model)
+                del self._active[model]
+
+        # 1.1.2 Activate the models whose oldest request has waited longest (a model that just
+        #       used up its turn only goes again when nothing else waits)
+        while len(self._active) < self.max_loaded:
+            candidates = [m for m, q in self._waiting.items() if q and m not in self._active]
+            if not candidates:
+                break
+            model = min([m for m in candidates if m not in expired] or candidates,
+                        key=lambda m: self._waiting[m][0].enqueued)
+            self._active[model] = now
+            if self._last_model is not None and model != self._last_model:
+                count("ollama_model_switches_total", model=model)
+            self._last_model = model
+
+        # 1.1.3 Admit queued requests of the active models up to their cap
+        for model in self._active:
+            queue = self._waiting.get(model)
+            while queue and self._inflight[model] < self._cap(model) and not self._expired(model, now):
+                ticket = queue.popleft()
+                self._inflight[model] += 1
+                observe("ollama.queue_wait", now - ticket.enqueued, model=model)
+                ticket.grant()
+
+        for model, queue in self._waiting.items():
+            gauge("ollama_queue_depth", len(queue), model=model)
+            gauge("ollama_inflight", self._inflight[model], model=model)
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        with self._lock:
+            self._waiting.setdefault(ticket.model, deque()).append(ticket)
+            self._dispatch()
+
+    def _cancel(self, ticket: _Ticket) -> bool:
+        """Drop a ticket that was never granted; False if it was granted meanwhile."""
+        with self._lock:
+            queue = self._waiting.get(ticket.model)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._dispatch()
+                return True
+            return False
+
+    # 1.2 Slots
+    def acquire(self, model: str) -> None:
+        granted = threading.Event()
+        self._enqueue(_Ticket(model, granted.set))
+        granted.wait()
+
+    async def aacquire(self, model: str) -> None:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        ticket = _Ticket(model, grant)
+        self._enqueue(ticket)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not self._cancel(ticket):
+                self.release(model)
+            raise
+
+    def release(self, model: str) -> None:
+        with self._lock:
+            self._inflight[model] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, model: str) -> Iterator[None]:
+        self.acquire(model)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    @asynccontextmanager
+    async def aslot(self, model: str):
+        await self.aacquire(model)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    def depths(self) -> Dict[str, int]:
+        """Requests waiting per model."""
+        with self._lock:
+            return {m: len(q) for m, q in self._waiting.items()}
+
+
+def keep_alive_value(text: str) -> Union[float, str]:
+    """Ollama reads a bare number as seconds (negative = forever) but rejects it as a string."""
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+@functools.lru_cache(maxsize=None)
+def get_scheduler() -> Optional[OllamaScheduler]:
+    """The process-wide scheduler, or None when OLLAMA_SCHEDULER is off."""
+    if not config.OLLAMA_SCHEDULER:
+        return None
+    return OllamaScheduler(
+        max_inflight=config.OLLAMA_MAX_INFLIGHT_PER_MODEL,
+        max_loaded=config.OLLAMA_MAX_LOADED_MODELS,
+        max_hold=config.OLLAMA_MODEL_MAX_HOLD,
+        keep_alive=keep_alive_value(config.OLLAMA_KEEP_ALIVE),
+        # The captioner's own concurrency limit also bounds the VLM here
+        limits={config.OLLAMA_VLM_MODEL: config.OLLAMA_VLM_CONCURRENCY},
+    )
+
+
+# 2. Ollama clients that wait for a slot of their model
+def _request_model(args: tuple, kwargs: Dict[str, Any]) -> str:
+    return kwargs.get("model", args[0] if args else "")
+
+
+def _with_keep_alive(scheduler: OllamaScheduler, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    if kwargs.get("keep_alive") is None and scheduler.keep_alive is not None:
+        kwargs = {**kwargs, "keep_alive": scheduler.keep_alive}
+    return kwargs
+
+
+def _scheduled_stream(scheduler: OllamaScheduler, model: str, call) -> Iterator[Any]:
+    # The slot is held until the stream is consumed or closed
+    with scheduler.slot(model):
+        yield from call()
+
+
+async def _ascheduled_stream(scheduler: OllamaScheduler, model: str, call):
+    async with scheduler.aslot(model):
+        async for part in await call():
+            yield part
+
+
+class ScheduledClient(InstrumentedClient):
+    """InstrumentedClient whose requests go through an OllamaScheduler and carry its keep_alive."""
+
+    def __init__(self, *args, scheduler: OllamaScheduler, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    def _observed(self, endpoint: str, method, args: tuple, kwargs: Dict[str, Any]):
+        model = _request_model(args, kwargs)
+        kwargs = _with_keep_alive(self.scheduler, kwargs)
+        call = functools.partial(super()._observed, endpoint, method, args, kwargs)
+        if kwargs.get("stream"):
+            return _scheduled_stream(self.scheduler, model, call)
+        with self.scheduler.slot(model):
+            return call()
+
+
+class ScheduledAsyncClient(InstrumentedAsyncClient):
+    """Async counterpart of ScheduledClient."""
+
+    def __init__(self, *args, scheduler: OllamaScheduler, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    async def _observed(self, endpoint: str, method, args: tuple, kwargs: Dict[str, Any]):
+        model = _request_model(args, kwargs)
+        kwargs = _with_keep_alive(self.scheduler, kwargs)
+        call = functools.partial(super()._observed, endpoint, method, args, kwargs)
+        if kwargs.get("stream"):
+            return _ascheduled_stream(self.scheduler, model, call)
+        async with self.scheduler.aslot(model):
+            return await call()
+
+
+def ollama_client(host: str, **kwargs) -> InstrumentedClient:
+    """Client for host, scheduled when OLLAMA_SCHEDULER is on; requests are timed either way."""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return InstrumentedClient(host=host, **kwargs)
+    return ScheduledClient(host=host, scheduler=scheduler, **kwargs)
+
+
+def ollama_async_client(host: str, **kwargs) -> InstrumentedAsyncClient:
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return InstrumentedAsyncClient(host=host, **kwargs)
+    return ScheduledAsyncClient(host=host, scheduler=scheduler, **kwargs)
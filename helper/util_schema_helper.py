@@ -0,0 +1,130 @@
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+import neo4j
+from llama_index.graph_stores.neo4j import Neo4jGraphStore
+from neo4j import Driver
+
+from helper.util_metrics_helper import timed
+
+logger = logging.getLogger(__name__)
+
+ENTITY_FULLTEXT_INDEX = "entity_names"
+
+
+# 1. Schema: unique constraints for every MERGE key, full-text index over entity names
+def schema_statements(entity_label: str = "Entity", fulltext_index: str = ENTITY_FULLTEXT_INDEX) -> List[str]:
+    label = entity_label.replace("`", "``")
+    return [
+        "CREATE CONSTRAINT pdf_name IF NOT EXISTS FOR (p:PDF) REQUIRE p.name IS UNIQUE",
+        "CREATE CONSTRAINT linkeddoc_url IF NOT EXISTS FOR (d:LinkedDoc) REQUIRE d.url IS UNIQUE",
+        "CREATE CONSTRAINT graphmeta_id IF NOT EXISTS FOR (m:GraphMeta) REQUIRE m.id IS UNIQUE",
+        f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:`{label}`) REQUIRE n.id IS UNIQUE",
+        f"CREATE FULLTEXT INDEX `{fulltext_index}` IF NOT EXISTS FOR (n:`{label}`) ON EACH [n.id]",
+    ]
+
+
+def ensure_schema(driver: Driver, database: str = "neo4j", entity_label: str = "Entity",
+                  fulltext_index: str = ENTITY_FULLTEXT_INDEX) -> None:
+    """Idempotent; cheap enough to run at the start of every ingestion and query process."""
+    for statement in schema_statements(entity_label, fulltext_index):
+        driver.execute_query(statement, database_=database)
+
+
+# 2. Lucene query for one keyword: the exact phrase, or every term fuzzily
+def entity_query(keyword: str) -> Optional[str]:
+    """Only word characters survive, so nothing needs Lucene escaping. None if no terms are left."""
+    terms = re.findall(r"\w+", keyword.lower())
+    if not terms:
+        return None
+    # Short terms are matched as they are; edit distance on them matches almost anything
+    fuzzy = " AND ".join(f"{t}~" if len(t) > 3 else t for t in terms)
+    return f'"{" ".join(terms)}" OR ({fuzzy})'
+
+
+# 3. Graph store whose traversal is bounded in depth and fanout
+class BoundedNeo4jGraphStore(Neo4jGraphStore):
+    """
+    Neo4jGraphStore with an index-backed get_rel_map.
+
+    The stock query matches seeds with toLower(n.id) IN [...] (a label scan) and expands
+    every variable-length path up to `depth`, so its cost grows with graph size and
+    entity degree. Here seeds come from the full-text index: an exact, case-insensitive
+    match when there is one, else up to `fuzzy_matches` best full-text hits. Each hop
+    then follows at most `fanout` relationships per node without revisiting the path,
+    heaviest first (edge weight = number of units stating the triplet).
+    Results keep the stock shape, {subject: [[REL, obj, REL2, obj2, ...], ...]}.
+    """
+
+    def __init__(self, *args, fanout: int = 10, fuzzy_matches: int = 2,
+                 fulltext_index: str = ENTITY_FULLTEXT_INDEX, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fanout = fanout
+        self.fuzzy_matches = fuzzy_matches
+        self.fulltext_index = fulltext_index
+        self._queries: Dict[int, str] = {}
+        self._fallback = False
+
+    def _traversal_query(self, depth: int) -> str:
+        if depth not in self._queries:
+            # 3.1 Seeds: full-text candidates, narrowed to exact (case-insensitive) matches if any
+            parts = [
+                """
+                UNWIND $seeds AS seed
+                CALL {
+                    WITH seed
+                    CALL db.index.fulltext.queryNodes($index, seed.query) YIELD node
+                    WITH node LIMIT $candidates
+                    RETURN collect(node) AS hits
+                }
+                WITH seed, hits, [n IN hits WHERE toLower(n.id) = seed.key] AS exact
+                UNWIND CASE WHEN size(exact) > 0 THEN exact ELSE hits[..$fuzzy] END AS n0
+                WITH DISTINCT n0
+                CALL { WITH n0 MATCH (n0)-[r1]->(n1) RETURN r1, n1 ORDER BY coalesce(r1.weight, 1) DESC LIMIT $fanout }
+                """
+            ]
+            # 3.2 Further hops are optional, so a path may end early
+            path = "[type(r1), n1.id]"
+            for hop in range(2, depth + 1):
+                seen = ", ".join(f"n{i}" for i in range(hop))
+                parts.append(
+                    f"CALL {{ WITH {seen} OPTIONAL MATCH (n{hop - 1})-[r{hop}]->(n{hop}) "
+                    f"WHERE NOT n{hop} IN [{seen}] RETURN r{hop}, n{hop} "
+                    f"ORDER BY coalesce(r{hop}.weight, 1) DESC LIMIT $fanout }}"
+                )
+                path += f" + CASE WHEN r{hop} IS NULL THEN [] ELSE [type(r{hop}), n{hop}.id] END"
+            # 3.3 $limit caps the paths, as the knowledge sequences the retriever asked for
+            parts.append(f"WITH n0, {path} AS path LIMIT $limit")
+            parts.append("RETURN n0.id AS subj, collect(path) AS flattened_rels")
+            self._queries[depth] = "\n".join(parts)
+        return self._queries[depth]
+
+    @timed("graph.rel_map", backend="neo4j")
+    def get_rel_map(self, subjs: Optional[List[str]] = None, depth: int = 2,
+                    limit: int = 30) -> Dict[str, List[List[Any]]]:
+        if not subjs:
+            return {}
+        if self._fallback:
+            return super().get_rel_map(subjs, depth, limit=limit)
+
+        seeds = [{"key": k, "query": entity_query(k)} for k in dict.fromkeys(s.lower() for s in subjs)]
+        seeds = [seed for seed in seeds if seed["query"]]
+        if not seeds:
+            return {}
+        params = {
+            "seeds": seeds,
+            "index": self.fulltext_index,
+            "candidates": max(25, self.fuzzy_matches),
+            "fuzzy": self.fuzzy_matches,
+            "fanout": self.fanout,
+            "limit": limit,
+        }
+        try:
+            data = self.query(self._traversal_query(max(1, depth)), params)
+        except neo4j.exceptions.ClientError as e:
+            # Typically the full-text index is missing (ensure_schema was never run on this graph)
+            logger.warning(f"Bounded traversal unavailable, using the unbounded query from now on: {e}")
+            self._fallback = True
+            return super().get_rel_map(subjs, depth, limit=limit)
+        return {record["subj"]: record["flattened_rels"] for record in data}
@@ -0,0 +1,178 @@
+import re
+import sys
+import time
+from typing import Callable, Optional
+
+THINK_OPEN, THINK_CLOSE = "<think>", "</think>"
+
+# Section headers of COT_PROMPT_TEMPLATE as models tend to echo them:
+# "### ANSWER (visible to user)", "**ANSWER**", "<ANSWER>", "ANSWER:"
+_HEADER = r"^[ \t]*(?:#+[ \t]*)?(?:\*\*)?<?{name}>?(?:\*\*)?[ \t]*(?:\([^)\n]*\))?[ \t]*:?(?:\*\*)?"
+ANSWER_RE = re.compile(_HEADER.format(name="ANSWER"), re.MULTILINE)
+SCRATCHPAD_RE = re.compile(_HEADER.format(name="SCRATCHPAD"), re.MULTILINE)
+ANSWER_TAGS_RE = re.compile(r"</?ANSWER>")
+# Tags that may arrive split over several deltas
+SPLIT_TAGS = (THINK_OPEN, "<ANSWER>", "</ANSWER>")
+
+# Text seen without any section header before it is treated as a plain answer
+PENDING_LIMIT = 300
+# How far past an ANSWER header we wait for the end of the header line
+HEADER_LOOKAHEAD = 40
+
+
+# 1. Incremental filter over streamed completion text
+class AnswerFilter:
+    """
+    Feed completion deltas in; get back only the user-visible part.
+
+    <think>...</think> blocks are dropped wherever they appear. Everything from a
+    SCRATCHPAD header up to the ANSWER header is hidden. Output starts right after
+    the ANSWER header line. If the model never writes the sections, the text is
+    passed through; if it writes a SCRATCHPAD but no ANSWER, flush() returns the
+    whole completion rather than nothing.
+    """
+
+    def __init__(self):
+        self.mode = "pending"  # pending | hidden | visible
+        self._in_think = False
+        self._buffer = ""  # undecided text (possible partial tag)
+        self._section = ""  # pending / hidden text searched for section headers
+        self._raw = []
+        self._emitted = False
+
+    def _answer_start(self, text: str) -> Optional[int]:
+        m = ANSWER_RE.search(text)
+        if m is None:
+            return None
+        # Commit only once the header line is complete, so "(visible to user)" never leaks
+        if text.find("\n", m.end()) < 0 and len(text) - m.end() < HEADER_LOOKAHEAD:
+            return -1
+        rest = text[m.end():]
+        return m.end() + (len(rest) - len(rest.lstrip()))
+
+    def _route(self, segment: str) -> str:
+        if self.mode == "visible":
+            return ANSWER_TAGS_RE.sub("", segment)
+
+        self._section += segment
+        start = self._answer_start(self._section)
+        if start is not None and start >= 0:
+            self.mode = "visible"
+            visible, self._section = self._section[start:], ""
+            return ANSWER_TAGS_RE.sub("", visible)
+        if start is None:
+            if self.mode == "pending" and SCRATCHPAD_RE.search(self._section):
+                self.mode = "hidden"
+            elif self.mode == "pending" and len(self._section) > PENDING_LIMIT:
+                self.mode = "visible"
+                visible, self._section = self._section.lstrip(), ""
+                return ANSWER_TAGS_RE.sub("", visible)
+            elif self.mode == "hidden":
+                # An ANSWER header can only start on the current (last) line
+                line_start = self._section.rfind("\n")
+                self._section = self._section[line_start:] if line_start >= 0 else self._section[-PENDING_LIMIT:]
+        return ""
+
+    def feed(self, delta: str) -> str:
+        self._raw.append(delta)
+        self._buffer += delta
+        out = []
+        while self._buffer:
+            if self._in_think:
+                end = self._buffer.find(THINK_CLOSE)
+                if end < 0:
+                    self._buffer = self._buffer[-(len(THINK_CLOSE) - 1):]
+                    break
+                self._buffer = self._buffer[end + len(THINK_CLOSE):]
+                self._in_think = False
+                continue
+
+            start = self._buffer.find(THINK_OPEN)
+            if start >= 0:
+                out.append(self._route(self._buffer[:start]))
+                self._buffer = self._buffer[start + len(THINK_OPEN):]
+                self._in_think = True
+                continue
+
+            # Hold back a trailing partial tag until the next delta decides it
+            hold = max(
+                (n for tag in SPLIT_TAGS for n in range(len(tag) - 1, 0, -1) if self._buffer.endswith(tag[:n])),
+                default=0,
+            )
+            out.append(self._route(self._buffer[:len(self._buffer) - hold]))
+            self._buffer = self._buffer[len(self._buffer) - hold:]
+            break
+
+        text = "".join(out)
+        if not self._emitted:
+            text = text.lstrip()
+        self._emitted = self._emitted or bool(text)
+        return text
+
+    def flush(self) -> str:
+        """Return whatever is still undecided once the completion has ended."""
+        tail = "" if self._in_think else self._buffer
+        if self.mode != "visible" and (m := ANSWER_RE.search(self._section + tail)):
+            # An ANSWER header whose line never ended
+            self.mode, tail = "visible", (self._section + tail)[m.end():]
+        if self.mode == "visible":
+            text = ANSWER_TAGS_RE.sub("", tail)
+        elif self.mode == "pending":
+            text = ANSWER_TAGS_RE.sub("", self._section + tail)
+        elif not self._emitted:
+            # SCRATCHPAD without an ANSWER header: show everything but the <think> blocks
+            text = re.sub(r"<think>.*?(</think>|$)", "", "".join(self._raw), flags=re.DOTALL)
+        else:
+            text = ""
+        self._buffer = self._section = ""
+        return text if self._emitted else text.strip()
+
+
+def visible_answer(text: str) -> str:
+    """Non-streaming form of AnswerFilter."""
+    f = AnswerFilter()
+    return (f.feed(text) + f.flush()).strip()
+
+
+# 2. Render a query-engine response: streamed token by token, or all at once
+def render_response(response, write: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Returns the visible answer. When write is given it receives the visible text
+    as it becomes available (delta by delta for a StreamingResponse).
+    """
+    if hasattr(response, "response_gen"):
+        answer_filter = AnswerFilter()
+        parts = []
+        for delta in response.response_gen:
+            if visible := answer_filter.feed(delta):
+                parts.append(visible)
+                if write is not None:
+                    write(visible)
+        if tail := answer_filter.flush():
+            parts.append(tail)
+            if write is not None:
+                write(tail)
+        return "".join(parts).strip()
+
+    answer = visible_answer(str(response))
+    if write is not None:
+        write(answer)
+    return answer
+
+
+# 3. Console writer that records time to first visible token
+class TokenClock:
+    def __init__(self, stream=sys.stdout):
+        self._stream = stream
+        self._start = time.perf_counter()
+        self.first_token: Optional[float] = None
+
+    def __call__(self, text: str) -> None:
+        if self.first_token is None and text.strip():
+            self.first_token = time.perf_counter() - self._start
+        self._stream.write(text)
+        self._stream.flush()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
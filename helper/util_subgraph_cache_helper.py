@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from helper.util_cache_helper import DiskCache
+from helper.util_metrics_helper import count
+
+logger = logging.getLogger(__name__)
+
+
+# 1. Graph-store proxy with a per-entity subgraph cache
+class CachedGraphStore:
+    """
+    Wraps a graph store and caches get_rel_map / get per entity in an in-process LRU,
+    optionally backed by a DiskCache so the cache survives restarts.
+
+    Entries are tagged with the graph version stamp (GraphMeta.version), re-read at most
+    every `version_refresh` seconds; when ingestion bumps it, the whole cache is dropped.
+    Writes through this proxy drop it as well. Everything else is passed through.
+    """
+
+    def __init__(self, graph_store, graph_version: Callable[[], int], max_entries: int = 1024,
+                 disk_cache: Optional[DiskCache] = None, version_refresh: float = 30.0):
+        self._graph_store = graph_store
+        self._graph_version = graph_version
+        self._max_entries = max_entries
+        self._disk = disk_cache
+        self._version_refresh = version_refresh
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, Any]" = OrderedDict()
+        self._version: Optional[int] = None
+        self._version_checked = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    # 1.1 Version check; a changed version clears memory and disk
+    def _current_version(self) -> int:
+        if self._version is None or time.monotonic() - self._version_checked > self._version_refresh:
+            version = self._graph_version()
+            self._version_checked = time.monotonic()
+            if version != self._version:
+                with self._lock:
+                    self._lru.clear()
+                if self._disk is not None and self._disk.get("__version__") != version:
+                    self._disk.clear()
+                    self._disk.set("__version__", version)
+                self._version = version
+        return self._version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._lru.clear()
+        if self._disk is not None:
+            self._disk.clear()
+        self._version = None
+
+    # 1.2 LRU (+ disk) lookups
+    def _lookup(self, keys: List[str]) -> Dict[str, Any]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+        if self._disk is not None and len(found) < len(keys):
+            from_disk = self._disk.get_many(k for k in keys if k not in found)
+            self._remember(from_disk, persist=False)
+            found.update(from_disk)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        count("cache_hits_total", len(found), cache="subgraphs")
+        count("cache_misses_total", len(keys) - len(found), cache="subgraphs")
+        return found
+
+    def _remember(self, entries: Dict[str, Any], persist: bool = True) -> None:
+        with self._lock:
+            for key, value in entries.items():
+                self._lru[key] = value
+                self._lru.move_to_end(key)
+            while len(self._lru) > self._max_entries:
+                self._lru.popitem(last=False)
+        if persist and self._disk is not None:
+            for key, value in entries.items():
+                self._disk.set(key, value)
+
+    # 1.3 Cached reads
+    def get_rel_map(self, subjs: Optional[List[str]] = None, depth: int = 2, limit: int = 30) -> Dict[str, List[List[Any]]]:
+        """
+        Same result shape as Neo4jGraphStore.get_rel_map. The backend may match a keyword
+        to differently named subjects (case-insensitive or full-text fuzzy matches), so
+        each uncached keyword is sent on its own and everything returned for it is cached
+        under that keyword (also when nothing matched).
+        """
+        if not subjs:
+            return {}
+        version = self._current_version()
+        entities = list(dict.fromkeys(s.lower() for s in subjs))
+        keys = {e: f"v{version}:rel_map:{depth}:{limit}:{e}" for e in entities}
+        cached = self._lookup(list(keys.values()))
+
+        missing = [e for e in entities if keys[e] not in cached]
+        if missing:
+            new = {keys[e]: self._graph_store.get_rel_map([e], depth, limit=limit) or {} for e in missing}
+            self._remember(new)
+            cached.update(new)
+
+        # limit caps the paths over all keywords together, as one backend call would
+        rel_map: Dict[str, List[List[Any]]] = {}
+        left = limit
+        for e in entities:
+            for subj, flats in cached[keys[e]].items():
+                if left > 0 and subj not in rel_map:
+                    rel_map[subj] = flats[:left]
+                    left -= len(rel_map[subj])
+        return rel_map
+
+    def get(self, subj: str) -> List[List[str]]:
+        key = f"v{self._current_version()}:get:{subj}"
+        cached = self._lookup([key])
+        if key in cached:
+            return cached[key]
+        value = self._graph_store.get(subj)
+        self._remember({key: value})
+        return value
+
+    # 1.4 Writes go through and invalidate
+    def upsert_triplet(self, subj: str, rel: str, obj: str) -> None:
+        self._graph_store.upsert_triplet(subj, rel, obj)
+        self.invalidate()
+
+    def delete(self, subj: str, rel: str, obj: str) -> None:
+        self._graph_store.delete(subj, rel, obj)
+        self.invalidate()
+
+    def __getattr__(self, name):
+        return getattr(self._graph_store, name)
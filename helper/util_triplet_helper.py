@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.indices.knowledge_graph.base import KnowledgeGraphIndex
+from llama_index.core.prompts.default_prompts import DEFAULT_KG_TRIPLET_EXTRACT_PROMPT
+from llama_index.core.schema import Document, MetadataMode
+from tqdm.auto import tqdm
+
+from config import config
+from helper.util_cache_helper import DiskCache
+from helper.util_metrics_helper import count
+
+logger = logging.getLogger(__name__)
+
+Triplet = Tuple[str, str, str]
+
+
+# 1. Concurrent, cached triplet extraction
+class TripletExtractor:
+    """
+    Extracts knowledge triplets the way KnowledgeGraphIndex does (same chunking,
+    prompt and parser), but runs up to `concurrency` chunk requests against the
+    LLM at once and caches every chunk's triplets by model + prompt + text hash.
+    Failed requests are retried `max_retries` times with exponential backoff.
+    """
+
+    def __init__(self, llm=None, max_triplets_per_chunk: int = 8, concurrency: Optional[int] = None,
+                 cache: Optional[DiskCache] = None, node_parser=None, max_object_length: int = 128,
+                 max_retries: Optional[int] = None, retry_backoff: Optional[float] = None):
+        self.llm = llm or Settings.llm
+        self.concurrency = concurrency or config.KG_EXTRACT_CONCURRENCY
+        self.max_retries = config.KG_EXTRACT_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = config.KG_EXTRACT_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self.cache = cache
+        self.node_parser = node_parser or Settings.node_parser
+        self.max_object_length = max_object_length
+        self.prompt = DEFAULT_KG_TRIPLET_EXTRACT_PROMPT.partial_format(max_knowledge_triplets=max_triplets_per_chunk)
+
+        model = getattr(self.llm, "model", type(self.llm).__name__)
+        prompt_hash = hashlib.sha256(self.prompt.get_template().encode("utf-8")).hexdigest()[:16]
+        self._key_prefix = f"{model}:{prompt_hash}:{max_triplets_per_chunk}"
+
+        self._stats_lock = threading.Lock()
+        self.stats = {"chunks": 0, "cached": 0, "llm_calls": 0, "failed": 0, "tokens": 0, "seconds": 0.0}
+
+    # 1.1 One chunk
+    def chunk_key(self, text: str) -> str:
+        return f"{self._key_prefix}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def chunk_texts(self, doc: Document) -> List[str]:
+        return [n.get_content(metadata_mode=MetadataMode.LLM) for n in self.node_parser.get_nodes_from_documents([doc])]
+
+    def _chat_with_retry(self, text: str):
+        messages = self.prompt.format_messages(llm=self.llm, text=text)
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.llm.chat(messages)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def _extract_chunk(self, key: str, text: str) -> List[Triplet]:
+        response = self._chat_with_retry(text)
+        triplets = KnowledgeGraphIndex._parse_triplet_response(
+            response.message.content or "", max_length=self.max_object_length
+        )
+        usage = (response.raw or {}).get("usage", {}) if isinstance(response.raw, dict) else {}
+        with self._stats_lock:
+            self.stats["llm_calls"] += 1
+            self.stats["tokens"] += usage.get("total_tokens", 0)
+        if self.cache is not None:
+            self.cache.set(key, [list(t) for t in triplets])
+        return triplets
+
+    # 1.2 Many documents; yields (unit key, triplets) as soon as all of a unit's chunks are done
+    def extract_units(self, units: Iterable[Optional[Tuple[str, Document]]],
+                      max_pending: Optional[int] = None) -> Iterator[Tuple[str, Optional[List[Triplet]]]]:
+        """
+        units is consumed lazily: new units are only pulled while fewer than max_pending
+        chunk requests (default 4 x concurrency) are in flight, so a slow LLM holds back
+        the producer instead of piling up chunks. A None item means the producer has
+        nothing ready yet; finished units are still handed out while it catches up.
+        A unit with a chunk that failed all its retries is yielded with None triplets.
+        """
+        start = time.perf_counter()
+        max_pending = max_pending or self.concurrency * 4
+        unit_chunks: Dict[str, List[str]] = {}
+        results: Dict[str, Optional[List[Triplet]]] = {}  # None = the chunk failed
+        refs: Dict[str, int] = {}  # units holding each chunk result, freed when it drops to 0
+        # Units waiting on each in-flight chunk; identical chunks across units share one request
+        waiting: Dict[str, List[str]] = {}
+        remaining: Dict[str, int] = {}
+        futures: Dict[Future, str] = {}
+
+        progress = tqdm(total=0, desc="Extracting triplets", unit="chunk")
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="triplet")
+
+        def register(unit_key: str, doc: Document) -> bool:
+            """Look the unit's chunks up in the cache and submit the misses; True if nothing is left to wait for."""
+            chunks = self.chunk_texts(doc)
+            keys = [self.chunk_key(t) for t in chunks]
+            texts = dict(zip(keys, chunks))
+            lookup = [k for k in texts if k not in results and k not in waiting]
+            if self.cache is not None and lookup:
+                results.update((k, [tuple(t) for t in v]) for k, v in self.cache.get_many(lookup).items())
+
+            cached = sum(results.get(k) is not None for k in keys)
+            self.stats["chunks"] += len(keys)
+            self.stats["cached"] += cached
+            count("cache_hits_total", cached, cache="triplets")
+            count("cache_misses_total", len(keys) - cached, cache="triplets")
+
+            unit_chunks[unit_key] = keys
+            for k in keys:
+                refs[k] = refs.get(k, 0) + 1
+            misses = {k for k in keys if k not in results}
+            remaining[unit_key] = len(misses)
+            for k in misses:
+                if k not in waiting:
+                    waiting[k] = []
+                    futures[pool.submit(self._extract_chunk, k, texts[k])] = k
+                    progress.total += 1
+                waiting[k].append(unit_key)
+            return not misses
+
+        def collect(unit_key: str) -> Tuple[str, Optional[List[Triplet]]]:
+            keys = unit_chunks.pop(unit_key)
+            del remaining[unit_key]
+            if any(results[k] is None for k in keys):
+                triplets = None
+            else:
+                triplets = [t for k in keys for t in results[k]]
+            for k in keys:
+                refs[k] -= 1
+                if refs[k] == 0:
+                    del refs[k]
+                    results.pop(k, None)
+            return unit_key, triplets
+
+        try:
+            items = iter(units)
+            exhausted = False
+            while True:
+                # 1.2.1 Pull units until the request window is full or the producer has nothing ready
+                idle = False
+                while not exhausted and len(futures) < max_pending:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if item is None:
+                        idle = True
+                        break
+                    if register(*item):
+                        yield collect(item[0])
+                if not futures:
+                    if exhausted:
+                        break
+                    continue
+
+                # 1.2.2 Hand out every unit whose last chunk just finished
+                done, _ = wait(futures, timeout=0.1 if idle else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = futures.pop(future)
+                    try:
+                        results[key] = future.result()
+                    except Exception as e:
+                        logger.error(f"Triplet extraction failed after {self.max_retries} retries: {e}")
+                        count("extract_failures_total")
+                        with self._stats_lock:
+                            self.stats["failed"] += 1
+                        results[key] = None
+                    progress.update(1)
+                    elapsed = time.perf_counter() - start
+                    progress.set_postfix(tok_s=f"{self.stats['tokens'] / elapsed:.0f}", refresh=False)
+                    for unit_key in waiting.pop(key):
+                        remaining[unit_key] -= 1
+                        if remaining[unit_key] == 0:
+                            yield collect(unit_key)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            progress.close()
+            self.stats["seconds"] += time.perf_counter() - start
+
+    # 1.3 Throughput
+    def report(self) -> str:
+        s = self.stats
+        seconds = max(s["seconds"], 1e-9)
+        return (
+            f"Triplet extraction: {s['chunks']} chunks in {s['seconds']:.1f}s "
+            f"({s['chunks'] / seconds:.2f} chunks/s, {s['tokens'] / seconds:.0f} tokens/s); "
+            f"{s['cached']} cached, {s['llm_calls']} LLM calls at concurrency {self.concurrency}"
+            + (f", {s['failed']} failed" if s["failed"] else "")
+        )
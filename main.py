@@ -16,13 +16,11 @@ from llama_index.core import (
 )
 
 from llama_index.core.tools import QueryEngineTool
-from llama_index.graph_stores.neo4j import Neo4jGraphStore
-from llama_index.llms.ollama import Ollama
-from llama_index.embeddings.ollama import OllamaEmbedding
 
 from config import config
-from helper.util_doc_helper import build_docs_with_metadata
-from helper.util_image_helper import extract_images_from_pdf, describe_image_with_llava
+from helper.util_embedding_helper import build_embed_model
+from helper.util_cache_helper import open_cache
+from helper.util_canonical_helper import build_canonicalizer
 from helper.util_link_helper import (
     extract_links_from_directory,
     push_links_to_graph,
@@ -30,8 +28,22 @@ from helper.util_link_helper import (
     fetch_public_docs,
     preprocess_downloaded_docs,
     add_main_pdfs_to_neo4j,
+    remove_pdfs_from_neo4j,
 )
-from prompt_templates.cot_prompt_template import COT_PROMPT_TEMPLATE
+from helper.util_manifest_helper import IngestionManifest, sha256_file
+from helper.util_metrics_helper import StageClock, export_metrics_at_exit, span, start_profiler
+from helper.util_pipeline_helper import IngestSource, StreamingIngestion
+from helper.util_query_engine_helper import (
+    build_graph_store,
+    build_llm,
+    build_query_cache,
+    build_query_engine,
+    cache_graph_store,
+    open_graph_writer,
+)
+from helper.util_stream_helper import TokenClock, render_response
+from helper.util_triplet_helper import TripletExtractor
+from helper.util_retrieval_helper import delete_vector_documents, load_vector_index
 
 # Logging and asyncio patch
 logging.basicConfig(
@@ -41,79 +53,92 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 nest_asyncio.apply()
 
+# Spans per stage and per external call (Ollama, graph, HTTP) plus cache/token/byte counters
+# are written to METRICS_PATH on exit; PROFILE_PATH adds a cProfile of the whole run
+start_profiler(config.PROFILE_PATH)
+export_metrics_at_exit(config.METRICS_PATH)
+stages = StageClock()
+
 # 2. Model Configuration: LLM and Embedding
-llm = Ollama(
-    model=config.OLLAMA_LLM_MODEL,
-    base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}",
-    request_timeout=600.0
-)
+llm = build_llm()
 Settings.llm = llm
 
-embed_model = OllamaEmbedding(
+embed_model = build_embed_model(
     model_name=config.OLLAMA_EMBED_MODEL,
     base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}",
+    cache_dir=config.EMBED_CACHE_DIR,
+    embed_batch_size=config.EMBED_BATCH_SIZE,
     trust_remote_code=True,
 )
 Settings.embed_model = embed_model
 
-# 3. Load PDF Documents from Directory
-docs = []
-for pdf_path in pathlib.Path(config.DOC_DIR).glob("*.pdf"):
-    docs.extend(build_docs_with_metadata(str(pdf_path)))
+# 3. Find new or changed PDF Documents in the Directory
+# The manifest keys every file and unit (page, image, linked doc) by content hash,
+# so a rerun only sends what changed to triplet extraction.
+stages.start("scan")
+manifest = IngestionManifest(pathlib.Path(config.INGEST_MANIFEST_PATH))
+
+pdf_paths = sorted(pathlib.Path(config.DOC_DIR).glob("*.pdf"))
+pdf_digests = {f"pdf/{p.name}": sha256_file(p) for p in pdf_paths}
+changed_pdfs = [
+    p for p in pdf_paths
+    if not manifest.is_file_unchanged(f"pdf/{p.name}", pdf_digests[f"pdf/{p.name}"])
+]
+print(f"{len(changed_pdfs)} of {len(pdf_paths)} PDFs are new or changed since the last run")
+sources = [IngestSource(f"pdf/{p.name}", p, pdf_digests[f"pdf/{p.name}"], extract_images=True) for p in changed_pdfs]
 
 # 4. Steps for Neo4j Graph Initialization from PDF Links
+# Neo4j (one pooled driver) or the embedded SQLite graph, per GRAPH_BACKEND;
+# PDF/LinkedDoc/CITES writes are buffered and flushed in batches
+stages.start("link_graph")
+graph_writer = open_graph_writer()
+# Unique constraints behind every MERGE key, plus the entity full-text index used at query time
+graph_writer.ensure_schema()
+
 link_map = extract_links_from_directory(config.DOC_DIR)
 
-add_main_pdfs_to_neo4j(
-    uri=config.NEO4J_URI,
-    user=config.NEO4J_USERNAME,
-    pwd=config.NEO4J_PASSWORD,
-    docs_dir=config.DOC_DIR
-)
+add_main_pdfs_to_neo4j(graph_writer, docs_dir=config.DOC_DIR)
 
-push_links_to_graph(
-    uri=config.NEO4J_URI,
-    user=config.NEO4J_USERNAME,
-    pwd=config.NEO4J_PASSWORD,
-    link_map=link_map
-)
+push_links_to_graph(graph_writer, link_map=link_map)
 
 update_link_status(
-    uri=config.NEO4J_URI,
-    user=config.NEO4J_USERNAME,
-    pwd=config.NEO4J_PASSWORD
+    graph_writer,
+    timeout=config.LINK_CHECK_TIMEOUT,
+    concurrency=config.LINK_CHECK_CONCURRENCY,
+    per_domain=config.LINK_CHECK_PER_DOMAIN,
+    max_domain_errors=config.LINK_CHECK_MAX_DOMAIN_ERRORS
 )
 
+gone_pdfs = manifest.missing_files(pdf_digests, prefix="pdf/")
+if gone_pdfs:
+    remove_pdfs_from_neo4j(graph_writer, names=[key.split("/", 1)[1] for key in gone_pdfs])
+
 # 5. Process Linked External Documents (e.g. public URLs in PDFs)
+stages.start("linked_docs")
 RAW_DIR = pathlib.Path(config.DOWNLOAD_DOC_DIR) / "linked_raw"
 CLEAN_DIR = pathlib.Path(config.DOWNLOAD_DOC_DIR) / "linked_clean"
 
 fetch_public_docs(
-    uri=config.NEO4J_URI,
-    user=config.NEO4J_USERNAME,
-    pwd=config.NEO4J_PASSWORD,
-    raw_dir=RAW_DIR
+    graph_writer,
+    raw_dir=RAW_DIR,
+    concurrency=config.DOWNLOAD_CONCURRENCY,
+    timeout=config.DOWNLOAD_TIMEOUT,
+    max_bytes=config.DOWNLOAD_MAX_BYTES,
+    refresh=config.DOWNLOAD_REFRESH
 )
 
-preprocess_downloaded_docs(RAW_DIR, CLEAN_DIR)
+preprocess_downloaded_docs(RAW_DIR, CLEAN_DIR, workers=config.PARSE_WORKERS)
 
-extra_docs = []
+linked_digests = {}
 
 if CLEAN_DIR.exists() and any(CLEAN_DIR.iterdir()):
-    for file in CLEAN_DIR.iterdir():
-        if file.suffix.lower() == ".pdf":
-            extra_docs.extend(build_docs_with_metadata(str(file)))
-        elif file.suffix.lower() == ".txt":
-            text = file.read_text(encoding="utf-8")
-            extra_docs.append(Document(
-                text=text,
-                metadata={
-                    "source": "linked_doc",
-                    "filename": file.name,
-                    "type": "text"
-                }
-            ))
-    docs.extend(extra_docs)
+    for file in sorted(CLEAN_DIR.iterdir()):
+        if file.suffix.lower() not in (".pdf", ".txt"):
+            continue
+        file_key = f"linked/{file.name}"
+        linked_digests[file_key] = sha256_file(file)
+        if not manifest.is_file_unchanged(file_key, linked_digests[file_key]):
+            sources.append(IngestSource(file_key, file, linked_digests[file_key]))
 else:
     logger.warning(f"No files found in {CLEAN_DIR}. Skipping extra_docs loading.")
 
@@ -123,68 +148,105 @@ else:
 #     for link in links:
 #         print(f" - Page {link['page']}: {link['uri']}")
 
-# 7. Extract Images from PDFs and Generate Descriptions
-IMG_DIR = pathlib.Path("output-images")
-image_caption_docs = []
-
-for pdf_file in pathlib.Path(config.DOC_DIR).glob("*.pdf"):
-    image_paths = extract_images_from_pdf(str(pdf_file), IMG_DIR)
-
-    for img_path, page_number in image_paths:
-        caption = describe_image_with_llava(img_path)
-        print(f"\n[Image]: {img_path.name}\n[Description]: {caption}")
-
-        doc = Document(
-            text=caption,
-            metadata={
-                "source": "image",
-                "filename": str(img_path.name),
-                "pdf_name": pdf_file.name,
-                "page": page_number
-            }
-        )
-        image_caption_docs.append(doc)
-
-docs.extend(image_caption_docs)
-
-# 8. Build Knowledge Graph Index in Neo4j
-graph_store = Neo4jGraphStore(
-    username=config.NEO4J_USERNAME,
-    password=config.NEO4J_PASSWORD,
-    url=config.NEO4J_URI,
-    database="neo4j",
-    timeout=600.0
-)
+# 7. Build Knowledge Graph Index in the graph store (Neo4j or the local SQLite graph)
+# Its get_rel_map uses the full-text index and follows at most KG_TRAVERSAL_FANOUT edges per hop
+stages.start("graph_cleanup")
+graph_store = build_graph_store()
 
 storage_context = StorageContext.from_defaults(graph_store=graph_store)
 
-kg_index = KnowledgeGraphIndex.from_documents(
-    docs,
-    storage_context=storage_context,
-    max_triplets_per_chunk=8,
-    embed_model=embed_model,
-    show_progress=True
+# Chunk embeddings for vector retrieval live next to the graph; ref doc ids are "<file_key>#<unit_id>"
+vector_index = load_vector_index(pathlib.Path(config.VECTOR_INDEX_DIR), embed_model)
+
+# 7.1 Remove graph content whose source file is gone
+removed_files = manifest.missing_files([*pdf_digests, *linked_digests])
+for file_key in removed_files:
+    delete_vector_documents(vector_index, [f"{file_key}#{uid}" for uid in manifest.unit_ids(file_key)])
+    graph_writer.delete_triplets(manifest.forget_file(file_key))
+if removed_files:
+    vector_index.storage_context.persist(persist_dir=config.VECTOR_INDEX_DIR)
+manifest.save()
+# Tell query-side caches that the graph changed; ingestion below bumps the version after every commit
+if gone_pdfs or removed_files:
+    graph_writer.bump_graph_version()
+
+# 7.2 Stream new or changed files through parse -> caption -> triplets -> graph/vector writes
+# Stages run concurrently behind bounded queues, so the LLM starts on the first file while
+# later ones are still being parsed and memory stays flat however large the corpus is.
+# Text comes from layout blocks: running headers/footers are dropped, tables stay whole and
+# pages are packed into token-bounded chunks. Chunks are sent to the LLM concurrently, cached
+# by content hash + model, and every unit is recorded in the manifest once its triplets are
+# flushed, so an interrupted run resumes where it stopped. Before the write, entity names are
+# mapped to canonical names (normalized keys, alias table, embedding similarity) and repeated
+# triplets collapse into one edge weighted by the number of units stating it.
+stages.start("ingest")
+extractor = TripletExtractor(
+    llm=llm,
+    max_triplets_per_chunk=config.KG_MAX_TRIPLETS_PER_CHUNK,
+    concurrency=config.KG_EXTRACT_CONCURRENCY,
+    cache=open_cache(config.TRIPLET_CACHE_PATH, table="triplets"),
 )
-
-# 9. Configure Query Engine using KG Retriever
-from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.core.retrievers import KnowledgeGraphRAGRetriever
-
-graph_rag_retriever = KnowledgeGraphRAGRetriever(
-    storage_context=storage_context,
-    verbose=True
+ingestion = StreamingIngestion(
+    manifest,
+    graph_writer,
+    vector_index,
+    extractor,
+    persist_dir=config.VECTOR_INDEX_DIR,
+    layout_options=dict(
+        chunk_tokens=config.CHUNK_MAX_TOKENS,
+        detect_tables=config.PARSE_DETECT_TABLES,
+        margin=config.CHUNK_BOILERPLATE_MARGIN,
+        repeat_share=config.CHUNK_BOILERPLATE_SHARE,
+    ),
+    image_dir=pathlib.Path("output-images") if config.SAVE_EXTRACTED_IMAGES else None,
+    caption_cache=open_cache(config.CAPTION_CACHE_PATH),
+    phash_max_distance=config.IMAGE_PHASH_MAX_DISTANCE,
+    workers=config.PARSE_WORKERS,
+    pages_per_task=config.PARSE_PAGES_PER_TASK,
+    parse_ahead=config.INGEST_PARSE_AHEAD,
+    queue_size=config.INGEST_QUEUE_SIZE,
+    commit_every=config.INGEST_COMMIT_EVERY,
+    canonicalizer=build_canonicalizer(embed_model),
+    persist_interval=config.INGEST_PERSIST_INTERVAL,
 )
-
-query_engine = RetrieverQueryEngine.from_args(
-    graph_rag_retriever,
-    embed_model=embed_model
+ingest_stats = ingestion.run(sources)
+
+if ingest_stats["boilerplate_blocks"]:
+    print(f"Dropped {ingest_stats['boilerplate_blocks']} running header/footer blocks")
+saved = ingest_stats["repeated_xref"] + ingest_stats["low_entropy"] + ingest_stats["near_duplicate"]
+print(
+    f"\nImage prefilter saved {saved} VLM calls: {ingest_stats['repeated_xref']} repeated xrefs, "
+    f"{ingest_stats['low_entropy']} low-entropy, {ingest_stats['near_duplicate']} near-duplicates "
+    f"({ingest_stats['too_small']} too small; {ingest_stats['captioned']} images sent to the captioner)"
 )
-
-query_engine.update_prompts(
-    {"response_synthesizer:text_qa_template": COT_PROMPT_TEMPLATE}
+if ingest_stats["caption_failed"]:
+    print(f"{ingest_stats['caption_failed']} images could not be captioned and are retried on the next run")
+if ingest_stats["extract_failed"]:
+    print(f"{ingest_stats['extract_failed']} units failed triplet extraction and are retried on the next run")
+if ingest_stats["units"]:
+    print(f"\n{extractor.report()}")
+    print(f"Wrote {ingest_stats['triplets']} triplets ({ingest_stats['duplicate_triplets']} duplicates merged)")
+
+# 8. Configure Query Engine using KG and/or vector retrieval
+stages.start("query_setup")
+# Entity subgraphs are cached per graph version, so popular entities are not re-expanded on every question
+query_storage_context = StorageContext.from_defaults(graph_store=cache_graph_store(graph_store, graph_writer.graph_version))
+query_engine = build_query_engine(
+    query_storage_context, vector_index, embed_model, llm=llm, streaming=config.QUERY_STREAMING
 )
 
-# 10. Run Interactive Query Loop
+# 9. Run Interactive Query Loop (answers cached per graph version)
+query_cache = build_query_cache(embed_model, graph_writer.graph_version)
+stages.stop()
+print(f"\n{stages.report()}")
+
 while user_query := input("\n\nWhat do you want to know about these files?\n"):
-    response = query_engine.query(user_query)
-    print(str(response))
+    # Only the ANSWER section is shown, streamed as it is generated
+    clock = TokenClock()
+    with span("query"):
+        if query_cache is not None:
+            query_cache.query(query_engine, user_query, write=clock)
+        else:
+            render_response(query_engine.query(user_query), write=clock)
+    if clock.first_token is not None:
+        print(f"\n(first visible token after {clock.first_token:.2f}s, total {clock.elapsed:.2f}s)")
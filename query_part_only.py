@@ -4,60 +4,21 @@
 import nest_asyncio
 import sys
 
-from llama_index.core import Settings, StorageContext, PromptTemplate
-from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.core.retrievers import KnowledgeGraphRAGRetriever
-from llama_index.graph_stores.neo4j import Neo4jGraphStore
-from llama_index.llms.ollama import Ollama
-from llama_index.embeddings.ollama import OllamaEmbedding
-
 from config import config
-from prompt_templates.cot_prompt_template import COT_PROMPT_TEMPLATE
+from helper.util_metrics_helper import export_metrics_at_exit, span, start_profiler
+from helper.util_query_engine_helper import load_query_stack
+from helper.util_stream_helper import TokenClock, render_response
 
 nest_asyncio.apply()
+start_profiler(config.PROFILE_PATH)
+export_metrics_at_exit(config.METRICS_PATH)
 
-# 2. Initialize Ollama LLM and Embedding Model
-llm = Ollama(
-    model=config.OLLAMA_LLM_MODEL,
-    base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}",
-    request_timeout=600.0,
-)
-Settings.llm = llm
-
-embed_model = OllamaEmbedding(
-    model_name=config.OLLAMA_EMBED_MODEL,
-    base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}",
-)
-Settings.embed_model = embed_model
-
-# 3. Connect to Existing Neo4j Knowledge Graph
-graph_store = Neo4jGraphStore(
-    username=config.NEO4J_USERNAME,
-    password=config.NEO4J_PASSWORD,
-    url=config.NEO4J_URI,
-    database="neo4j",
-    timeout=600.0,
-)
-
-storage_context = StorageContext.from_defaults(graph_store=graph_store)
-
-# 4. Set Up Retriever and Query Engine
-graph_rag_retriever = KnowledgeGraphRAGRetriever(
-    storage_context=storage_context,
-    verbose=True,
-)
-
-query_engine = RetrieverQueryEngine.from_args(
-    graph_rag_retriever,
-    embed_model=embed_model,
-)
-
-# 5. Apply Prompt Template (Chain-of-Thought Style)
-query_engine.update_prompts(
-    {"response_synthesizer:text_qa_template": COT_PROMPT_TEMPLATE}
-)
+# 2. LLM, embedding model, Neo4j graph, retriever (KG, vector or hybrid), CoT query engine
+#    and the answer cache (Redis, or in-process fallback) invalidated by the graph version stamp
+stack = load_query_stack(streaming=config.QUERY_STREAMING)
+query_engine, query_cache = stack.query_engine, stack.query_cache
 
-# 6. Start an Interactive Question-Answer Loop
+# 3. Start an Interactive Question-Answer Loop
 print("Neo4j RAG assistant is ready. Ask a question or press Enter to exit.\n")
 
 try:
@@ -67,8 +28,16 @@ try:
             print("Exiting.")
             break
 
-        answer = query_engine.query(user_query)
-        print("\nAnswer:\n" + str(answer) + "\n")
+        # The SCRATCHPAD / <think> reasoning is hidden; the answer streams as it is generated
+        print("\nAnswer:")
+        clock = TokenClock()
+        with span("query"):
+            if query_cache is not None:
+                answer, cache_result = query_cache.query(query_engine, user_query, write=clock)
+            else:
+                answer, cache_result = render_response(query_engine.query(user_query), write=clock), "off"
+        first_token = f"{clock.first_token:.2f}s" if clock.first_token is not None else "n/a"
+        print(f"\n\n(cache: {cache_result}; first visible token after {first_token}, total {clock.elapsed:.2f}s)\n")
 
 except (KeyboardInterrupt, EOFError):
     print("\nExiting.")
@@ -0,0 +1,165 @@
+# query_server.py
+# Long-running HTTP front end for the RAG assistant. The port opens immediately;
+# llama_index, Neo4j and the Ollama models are loaded once in the background.
+#
+#   POST /query   {"question": "..."}  ->  {"answer": "...", "cache": "miss", "seconds": 1.2}
+#   GET  /health                        ->  {"status": "ready" | "starting" | "failed"}
+#   GET  /metrics                       ->  Prometheus text: spans per Ollama / graph / retrieval call, cache counters
+
+# 1. Lightweight imports only
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import config
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+# 2. Query service: one query engine, driven from a background asyncio loop
+class QueryService:
+    def __init__(self, max_concurrency: int):
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="query-loop", daemon=True)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._ready = threading.Event()
+        self.stack = None
+        self.error = None
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return "failed"
+        return "ready" if self._ready.is_set() else "starting"
+
+    # 2.1 Heavy imports, connections and model warm-up happen here, once
+    def start(self, warmup: bool = True) -> None:
+        start = time.perf_counter()
+        try:
+            import nest_asyncio
+
+            # Parts of llama_index call asyncio.run from sync code paths
+            nest_asyncio.apply(self._loop)
+            self._loop_thread.start()
+
+            from helper.util_query_engine_helper import load_query_stack, warm_up
+
+            self.stack = load_query_stack()
+            if warmup:
+                warm_up(self.stack)
+        except Exception as e:
+            logger.exception("Query service failed to start")
+            self.error = e
+        else:
+            logger.info(f"Query service ready in {time.perf_counter() - start:.1f}s")
+        finally:
+            self._ready.set()
+
+    async def _answer(self, question: str):
+        from helper.util_metrics_helper import span
+        from helper.util_stream_helper import render_response
+
+        async with self._semaphore:
+            with span("query"):
+                if self.stack.query_cache is not None:
+                    return await self.stack.query_cache.aquery(self.stack.query_engine, question)
+                return render_response(await self.stack.query_engine.aquery(question)), "off"
+
+    # 2.2 Called from HTTP handler threads
+    def ask(self, question: str, timeout: float):
+        if not self._ready.wait(timeout) or self.error is not None:
+            raise RuntimeError(f"query service is {self.status}")
+        future = asyncio.run_coroutine_threadsafe(self._answer(question), self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+
+# 3. HTTP handler
+def make_handler(service: QueryService, timeout: float):
+    class QueryHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                from helper.util_metrics_helper import METRICS
+
+                body = METRICS.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if self.path != "/health":
+                return self._send_json(404, {"error": "not found"})
+            self._send_json(200 if service.status == "ready" else 503, {"status": service.status})
+
+        def do_POST(self):
+            if self.path != "/query":
+                return self._send_json(404, {"error": "not found"})
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                question = str(payload.get("question", "")).strip()
+            except (ValueError, AttributeError):
+                return self._send_json(400, {"error": "expected a JSON object with a 'question'"})
+            if not question:
+                return self._send_json(400, {"error": "empty question"})
+
+            start = time.perf_counter()
+            try:
+                answer, cache_result = service.ask(question, timeout)
+            except RuntimeError as e:
+                return self._send_json(503, {"error": str(e)})
+            except concurrent.futures.TimeoutError:
+                return self._send_json(504, {"error": f"no answer within {timeout:.0f}s"})
+            except Exception as e:
+                logger.exception("Query failed")
+                return self._send_json(500, {"error": str(e)})
+            self._send_json(200, {"answer": answer, "cache": cache_result,
+                                  "seconds": round(time.perf_counter() - start, 3)})
+
+        def log_message(self, format, *args):
+            logger.info("%s - %s", self.address_string(), format % args)
+
+    return QueryHandler
+
+
+# 4. Entry point
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve RAG queries over HTTP")
+    parser.add_argument("--host", default=config.QUERY_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.QUERY_SERVER_PORT)
+    parser.add_argument("--no-warmup", action="store_true", help="skip loading the Ollama models at startup")
+    args = parser.parse_args()
+
+    service = QueryService(max_concurrency=config.QUERY_SERVER_CONCURRENCY)
+    threading.Thread(target=service.start, kwargs={"warmup": not args.no_warmup}, daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service, config.QUERY_SERVER_TIMEOUT))
+    logger.info(f"Listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
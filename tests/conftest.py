@@ -0,0 +1,12 @@
+import os
+import sys
+from pathlib import Path
+
+# config.py validates its defaults, so the placeholders are replaced before any helper imports it
+os.environ.setdefault("NEO4J_URI", "neo4j://localhost:7687")
+os.environ.setdefault("NEO4J_PASSWORD", "test")
+os.environ.setdefault("AURA_INSTANCEID", "test")
+# Local test servers must not go through a proxy
+os.environ["NO_PROXY"] = os.environ["no_proxy"] = "127.0.0.1,localhost"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
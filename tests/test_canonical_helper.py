@@ -0,0 +1,41 @@
+from helper.util_canonical_helper import EntityAliasTable, EntityCanonicalizer
+
+
+class _Embeddings:
+    """Name -> fixed vector; records every batch it is asked for."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.batches = []
+
+    def get_text_embedding_batch(self, texts):
+        self.batches.append(list(texts))
+        return [self.vectors.get(text, [0.0, 0.0, 1.0]) for text in texts]
+
+
+def test_seeded_names_are_embedded_once_and_attract_merges(tmp_path):
+    embeddings = _Embeddings({"International Business Machines": [1.0, 0.0, 0.0],
+                              "Intl Business Machines": [0.99, 0.1, 0.0]})
+    canonicalizer = EntityCanonicalizer(EntityAliasTable(tmp_path / "aliases.sqlite"), embeddings, threshold=0.9)
+    canonicalizer.seed({"International Business Machines": ["IBM"]})
+
+    assert canonicalizer.resolve(["Intl Business Machines", "IBM"]) == {
+        "Intl Business Machines": "International Business Machines",
+        "IBM": "International Business Machines",
+    }
+    canonicalizer.resolve(["Red Hat"])
+    assert embeddings.batches == [["International Business Machines", "Intl Business Machines"], ["Red Hat"]]
+
+
+def test_seeded_names_already_embedded_are_not_embedded_again(tmp_path):
+    path = tmp_path / "aliases.sqlite"
+    first = _Embeddings({})
+    canonicalizer = EntityCanonicalizer(EntityAliasTable(path), first, threshold=0.9)
+    canonicalizer.seed({"Red Hat": []})
+    canonicalizer.resolve(["Fedora"])
+
+    second = _Embeddings({})
+    canonicalizer = EntityCanonicalizer(EntityAliasTable(path), second, threshold=0.9)
+    canonicalizer.seed({"Red Hat": []})
+    canonicalizer.resolve(["CentOS"])
+    assert second.batches == [["CentOS"]]
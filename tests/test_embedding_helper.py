@@ -0,0 +1,35 @@
+import numpy as np
+
+from helper.util_embedding_helper import EmbeddingCache
+
+
+def _tear(cache, vector, partial_key):
+    """What a crash in the middle of put_many leaves: the row written, its key line cut short."""
+    with open(cache._rows_path, "ab") as f:
+        f.write(np.asarray([vector], dtype=np.float32).tobytes())
+    with open(cache._keys_path, "ab") as f:
+        f.write(partial_key.encode("ascii"))
+
+
+def test_appends_after_a_torn_key_line_stay_aligned(tmp_path):
+    first = EmbeddingCache(tmp_path, "embed")
+    first.put_many({"a": [1.0, 0.0], "b": [0.0, 1.0]})
+    _tear(first, [9.0, 9.0], "c0ffee")
+
+    resumed = EmbeddingCache(tmp_path, "embed")
+    assert len(resumed) == 2
+    resumed.put_many({"c": [0.5, 0.5], "d": [0.25, 0.75]})
+    resumed.put_many({"e": [0.75, 0.25]})
+
+    reopened = EmbeddingCache(tmp_path, "embed")
+    assert reopened.get_many(["a", "b", "c", "d", "e"]) == {
+        "a": [1.0, 0.0], "b": [0.0, 1.0], "c": [0.5, 0.5], "d": [0.25, 0.75], "e": [0.75, 0.25],
+    }
+    assert "c0ffee" not in reopened.get_many(["c0ffee"])
+
+
+def test_other_processes_appends_are_picked_up(tmp_path):
+    reader, writer = EmbeddingCache(tmp_path, "embed"), EmbeddingCache(tmp_path, "embed")
+    writer.put_many({"a": [1.0, 0.0]})
+    reader.put_many({"b": [0.0, 1.0]})
+    assert reader.get_many(["a", "b"]) == {"a": [1.0, 0.0], "b": [0.0, 1.0]}
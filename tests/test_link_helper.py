@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import httpx
+
+from helper.util_link_helper import _download_one, classify_urls_async, fetch_public_docs, preprocess_downloaded_docs
+from helper.util_local_graph_helper import LocalGraphStore, LocalGraphWriter
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """HEAD-only stub: /ok, /missing (404), /private (403), /redirect -> /ok, /slow (sleeps)."""
+
+    def do_HEAD(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(server.slow_seconds)
+            if self.path.startswith("/redirect"):
+                self.send_response(302)
+                self.send_header("Location", "/ok")
+            elif self.path.startswith("/missing"):
+                self.send_response(404)
+            elif self.path.startswith("/private"):
+                self.send_response(403)
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.hits, httpd.active, httpd.max_active, httpd.slow_seconds = {}, 0, 0, 0.2
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(httpd, path, host="127.0.0.1"):
+    return f"http://{host}:{httpd.server_address[1]}{path}"
+
+
+def test_labels_follow_redirects_and_map_status_codes(server):
+    urls = [_url(server, p) for p in ("/ok", "/missing", "/private", "/redirect")]
+    statuses = asyncio.run(classify_urls_async(urls, timeout=5))
+    assert statuses == {
+        urls[0]: "accessible",
+        urls[1]: "not_found",
+        urls[2]: "unauthorized",
+        urls[3]: "accessible",
+    }
+    assert server.hits["/ok"] == 2  # once directly, once through the redirect
+
+
+def test_requests_per_domain_are_capped(server):
+    urls = [_url(server, f"/slow?{i}") for i in range(8)]
+    statuses = asyncio.run(classify_urls_async(urls, timeout=5, concurrency=16, per_domain=2))
+    assert set(statuses.values()) == {"accessible"}
+    assert server.max_active == 2
+
+
+def test_each_domain_has_its_own_cap(server):
+    urls = [_url(server, f"/slow?{i}", host) for i in range(4) for host in ("127.0.0.1", "localhost")]
+    asyncio.run(classify_urls_async(urls, timeout=5, concurrency=16, per_domain=1))
+    assert server.max_active == 2
+
+
+def test_domain_is_skipped_after_its_error_budget(server):
+    server.slow_seconds = 1.0
+    urls = [_url(server, f"/slow?{i}") for i in range(6)]
+    statuses = asyncio.run(classify_urls_async(urls, timeout=0.2, per_domain=1, max_domain_errors=2))
+    assert set(statuses.values()) == {"error"}
+    # Two timeouts use up the budget; the other four URLs are failed without a request
+    assert sum(server.hits.values()) == 2
+
+
+def test_unreachable_host_is_an_error():
+    statuses = asyncio.run(classify_urls_async(["http://127.0.0.1:9/ok"], timeout=1))
+    assert statuses == {"http://127.0.0.1:9/ok": "error"}
+
+
+class _DocHandler(BaseHTTPRequestHandler):
+    """
+    GET stub serving server.docs[path]. Range requests get 416, as after the file changed,
+    unless the path is in server.resumable. server.cut[path] bytes are sent before the
+    connection drops.
+    """
+
+    def do_GET(self):
+        body = self.server.docs[self.path]
+        self.server.ranges.append(self.headers.get("Range"))
+        status = 200
+        if self.headers.get("Range"):
+            if self.path not in self.server.resumable:
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status, body = 206, body[int(self.headers["Range"][6:-1]):]
+        self.send_response(status)
+        self.send_header("Content-Type", self.server.types.get(self.path, "application/pdf"))
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(body[:self.server.cut.pop(self.path, len(body))])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def doc_server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _DocHandler)
+    httpd.daemon_threads = True
+    httpd.docs, httpd.ranges = {}, []
+    httpd.resumable, httpd.cut, httpd.types = set(), {}, {}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_rejected_range_restarts_the_download(doc_server, tmp_path):
+    url = _url(doc_server, "/doc.pdf")
+    doc_server.docs["/doc.pdf"] = b"%PDF-1.7 new version"
+    part = tmp_path / ".partial" / (hashlib.sha256(url.encode("utf-8")).hexdigest() + ".part")
+    part.parent.mkdir()
+    part.write_bytes(b"%PDF-1.7 old")
+    part.with_suffix(".json").write_text(json.dumps({"etag": '"old"'}))
+
+    with httpx.Client() as client:
+        props = _download_one(client, url, {}, tmp_path, max_bytes=0)
+    assert doc_server.ranges == ["bytes=12-", None]
+    assert open(props["local_path"], "rb").read() == b"%PDF-1.7 new version"
+    assert not part.exists()
+
+
+def test_refresh_removes_the_superseded_version(doc_server, tmp_path):
+    raw_dir, clean_dir = tmp_path / "raw", tmp_path / "clean"
+    writer = LocalGraphWriter(LocalGraphStore(tmp_path / "graph.sqlite"))
+    urls = [_url(doc_server, "/a.pdf"), _url(doc_server, "/b.pdf")]
+    for url in urls:
+        writer.add_citation("paper.pdf", url, 1)
+        writer.set_link_properties(url, status="accessible")
+    writer.flush()
+    doc_server.docs.update({"/a.pdf": b"%PDF same", "/b.pdf": b"%PDF same"})
+    fetch_public_docs(writer, raw_dir)
+    preprocess_downloaded_docs(raw_dir, clean_dir, workers=1)
+    [first] = [f.name for f in clean_dir.iterdir()]
+
+    # /a.pdf changes; its old file is still the current version of /b.pdf and stays
+    doc_server.docs["/a.pdf"] = b"%PDF changed"
+    fetch_public_docs(writer, raw_dir, refresh=True)
+    preprocess_downloaded_docs(raw_dir, clean_dir, workers=1)
+    assert len(list(clean_dir.iterdir())) == 2
+
+    # Once /b.pdf changes too, nothing uses the first version any more
+    doc_server.docs["/b.pdf"] = b"%PDF changed"
+    fetch_public_docs(writer, raw_dir, refresh=True)
+    preprocess_downloaded_docs(raw_dir, clean_dir, workers=1)
+    assert [f.name for f in clean_dir.iterdir()] != [first]
+    assert len(list(clean_dir.iterdir())) == len([f for f in raw_dir.iterdir() if f.is_file()]) == 1
+
+
+def _accessible(tmp_path, urls):
+    writer = LocalGraphWriter(LocalGraphStore(tmp_path / "graph.sqlite"))
+    for url in urls:
+        writer.add_citation("paper.pdf", url, 1)
+        writer.set_link_properties(url, status="accessible")
+    writer.flush()
+    return writer
+
+
+def test_interrupted_download_resumes_on_the_next_run(doc_server, tmp_path):
+    raw_dir = tmp_path / "raw"
+    url = _url(doc_server, "/doc.pdf")
+    writer = _accessible(tmp_path, [url])
+    doc_server.docs["/doc.pdf"] = b"%PDF-1.7 " + b"x" * 200_000
+    doc_server.resumable.add("/doc.pdf")
+    doc_server.cut["/doc.pdf"] = 150_000
+
+    fetch_public_docs(writer, raw_dir)
+    assert [rec["url"] for rec in writer.links_to_fetch()] == [url]
+    [part] = (raw_dir / ".partial").glob("*.part")
+    kept = part.stat().st_size
+    assert kept > 0
+
+    fetch_public_docs(writer, raw_dir)
+    assert doc_server.ranges == [None, f"bytes={kept}-"]
+    assert writer.links_to_fetch() == []
+    [doc] = [f for f in raw_dir.iterdir() if f.is_file()]
+    assert doc.read_bytes() == doc_server.docs["/doc.pdf"]
+    assert list((raw_dir / ".partial").iterdir()) == []
+
+
+def test_partials_of_links_no_longer_fetched_are_removed(tmp_path):
+    raw_dir = tmp_path / "raw"
+    (raw_dir / ".partial").mkdir(parents=True)
+    (raw_dir / ".partial" / "gone.part").write_bytes(b"%PDF")
+    (raw_dir / ".partial" / "gone.json").write_text("{}")
+
+    fetch_public_docs(_accessible(tmp_path, []), raw_dir)
+    assert list((raw_dir / ".partial").iterdir()) == []
+
+
+def test_plain_text_downloads_reach_the_clean_dir(doc_server, tmp_path):
+    raw_dir, clean_dir = tmp_path / "raw", tmp_path / "clean"
+    url = _url(doc_server, "/notes")
+    doc_server.docs["/notes"] = b"Service 1 depends on Storage Pool 1."
+    doc_server.types["/notes"] = "text/plain; charset=utf-8"
+    fetch_public_docs(_accessible(tmp_path, [url]), raw_dir)
+    preprocess_downloaded_docs(raw_dir, clean_dir, workers=1)
+
+    [clean] = list(clean_dir.iterdir())
+    assert clean.suffix == ".txt"
+    assert clean.read_bytes() == doc_server.docs["/notes"]
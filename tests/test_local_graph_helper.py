@@ -0,0 +1,48 @@
+from helper.util_local_graph_helper import LocalGraphStore
+
+
+def _store(tmp_path, **kwargs):
+    store = LocalGraphStore(tmp_path / "graph.sqlite", **kwargs)
+    store.upsert_triplets([
+        ("vSphere 7", "runs on", "ESXi"),
+        ("vSphere 8", "runs on", "ESXi"),
+        ("ESXi", "part of", "vSphere 7"),
+        ("NSX_T Manager", "manages", "NSX"),
+    ])
+    return store
+
+
+def test_exact_match_is_case_insensitive_and_wins_over_fuzzy(tmp_path):
+    store = _store(tmp_path)
+    assert store.get_rel_map(["esxi"], depth=1) == {"ESXi": [["PART_OF", "vSphere 7"]]}
+
+
+def test_keyword_without_exact_match_uses_fuzzy_matches(tmp_path):
+    store = _store(tmp_path, fuzzy_matches=1)
+    assert store.get_rel_map(["vsphere"], depth=1) == {"vSphere 7": [["RUNS_ON", "ESXi"]]}
+    assert list(store.get_rel_map(["manager nsx_t"], depth=1)) == ["NSX_T Manager"]
+    # Every word must appear, and "_" is not a wildcard
+    assert store.get_rel_map(["vsphere_7"], depth=1) == {}
+    assert store.get_rel_map(["vsphere 9"], depth=1) == {}
+
+
+def test_fuzzy_matches_can_be_turned_off(tmp_path):
+    store = _store(tmp_path, fuzzy_matches=0)
+    assert store.get_rel_map(["vsphere"], depth=1) == {}
+
+
+def test_limit_caps_paths_and_fanout_caps_edges_per_node(tmp_path):
+    store = LocalGraphStore(tmp_path / "graph.sqlite", fanout=2)
+    store.upsert_triplets([("Hub", "links", f"Spoke {i}", 10 - i) for i in range(5)]
+                          + [("Spoke 0", "links", "Rim")])
+    assert store.get_rel_map(["hub"], depth=2) == {"Hub": [
+        ["LINKS", "Spoke 0", "LINKS", "Rim"], ["LINKS", "Spoke 1"],
+    ]}
+    assert store.get_rel_map(["hub"], depth=2, limit=1) == {"Hub": [["LINKS", "Spoke 0", "LINKS", "Rim"]]}
+    # The cap is over all keywords together, so later keywords only get what is left
+    assert store.get_rel_map(["hub", "spoke 0"], depth=1, limit=3) == {
+        "Hub": [["LINKS", "Spoke 0"], ["LINKS", "Spoke 1"]], "Spoke 0": [["LINKS", "Rim"]],
+    }
+    assert store.get_rel_map(["hub", "spoke 0"], depth=1, limit=2) == {
+        "Hub": [["LINKS", "Spoke 0"], ["LINKS", "Spoke 1"]],
+    }
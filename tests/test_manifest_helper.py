@@ -0,0 +1,86 @@
+import json
+
+from helper.util_manifest_helper import IngestionManifest
+
+
+def _manifest(tmp_path):
+    return IngestionManifest(tmp_path / "ingest-manifest.json")
+
+
+def test_saves_append_to_the_journal_and_replay_on_open(tmp_path):
+    manifest = _manifest(tmp_path)
+    manifest.record_unit("pdf/a.pdf", "page=1", "h1", [("A", "KNOWS", "B")])
+    manifest.record_file("pdf/a.pdf", "digest-a")
+    manifest.save()
+    manifest.record_unit("pdf/b.pdf", "page=1", "h2", [("A", "KNOWS", "B"), ("B", "KNOWS", "C")])
+    manifest.save()
+
+    assert not manifest.path.exists()
+    assert len(manifest.journal_path.read_text().splitlines()) == 3
+
+    reopened = _manifest(tmp_path)
+    assert reopened.is_file_unchanged("pdf/a.pdf", "digest-a")
+    assert reopened.diff_units("pdf/b.pdf", {"page=1": "h2"}) == ([], [])
+    # Edge weights are rebuilt from the replayed units
+    assert reopened.forget_file("pdf/b.pdf") == [("B", "KNOWS", "C")]
+    assert reopened.drain_changes() == ({("A", "KNOWS", "B"): 1}, [("B", "KNOWS", "C")])
+
+
+def test_removals_are_journaled(tmp_path):
+    manifest = _manifest(tmp_path)
+    manifest.record_unit("pdf/a.pdf", "page=1", "h1", [("A", "KNOWS", "B")])
+    manifest.record_unit("pdf/a.pdf", "page=2", "h2", [])
+    manifest.record_unit("pdf/b.pdf", "page=1", "h3", [])
+    manifest.save()
+    manifest.release_units("pdf/a.pdf", ["page=1", "page=9"])
+    manifest.forget_file("pdf/b.pdf")
+    manifest.save()
+
+    reopened = _manifest(tmp_path)
+    assert reopened.unit_ids("pdf/a.pdf") == ["page=2"]
+    assert reopened.missing_files(["pdf/a.pdf"]) == []
+    assert reopened.forget_file("pdf/a.pdf") == []
+
+
+def test_torn_last_journal_line_is_ignored(tmp_path):
+    manifest = _manifest(tmp_path)
+    manifest.record_file("pdf/a.pdf", "digest-a")
+    manifest.save()
+    with open(manifest.journal_path, "a") as f:
+        f.write('["file", "pdf/b.pdf", "dig')
+
+    reopened = _manifest(tmp_path)
+    assert reopened.is_file_unchanged("pdf/a.pdf", "digest-a")
+    assert reopened.missing_files([]) == ["pdf/a.pdf"]
+
+
+def test_saves_after_a_torn_line_survive_reopening(tmp_path):
+    manifest = _manifest(tmp_path)
+    manifest.record_file("pdf/a.pdf", "digest-a")
+    manifest.save()
+    with open(manifest.journal_path, "a") as f:
+        f.write('["file", "pdf/b.pdf", "dig')
+
+    resumed = _manifest(tmp_path)
+    resumed.record_file("pdf/c.pdf", "digest-c")
+    resumed.record_unit("pdf/c.pdf", "page=1", "h1", [("A", "KNOWS", "B")])
+    resumed.save()
+
+    reopened = _manifest(tmp_path)
+    assert reopened.is_file_unchanged("pdf/a.pdf", "digest-a")
+    assert reopened.is_file_unchanged("pdf/c.pdf", "digest-c")
+    assert reopened.unit_ids("pdf/c.pdf") == ["page=1"]
+    assert not reopened.is_file_unchanged("pdf/b.pdf", "digest-b")
+
+
+def test_compact_folds_the_journal_into_the_json_file(tmp_path):
+    manifest = _manifest(tmp_path)
+    manifest.record_unit("pdf/a.pdf", "page=1", "h1", [("A", "KNOWS", "B")])
+    manifest.record_file("pdf/a.pdf", "digest-a")
+    manifest.save()
+    manifest.compact()
+
+    assert not manifest.journal_path.exists()
+    data = json.loads(manifest.path.read_text())
+    assert data["files"]["pdf/a.pdf"]["sha256"] == "digest-a"
+    assert _manifest(tmp_path).is_file_unchanged("pdf/a.pdf", "digest-a")
@@ -0,0 +1,138 @@
+import asyncio
+
+import numpy as np
+import pytest
+from llama_index.core.llms import MockLLM
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from helper.util_query_cache_helper import InMemoryRedis, QueryCache
+
+
+class _Embeddings:
+    """Question -> fixed vector; unknown questions get an orthogonal one."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    def get_query_embedding(self, question):
+        self.calls += 1
+        return self.vectors.get(question, [0.0, 0.0, 1.0])
+
+
+class _Retriever(BaseRetriever):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def _retrieve(self, query_bundle):
+        self.calls += 1
+        kg_node = TextNode(
+            text="Paris CAPITAL_OF France",
+            metadata={"kg_rel_map": {"Paris": [["Paris", "CAPITAL_OF", "France"]]}},
+            excluded_llm_metadata_keys=["kg_rel_map"],
+            excluded_embed_metadata_keys=["kg_rel_map"],
+        )
+        return [NodeWithScore(node=kg_node, score=1.0)]
+
+
+class _Recorder(BaseNodePostprocessor):
+    seen: list = []
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        self.seen.append(query_bundle.query_str)
+        return nodes
+
+
+def _similar(angle):
+    return [float(np.cos(angle)), float(np.sin(angle)), 0.0]
+
+
+@pytest.fixture
+def engine():
+    # MockLLM answers with the prompt it was given, so the answer shows what reached the LLM
+    retriever = _Retriever()
+    recorder = _Recorder(seen=[])
+    query_engine = RetrieverQueryEngine.from_args(retriever, llm=MockLLM(), node_postprocessors=[recorder])
+    return query_engine, retriever, recorder
+
+
+def _cache(embeddings, version=lambda: 1, backend=None):
+    return QueryCache(backend or InMemoryRedis(), embeddings, graph_version=version, namespace="test",
+                      threshold=0.95, context_threshold=0.85, version_refresh=0)
+
+
+def test_exact_hit_skips_embedding_and_engine(engine):
+    query_engine, retriever, _ = engine
+    embeddings = _Embeddings({})
+    cache = _cache(embeddings)
+
+    answer, kind = cache.query(query_engine, "Where is Paris?")
+    assert kind == "miss"
+    calls = embeddings.calls
+    assert cache.query(query_engine, "  where is   paris ") == (answer, "exact")
+    assert embeddings.calls == calls
+    assert retriever.calls == 1
+
+
+def test_semantic_hit_returns_the_cached_answer(engine):
+    query_engine, retriever, _ = engine
+    cache = _cache(_Embeddings({"Where is Paris?": _similar(0.0), "Where's Paris located?": _similar(0.1)}))
+
+    answer, _ = cache.query(query_engine, "Where is Paris?")
+    assert cache.query(query_engine, "Where's Paris located?") == (answer, "semantic")
+    assert retriever.calls == 1
+
+
+def test_context_hit_reuses_postprocessed_nodes_without_metadata_dump(engine):
+    query_engine, retriever, recorder = engine
+    cache = _cache(_Embeddings({"Where is Paris?": _similar(0.0), "Which country has Paris?": _similar(0.4)}))
+
+    cache.query(query_engine, "Where is Paris?")
+    answer, kind = cache.query(query_engine, "Which country has Paris?")
+    assert kind == "context"
+    assert retriever.calls == 1
+    assert recorder.seen == ["Where is Paris?", "Which country has Paris?"]
+    assert "Paris CAPITAL_OF France" in answer and "Which country has Paris?" in answer
+    assert "kg_rel_map" not in answer
+
+
+def test_async_context_hit_matches_sync(engine):
+    query_engine, retriever, recorder = engine
+    cache = _cache(_Embeddings({"Where is Paris?": _similar(0.0), "Which country has Paris?": _similar(0.4)}))
+
+    async def ask():
+        await cache.aquery(query_engine, "Where is Paris?")
+        return await cache.aquery(query_engine, "Which country has Paris?")
+
+    answer, kind = asyncio.run(ask())
+    assert kind == "context"
+    assert retriever.calls == 1
+    assert len(recorder.seen) == 2
+    assert "kg_rel_map" not in answer
+
+
+def test_new_graph_version_invalidates_entries(engine):
+    query_engine, retriever, _ = engine
+    version = [1]
+    cache = _cache(_Embeddings({}), version=lambda: version[0])
+
+    cache.query(query_engine, "Where is Paris?")
+    version[0] = 2
+    assert cache.query(query_engine, "Where is Paris?")[1] == "miss"
+    assert retriever.calls == 2
+
+
+def test_index_picks_up_entries_of_other_processes(engine):
+    query_engine, retriever, _ = engine
+    backend = InMemoryRedis()
+    vectors = {"Where is Paris?": _similar(0.0), "Where's Paris located?": _similar(0.1)}
+    first, second = _cache(_Embeddings(vectors), backend=backend), _cache(_Embeddings(vectors), backend=backend)
+
+    assert second.lookup("Where's Paris located?")[0] == "miss"
+    first.query(query_engine, "Where is Paris?")
+    assert second.query(query_engine, "Where's Paris located?")[1] == "semantic"
+    assert retriever.calls == 1
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import time
+
+from llama_index.core import StorageContext
+from llama_index.core.graph_stores.simple import SimpleGraphStore
+from llama_index.core.llms import MockLLM
+
+from helper.util_retrieval_helper import GraphRAGRetriever
+
+
+class _SlowGraphStore(SimpleGraphStore):
+    """Blocking get_rel_map, like the Neo4j and SQLite stores."""
+
+    def get_rel_map(self, subjs=None, depth=2, limit=30):
+        self.thread = threading.current_thread()
+        time.sleep(0.3)
+        return {"Paris": [["CAPITAL_OF", "France"]]}
+
+
+def test_async_retrieval_reads_the_graph_off_the_event_loop():
+    graph_store = _SlowGraphStore()
+    retriever = GraphRAGRetriever(storage_context=StorageContext.from_defaults(graph_store=graph_store),
+                                  llm=MockLLM())
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        result = await retriever._aget_knowledge_sequence(["Paris"])
+        ticker.cancel()
+        return result, ticks
+
+    (sequence, rel_map), ticks = asyncio.run(run())
+    assert sequence == ["['CAPITAL_OF', 'France']"]
+    assert rel_map == {"Paris": [["CAPITAL_OF", "France"]]}
+    assert graph_store.thread is not threading.main_thread()
+    assert ticks > 5
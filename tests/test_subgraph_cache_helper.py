@@ -0,0 +1,68 @@
+from helper.util_cache_helper import DiskCache
+from helper.util_subgraph_cache_helper import CachedGraphStore
+
+
+class _FuzzyGraphStore:
+    """Matches keywords like the full-text lookup: 'vsphere' finds the subject 'vSphere 7'."""
+
+    graph = {
+        "vSphere 7": [["RUNS_ON", "ESXi"]],
+        "ESXi": [["PART_OF", "vSphere 7"]],
+    }
+
+    def __init__(self):
+        self.calls = []
+
+    def get_rel_map(self, subjs=None, depth=2, limit=30):
+        self.calls.append(list(subjs))
+        return {
+            subj: paths for subj, paths in self.graph.items()
+            if any(s.lower() in subj.lower() for s in subjs)
+        }
+
+
+def test_fuzzy_matched_subjects_come_back_from_the_cache():
+    backend = _FuzzyGraphStore()
+    store = CachedGraphStore(backend, graph_version=lambda: 1)
+
+    first = store.get_rel_map(["vsphere"])
+    assert first == {"vSphere 7": [["RUNS_ON", "ESXi"]]}
+    assert store.get_rel_map(["VSphere"]) == first
+    assert backend.calls == [["vsphere"]]
+
+
+def test_each_new_keyword_keeps_its_own_matches(tmp_path):
+    backend = _FuzzyGraphStore()
+    store = CachedGraphStore(backend, graph_version=lambda: 1, disk_cache=DiskCache(tmp_path / "subgraphs.sqlite"))
+
+    assert store.get_rel_map(["esxi", "unknown"]) == {
+        "ESXi": [["PART_OF", "vSphere 7"]],
+    }
+    # A restarted process reads the same answers from disk, the keyword without matches included
+    restarted = CachedGraphStore(backend, graph_version=lambda: 1, disk_cache=DiskCache(tmp_path / "subgraphs.sqlite"))
+    assert restarted.get_rel_map(["vsphere", "esxi", "unknown"]) == {
+        "vSphere 7": [["RUNS_ON", "ESXi"]],
+        "ESXi": [["PART_OF", "vSphere 7"]],
+    }
+    assert backend.calls == [["esxi"], ["unknown"], ["vsphere"]]
+
+
+def test_new_graph_version_drops_cached_subgraphs():
+    backend = _FuzzyGraphStore()
+    version = [1]
+    store = CachedGraphStore(backend, graph_version=lambda: version[0], version_refresh=0)
+
+    store.get_rel_map(["vsphere"])
+    version[0] = 2
+    store.get_rel_map(["vsphere"])
+    assert backend.calls == [["vsphere"], ["vsphere"]]
+
+
+def test_limit_caps_paths_over_all_keywords():
+    backend = _FuzzyGraphStore()
+    backend.graph = {**backend.graph, "ESXi": [["PART_OF", "vSphere 7"], ["PART_OF", "vSphere 8"]]}
+    store = CachedGraphStore(backend, graph_version=lambda: 1)
+    assert store.get_rel_map(["esxi", "vsphere"], limit=1) == {"ESXi": [["PART_OF", "vSphere 7"]]}
+    assert store.get_rel_map(["esxi", "vsphere"], limit=3) == {
+        "ESXi": [["PART_OF", "vSphere 7"], ["PART_OF", "vSphere 8"]], "vSphere 7": [["RUNS_ON", "ESXi"]],
+    }
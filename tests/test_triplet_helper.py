@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+
+from helper.util_triplet_helper import TripletExtractor
+
+
+class _LLM:
+    """Answers with one triplet per text; texts containing a word in `failing` raise that many times."""
+
+    model = "fake"
+
+    def __init__(self, failing):
+        self.failing = dict(failing)
+        self.calls = 0
+
+    def chat(self, messages):
+        self.calls += 1
+        text = messages[-1].content
+        for word, left in self.failing.items():
+            if word in text and left:
+                self.failing[word] = left - 1
+                raise ConnectionError("model unavailable")
+        subject = "Beta" if "beta" in text else "Alpha"
+        return SimpleNamespace(message=SimpleNamespace(content=f"({subject}, is, first)"), raw={})
+
+
+def _extractor(llm):
+    return TripletExtractor(llm=llm, concurrency=2, node_parser=SentenceSplitter(), max_retries=2, retry_backoff=0)
+
+
+def test_failed_requests_are_retried():
+    llm = _LLM({"alpha": 2})
+    units = dict(_extractor(llm).extract_units([("a", Document(text="alpha text"))]))
+    assert units == {"a": [("Alpha", "Is", "First")]}
+    assert llm.calls == 3
+
+
+def test_unit_is_yielded_without_triplets_after_the_last_retry():
+    llm = _LLM({"alpha": 10})
+    extractor = _extractor(llm)
+    units = dict(extractor.extract_units([("a", Document(text="alpha text")), ("b", Document(text="beta text"))]))
+    assert units == {"a": None, "b": [("Beta", "Is", "First")]}
+    assert extractor.stats["failed"] == 1
+    assert "1 failed" in extractor.report()